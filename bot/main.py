@@ -1,21 +1,35 @@
+import time
+PROCESS_STARTED = time.monotonic()  # отсчёт холодного старта — до тяжёлых импортов
 import os
 import sys
 import asyncio
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 
 import pytz
-from pyrogram import Client, filters
+from pyrogram import filters
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from sqlalchemy import text as sql
 
-from common.db import run_migrations, session_scope
-from common.models import (
-    upsert_user, get_user_by_tg, set_user_hours,
-    subscribe_user_to_channel, list_user_channels, remove_user_channel,
-    due_users, get_user_window_messages, save_digest, get_system_stats
+from common.db import run_migrations, async_session_scope
+from common.tgclient import create_client
+from common.models_async import (
+    set_user_hours, subscribe_user_to_channels, remove_user_channels,
+    claim_due_users, complete_digest, save_digest, get_system_stats
 )
-from common.summarize import build_digest
+from common.models import CLAIM_BATCH
+from common.summarize import build_digest, digest_items
+from common.send_queue import SendQueue
+from common.window_cache import ChannelWindowCache
+from common.retention import run_retention
+from common.ranking import rank_users
+from common.metrics import (
+    BUILD_DIGEST_SECONDS, DIGESTS_TOTAL, DISPATCH_LAG_SECONDS, SCHEDULER_DUE_USERS, SCHEDULER_TICK_SECONDS,
+    StartupTimer, monitor_event_loop, start_metrics_server,
+)
+from common.stats import describe
+from common.handles import MAX_HANDLES, MAX_IMPORT_BYTES, parse_handles, parse_import
+from common.user_cache import UserCache
 
 # ---------- LOGGING ----------
 logging.basicConfig(
@@ -44,21 +58,33 @@ SESSION_NAME = os.getenv("TELEGRAM_SESSION_NAME", "bot")
 os.makedirs(SESSION_DIR, exist_ok=True)
 SESSION_PATH = os.path.join(SESSION_DIR, SESSION_NAME)
 
-bot = Client(
+bot = create_client(
     SESSION_PATH,
     api_id=API_ID,
     api_hash=API_HASH,
     bot_token=BOT_TOKEN,
 )
 
+startup = StartupTimer("bot", PROCESS_STARTED)
+startup.mark("imports")
+
 scheduler = AsyncIOScheduler(timezone=str(TZ))
+send_queue = SendQueue(bot)
+background_tasks = set()
+user_cache = UserCache()
+
+DIGEST_WORKERS = int(os.getenv("DIGEST_WORKERS", "16"))  # дайджестов, собираемых одновременно
+RETENTION_HOUR = int(os.getenv("RETENTION_HOUR", "4"))  # час ежедневной архивации старых секций
+METRICS_DEFAULT_PORT = 9102
+REPLY_HANDLES_SHOWN = 20  # имён каналов в ответе на /add, /remove, /import
 
 HELP = (
     "Команды:\n"
     "/start — начать\n"
-    "/add @канал — добавить источник\n"
+    "/add @канал [@канал …] — добавить источники\n"
+    "/import — импорт списка каналов (OPML/CSV файлом или текстом)\n"
     "/list — список источников\n"
-    "/remove @канал — удалить источник\n"
+    "/remove @канал [@канал …] — удалить источники\n"
     "/when HH:MM HH:MM — время дайджестов\n"
     "/digest_now — прислать дайджест за последнее окно\n"
     "/plan — тарифы\n"
@@ -91,7 +117,7 @@ def pick(obj, key, default=None):
 async def send_text_in_chunks(chat_id: int, text: str):
     MAX = 4096
     if len(text) <= MAX:
-        await bot.send_message(chat_id=chat_id, text=text, disable_web_page_preview=True)
+        await send_queue.send(chat_id, text, disable_web_page_preview=True)
         return
     parts, buf = [], ""
     for para in text.split("\n\n"):
@@ -106,7 +132,37 @@ async def send_text_in_chunks(chat_id: int, text: str):
             buf = cand
     if buf: parts.append(buf)
     for p in parts:
-        await bot.send_message(chat_id=chat_id, text=p, disable_web_page_preview=True)
+        await send_queue.send(chat_id, p, disable_web_page_preview=True)
+
+def command_args(message) -> str:
+    """Всё после команды, включая следующие строки"""
+    parts = (message.text or message.caption or "").split(maxsplit=1)
+    return parts[1] if len(parts) > 1 else ""
+
+def format_handles(title: str, handles) -> str:
+    shown = ", ".join("@" + h for h in handles[:REPLY_HANDLES_SHOWN])
+    more = f" и ещё {len(handles) - REPLY_HANDLES_SHOWN}" if len(handles) > REPLY_HANDLES_SHOWN else ""
+    return f"{title} ({len(handles)}): {shown}{more}"
+
+async def reply_subscribed(message, handles, invalid=()):
+    if len(handles) > MAX_HANDLES:
+        return await message.reply_text(f"Слишком много каналов за раз: {len(handles)}, максимум {MAX_HANDLES}.")
+    res = await subscribe_user_to_channels(message.from_user.id, handles)
+    user_cache.invalidate(message.from_user.id)
+    lines = []
+    if res['added']:
+        lines.append(format_handles("Добавил", res['added']))
+    if res['existing']:
+        lines.append(format_handles("Уже были", res['existing']))
+    if invalid:
+        lines.append(format_handles("Не распознал", [t.lstrip('@') for t in invalid]))
+    await message.reply_text("\n".join(lines) or "Нечего добавлять.")
+
+def user_timezone(user):
+    try:
+        return pytz.timezone(pick(user, "tz") or str(TZ))
+    except pytz.UnknownTimeZoneError:
+        return TZ
 
 def window_for_now(now: datetime):
     h = now.hour
@@ -122,7 +178,7 @@ def window_for_now(now: datetime):
 @bot.on_message(filters.command("start") & filters.private)
 async def on_start(client, message):
     try:
-        upsert_user(message.from_user.id)
+        await user_cache.ensure_user(message.from_user.id)
         await message.reply_text("👋 Привет! Я собираю новости из ваших каналов и присылаю дайджест 2 раза в день.\n\n" + HELP)
     except Exception:
         logger.exception("Error in /start")
@@ -131,20 +187,46 @@ async def on_start(client, message):
 @bot.on_message(filters.command("add") & filters.private)
 async def on_add(client, message):
     try:
-        parts = message.text.split()
-        if len(parts) < 2:
-            return await message.reply_text("Укажи @канал. Пример: /add @neuralnews")
-        handle = parts[1]
-        subscribe_user_to_channel(message.from_user.id, handle)
-        await message.reply_text(f"Добавил {handle}.")
+        handles, invalid = parse_handles(command_args(message))
+        if not handles:
+            return await message.reply_text("Укажи @канал. Пример: /add @neuralnews @techcrunch")
+        await reply_subscribed(message, handles, invalid)
     except Exception:
         logger.exception("Error in /add")
         await message.reply_text("Не удалось добавить канал.")
 
+@bot.on_message(filters.command("import") & filters.private)
+async def on_import(client, message):
+    """Файл OPML/CSV с подписью /import, ответ /import на такой файл или список текстом"""
+    try:
+        doc_msg = message if message.document else message.reply_to_message
+        if doc_msg is not None and doc_msg.document:
+            if (doc_msg.document.file_size or 0) > MAX_IMPORT_BYTES:
+                return await message.reply_text(f"Файл больше {MAX_IMPORT_BYTES // 1024} КБ.")
+            data = await client.download_media(doc_msg, in_memory=True)
+            content = bytes(data.getbuffer()).decode("utf-8", errors="replace")
+        else:
+            content = command_args(message)
+        if not content.strip():
+            return await message.reply_text(
+                "Пришли файл OPML или CSV с подписью /import или ответь /import на такой файл. "
+                "Можно и текстом: /import, дальше по каналу на строку."
+            )
+        try:
+            handles = parse_import(content)
+        except ValueError:
+            return await message.reply_text("Не удалось разобрать OPML.")
+        if not handles:
+            return await message.reply_text("Не нашёл в файле ни одного Telegram-канала.")
+        await reply_subscribed(message, handles)
+    except Exception:
+        logger.exception("Error in /import")
+        await message.reply_text("Не удалось импортировать каналы.")
+
 @bot.on_message(filters.command("list") & filters.private)
 async def on_list(client, message):
     try:
-        lst = list_user_channels(message.from_user.id)
+        lst = await user_cache.list_channels(message.from_user.id)
         if not lst:
             return await message.reply_text("Пусто. Добавь командой /add @канал")
         await message.reply_text("Твои источники:\n" + "\n".join(lst))
@@ -155,11 +237,12 @@ async def on_list(client, message):
 @bot.on_message(filters.command("remove") & filters.private)
 async def on_remove(client, message):
     try:
-        parts = message.text.split()
-        if len(parts) < 2:
-            return await message.reply_text("Укажи @канал. Пример: /remove @neuralnews")
-        remove_user_channel(message.from_user.id, parts[1])
-        await message.reply_text("Готово.")
+        handles, _ = parse_handles(command_args(message))
+        if not handles:
+            return await message.reply_text("Укажи @канал. Пример: /remove @neuralnews @techcrunch")
+        removed = await remove_user_channels(message.from_user.id, handles[:MAX_HANDLES])
+        user_cache.invalidate(message.from_user.id, user=False)
+        await message.reply_text(format_handles("Удалил", removed) if removed else "Таких каналов в подписках нет.")
     except Exception:
         logger.exception("Error in /remove")
         await message.reply_text("Не удалось удалить канал.")
@@ -173,7 +256,8 @@ async def on_when(client, message):
         hours = parse_hours(parts)
         if not hours:
             return await message.reply_text("Не удалось распознать время. Пример: /when 09:00 19:30")
-        set_user_hours(message.from_user.id, hours)
+        await set_user_hours(message.from_user.id, hours)
+        user_cache.invalidate(message.from_user.id, channels=False)
         await message.reply_text(f"Ок! Часы дайджеста: {', '.join(map(str, hours))}")
     except Exception:
         logger.exception("Error in /when")
@@ -182,10 +266,7 @@ async def on_when(client, message):
 @bot.on_message(filters.command("digest_now") & filters.private)
 async def on_digest_now(client, message):
     try:
-        u = get_user_by_tg(message.from_user.id)
-        if not u:
-            upsert_user(message.from_user.id)
-            u = get_user_by_tg(message.from_user.id)
+        u = await user_cache.ensure_user(message.from_user.id)
         await message.reply_text("Собираю дайджест за последнее окно...")
         await send_digest_to_user(u)
     except Exception:
@@ -199,11 +280,12 @@ async def on_plan(client, message):
 @bot.on_message(filters.command("buy") & filters.private)
 async def on_buy(client, message):
     try:
-        with session_scope() as s:
-            s.execute(
+        async with async_session_scope() as s:
+            await s.execute(
                 sql("UPDATE users SET plan='pro', valid_until=NOW() + INTERVAL '30 days' WHERE tg_id=:tg"),
                 {"tg": message.from_user.id},
             )
+        user_cache.invalidate(message.from_user.id, channels=False)
         await message.reply_text("Готово! Включил Pro на 30 дней (заглушка).")
     except Exception:
         logger.exception("Error in /buy")
@@ -212,7 +294,7 @@ async def on_buy(client, message):
 @bot.on_message(filters.command("debug") & filters.private)
 async def on_debug(client, message):
     try:
-        stats = get_system_stats()
+        stats = await get_system_stats()
         debug_text = (
             f"📊 Статистика системы:\n\n"
             f"👥 Пользователей: {stats['users_count']}\n"
@@ -233,60 +315,135 @@ async def on_private_message(client, message):
     await message.reply_text("Неизвестная команда. Используйте /start для получения списка команд.")
 
 # ---------- DIGEST & SCHEDULER ----------
-async def send_digest_to_user(user):
+def user_window(user):
+    return window_for_now(datetime.now(user_timezone(user)))
+
+async def rank_digest_items(users, window_cache: ChannelWindowCache):
+    """Лучшие пункты дайджеста для пачки пользователей: один проход ранжирования на всех"""
+    candidates = {}
+    for u in users:
+        start, end = user_window(u)
+        candidates[pick(u, "id")] = await window_cache.user_items(pick(u, "id"), start, end)
+    return rank_users(candidates, datetime.now(timezone.utc))
+
+async def send_digest_to_user(user, items=None) -> bool:
+    """True — дайджест доставлен или отправлять нечего; False — ошибка, слот стоит повторить"""
     user_id = pick(user, "id")
     tg_id = pick(user, "tg_id")
     if not user_id or not tg_id:
         logger.error(f"Invalid user object for digest: {user}")
-        return
+        return True
 
-    now = datetime.now(TZ)
-    start, end = window_for_now(now)
+    start, end = user_window(user)
     try:
-        items = get_user_window_messages(user_id, start, end) or []
-        uniq = {}
-        for it in items:
-            key = it.get("text_hash")
-            if key and key not in uniq:
-                uniq[key] = {"text": it.get("text"), "link": it.get("link")}
-        items_list = list(uniq.values())
+        if items is None:
+            items = (await rank_digest_items([user], ChannelWindowCache()))[user_id]
+        # Репосты уже склеены ранжированием: один пункт на новость, лучшие первыми
+        items_list = digest_items([
+            {"text": it.text, "link": it.link, "text_hash": it.text_hash, "summary": it.summary}
+            for it in items
+        ])
 
         if not items_list:
             logger.info(f"No new messages for user {user_id} in window {start} - {end}, notifying user.")
-            await bot.send_message(tg_id, "За последнее окно не нашлось новых новостей.")
-            return
+            await send_queue.send(tg_id, "За последнее окно не нашлось новых новостей.")
+            return True
 
-        digest, digest_source = build_digest(items_list)
+        build_started = time.monotonic()
+        digest, digest_source = await build_digest(items_list)
+        BUILD_DIGEST_SECONDS.labels(digest_source).observe(time.monotonic() - build_started)
+        DIGESTS_TOTAL.labels(digest_source).inc()
         if not digest:
             logger.info(f"Digest builder returned empty result for user {user_id}.")
-            await bot.send_message(tg_id, "За последнее окно не нашлось новых новостей.")
-            return
+            await send_queue.send(tg_id, "За последнее окно не нашлось новых новостей.")
+            return True
 
         if digest_source != "llm":
             logger.info(f"Delivering digest to user {user_id} using {digest_source} content.")
 
-        save_digest(user_id, start, end, len(items_list), digest, sent_to="user")
+        await save_digest(user_id, start, end, len(items_list), digest, sent_to="user")
         await send_text_in_chunks(chat_id=tg_id, text=digest)
+        return True
     except Exception:
         logger.exception(f"Error sending digest to user {user_id}")
+        return False
 
 async def scheduler_tick():
-    now = datetime.now(TZ)
+    started = time.monotonic()
+    semaphore = asyncio.Semaphore(DIGEST_WORKERS)
+    lags = []
+
+    # Один кэш на тик: окно канала читается из БД один раз на всех подписчиков
+    window_cache = ChannelWindowCache()
+
+    async def dispatch(u, items):
+        async with semaphore:
+            # Без доставки слот не сдвигается: пользователя заберут снова по истечении аренды
+            if await send_digest_to_user(u, items):
+                await complete_digest(u["id"], u["scheduled_at"])
+            # Задержка доставки относительно запланированного next_digest_at
+            lag = (datetime.now(timezone.utc) - u["scheduled_at"]).total_seconds()
+            DISPATCH_LAG_SECONDS.observe(lag)
+            lags.append(lag)
+
     try:
-        users = due_users(now.hour, now.minute) or []
-        logger.info(f"Scheduler tick: found {len(users)} users due for a digest.")
-        for u in users:
-            await send_digest_to_user(u)
+        # Пачками, пока есть просроченные: SKIP LOCKED делит пользователей между процессами бота
+        while True:
+            users = await claim_due_users(datetime.now(timezone.utc))
+            if not users:
+                break
+            claimed = len(users)
+            expired = [u["id"] for u in users if u["expired"]]
+            if expired:
+                logger.warning(f"Scheduler tick: giving up on {len(expired)} undelivered digests: {expired[:20]}")
+            users = [u for u in users if not u["expired"]]
+            logger.info(f"Scheduler tick: claimed {len(users)} users due for a digest.")
+            SCHEDULER_DUE_USERS.inc(len(users))
+            await window_cache.prefetch({u["id"]: user_window(u) for u in users})
+            ranked = await rank_digest_items(users, window_cache)
+            await asyncio.gather(*(dispatch(u, ranked[u["id"]]) for u in users))
+            if claimed < CLAIM_BATCH:
+                break
     except Exception:
         logger.exception("Scheduler tick failed")
+    SCHEDULER_TICK_SECONDS.observe(time.monotonic() - started)
+    if lags:
+        stats = describe(lags)
+        logger.info(
+            f"Scheduler tick: dispatched {stats['count']} digests in {time.monotonic() - started:.1f}s, "
+            f"lag p50={stats['p50']:.1f}s p90={stats['p90']:.1f}s p99={stats['p99']:.1f}s max={stats['max']:.1f}s, "
+            f"{window_cache.channel_loads} channel windows loaded, flood wait so far {send_queue.flood_wait_total:.0f}s"
+        )
+
+async def retention_job():
+    # COPY в архив и DETACH синхронные и долгие — в отдельном потоке, чтобы не стоял event loop
+    try:
+        result = await asyncio.to_thread(run_retention)
+        logger.info(f"Retention: created {result['created']} partitions, archived {len(result['archived'])}")
+    except Exception:
+        logger.exception("Retention job failed")
 
 # ---------- MAIN LOGIC ----------
+async def report_cold_start():
+    while not bot.is_connected:
+        await asyncio.sleep(0.05)
+    startup.mark("connect")
+    startup.report()
+
 def startup_tasks():
     logger.info("Running startup tasks...")
     try:
         run_migrations()
-        scheduler.add_job(scheduler_tick, "cron", minute="0,30", id="digest_scheduler")
+        startup.mark("migrations")
+        scheduler.add_job(scheduler_tick, "cron", minute="*", id="digest_scheduler")
+        scheduler.add_job(retention_job, "cron", hour=RETENTION_HOUR, minute=15, id="retention")
         scheduler.start()
+        start_metrics_server(METRICS_DEFAULT_PORT)
+        # Задача на loop клиента: стартует вместе с bot.run()
+        background_tasks.add(bot.loop.create_task(monitor_event_loop()))
+        background_tasks.add(bot.loop.create_task(user_cache.listen()))
+        background_tasks.add(bot.loop.create_task(report_cold_start()))
+        startup.mark("setup")
         logger.info("Migrations and scheduler setup complete.")
     except Exception:
         logger.exception("Startup tasks failed!")
@@ -0,0 +1,67 @@
+import os
+import time
+import logging
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+try:
+    from redis import asyncio as aioredis
+except ImportError:  # pragma: no cover
+    aioredis = None  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL") or (
+    f"redis://{os.getenv('REDIS_HOST')}:{os.getenv('REDIS_PORT', '6379')}/0" if os.getenv("REDIS_HOST") else None
+)
+REDIS_TIMEOUT = float(os.getenv("REDIS_TIMEOUT", "0.5"))  # сек; Redis — ускоритель, не должен тормозить
+
+
+class TTLCache:
+    """Ограниченный LRU-кэш в памяти процесса с временем жизни записей"""
+
+    _MISSING = object()
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key, self._MISSING)
+        if entry is self._MISSING:
+            return default
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.pop(key, None)
+        return entry[1] if entry else default
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+_redis_client = None
+
+def get_redis():
+    """Асинхронный клиент Redis из REDIS_URL/REDIS_HOST или None, если Redis не настроен"""
+    global _redis_client
+    if _redis_client is None and REDIS_URL and aioredis:
+        _redis_client = aioredis.Redis.from_url(
+            REDIS_URL, socket_timeout=REDIS_TIMEOUT, socket_connect_timeout=REDIS_TIMEOUT,
+        )
+    return _redis_client
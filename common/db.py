@@ -1,114 +1,127 @@
 import os
-from contextlib import contextmanager
+import re
+import time
+import logging
+from contextlib import asynccontextmanager, contextmanager
+from hashlib import sha256
+from typing import List, NamedTuple
 from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
 DB_URL = f"postgresql+psycopg2://{os.getenv('POSTGRES_USER')}:{os.getenv('POSTGRES_PASSWORD')}@{os.getenv('POSTGRES_HOST')}:{os.getenv('POSTGRES_PORT')}/{os.getenv('POSTGRES_DB')}"
+ASYNC_DB_URL = DB_URL.replace("postgresql+psycopg2://", "postgresql+asyncpg://", 1)
 
 engine = create_engine(DB_URL, pool_pre_ping=True, future=True)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
 
-def run_migrations():
+# Асинхронный движок для кода внутри event loop (хэндлеры бота, ридер)
+async_engine = create_async_engine(
+    ASYNC_DB_URL,
+    pool_pre_ping=True,
+    pool_size=int(os.getenv("DB_POOL_SIZE", "10")),
+    max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+MIGRATIONS_LOCK_ID = 7_301_022  # pg_advisory_lock: миграции применяет один процесс, остальные ждут
+MIGRATION_FILE_RE = re.compile(r"^(\d{4})_\w+\.sql$")
+
+LEDGER_DDL = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    checksum TEXT NOT NULL,
+    applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+)
+"""
+LEDGER_EXISTS_SQL = text("SELECT to_regclass('schema_migrations') IS NOT NULL")
+LEDGER_CHECKSUM_SQL = text("SELECT checksum FROM schema_migrations WHERE version = :v")
+LEDGER_ALL_SQL = text("SELECT version, checksum FROM schema_migrations")
+LEDGER_INSERT_SQL = text("INSERT INTO schema_migrations (version, name, checksum) VALUES (:v, :name, :checksum)")
+
+logger = logging.getLogger(__name__)
+
+
+class MigrationError(Exception):
+    pass
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    sql: str
+    checksum: str  # sha256 цепочкой: покрывает этот файл и все предыдущие
+
+
+def load_migrations(path: str = MIGRATIONS_DIR) -> List[Migration]:
+    """NNNN_name.sql по порядку номеров; номера идут подряд с 1"""
+    migrations = []
+    chain = ""
+    for fname in sorted(os.listdir(path)):
+        m = MIGRATION_FILE_RE.match(fname)
+        if not m:
+            continue
+        with open(os.path.join(path, fname), encoding="utf-8") as f:
+            sql = f.read()
+        chain = sha256((chain + sha256(sql.encode("utf-8")).hexdigest()).encode("ascii")).hexdigest()
+        migrations.append(Migration(int(m.group(1)), fname, sql, chain))
+    versions = [m.version for m in migrations]
+    if versions != list(range(1, len(versions) + 1)):
+        raise MigrationError(f"Migration numbers must be consecutive from 1, got {versions}")
+    return migrations
+
+
+def _up_to_date(conn, head: Migration) -> bool:
+    # Цепочка контрольных сумм: совпала последняя версия — совпали и все предыдущие
+    if not conn.execute(LEDGER_EXISTS_SQL).scalar():
+        return False
+    return conn.execute(LEDGER_CHECKSUM_SQL, {'v': head.version}).scalar() == head.checksum
+
+
+def run_migrations() -> int:
+    """Применить новые миграции из MIGRATIONS_DIR; возвращает число применённых.
+
+    Когда схема актуальна — два индексных запроса без блокировок и DDL.
+    Иначе под advisory-локом каждая миграция выполняется в своей транзакции
+    вместе с записью в schema_migrations. Изменённый после применения файл —
+    MigrationError: правки схемы идут только новыми файлами.
+    """
+    migrations = load_migrations()
+    if not migrations:
+        return 0
     with engine.connect() as conn:
-        # Проверка существующих таблиц
-        tables = conn.execute(text("SELECT table_name FROM information_schema.tables WHERE table_schema = 'public'")).fetchall()
-        existing_tables = {row[0] for row in tables}
-
-        # Определение необходимых таблиц
-        required_tables = {'users', 'channels', 'subscriptions', 'messages', 'digests'}
-        missing_tables = required_tables - existing_tables
-
-        if missing_tables:
-            # SQL для создания отсутствующих таблиц (без \c и дублирования ролей/базы)
-            ddl = """
-            DO $$ BEGIN
-                IF NOT EXISTS (SELECT FROM pg_tables WHERE schemaname = 'public' AND tablename = 'users') THEN
-                    CREATE TABLE users (
-                        id SERIAL PRIMARY KEY,
-                        tg_id BIGINT UNIQUE NOT NULL,
-                        plan TEXT NOT NULL DEFAULT 'free',
-                        valid_until TIMESTAMPTZ,
-                        tz TEXT DEFAULT 'Europe/Amsterdam',
-                        digest_hours INTEGER[] DEFAULT ARRAY[9,19],
-                        created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-                    );
-                END IF;
-            END $$;
-
-            DO $$ BEGIN
-                IF NOT EXISTS (SELECT FROM pg_tables WHERE schemaname = 'public' AND tablename = 'channels') THEN
-                    CREATE TABLE channels (
-                        id SERIAL PRIMARY KEY,
-                        handle TEXT UNIQUE NOT NULL,
-                        visibility TEXT NOT NULL DEFAULT 'public',
-                        status TEXT NOT NULL DEFAULT 'active',
-                        last_msg_id BIGINT DEFAULT 0,
-                        last_checked_at TIMESTAMPTZ,
-                        shard INTEGER DEFAULT 0,
-                        created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-                    );
-                END IF;
-            END $$;
-
-            DO $$ BEGIN
-                IF NOT EXISTS (SELECT FROM pg_tables WHERE schemaname = 'public' AND tablename = 'subscriptions') THEN
-                    CREATE TABLE subscriptions (
-                        id SERIAL PRIMARY KEY,
-                        user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-                        channel_id INTEGER NOT NULL REFERENCES channels(id) ON DELETE CASCADE,
-                        UNIQUE(user_id, channel_id)
-                    );
-                END IF;
-            END $$;
-
-            DO $$ BEGIN
-                IF NOT EXISTS (SELECT FROM pg_tables WHERE schemaname = 'public' AND tablename = 'messages') THEN
-                    CREATE TABLE messages (
-                        id BIGSERIAL PRIMARY KEY,
-                        channel_id INTEGER NOT NULL REFERENCES channels(id) ON DELETE CASCADE,
-                        tg_message_id BIGINT NOT NULL,
-                        msg_date TIMESTAMPTZ NOT NULL,
-                        link TEXT,
-                        text TEXT,
-                        text_hash CHAR(64),
-                        created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
-                        UNIQUE(channel_id, tg_message_id)
-                    );
-                END IF;
-            END $$;
-
-            DO $$ BEGIN
-                IF NOT EXISTS (SELECT FROM pg_tables WHERE schemaname = 'public' AND tablename = 'digests') THEN
-                    CREATE TABLE digests (
-                        id BIGSERIAL PRIMARY KEY,
-                        user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-                        window_start TIMESTAMPTZ NOT NULL,
-                        window_end TIMESTAMPTZ NOT NULL,
-                        item_count INTEGER NOT NULL,
-                        content_md TEXT NOT NULL,
-                        sent_to TEXT NOT NULL DEFAULT 'user',
-                        created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-                    );
-                END IF;
-            END $$;
-
-            -- Создание индексов, если таблица существует
-            DO $$ BEGIN
-                IF EXISTS (SELECT FROM pg_tables WHERE schemaname = 'public' AND tablename = 'subscriptions') THEN
-                    CREATE INDEX IF NOT EXISTS idx_subscriptions_user ON subscriptions(user_id);
-                END IF;
-            END $$;
-
-            DO $$ BEGIN
-                IF EXISTS (SELECT FROM pg_tables WHERE schemaname = 'public' AND tablename = 'messages') THEN
-                    CREATE INDEX IF NOT EXISTS idx_messages_channel_date ON messages(channel_id, msg_date DESC);
-                END IF;
-            END $$;
-            """
-            conn.execute(text(ddl))
+        if _up_to_date(conn, migrations[-1]):
+            conn.rollback()
+            return 0
+        conn.rollback()
+        conn.execute(text("SELECT pg_advisory_lock(:k)"), {'k': MIGRATIONS_LOCK_ID})
+        conn.commit()
+        try:
+            conn.execute(text(LEDGER_DDL))
+            conn.commit()
+            applied = dict(conn.execute(LEDGER_ALL_SQL).all())
+            count = 0
+            for m in migrations:
+                if m.version in applied:
+                    if applied[m.version] != m.checksum:
+                        raise MigrationError(f"{m.name} differs from the applied version {m.version}")
+                    continue
+                started = time.monotonic()
+                conn.execute(text(m.sql))
+                conn.execute(LEDGER_INSERT_SQL, {'v': m.version, 'name': m.name, 'checksum': m.checksum})
+                conn.commit()
+                count += 1
+                logger.info(f"Applied migration {m.name} in {time.monotonic() - started:.2f}s")
+            newer = sorted(set(applied) - {m.version for m in migrations})
+            if newer:
+                logger.warning(f"Database has migrations newer than this build: {newer}")
+            return count
+        finally:
+            conn.rollback()
+            conn.execute(text("SELECT pg_advisory_unlock(:k)"), {'k': MIGRATIONS_LOCK_ID})
             conn.commit()
-        else:
-            print("All required tables already exist, skipping migrations.")
 
 @contextmanager
 def session_scope():
@@ -121,3 +134,15 @@ def session_scope():
         raise
     finally:
         session.close()
+
+@asynccontextmanager
+async def async_session_scope():
+    session = AsyncSessionLocal()
+    try:
+        yield session
+        await session.commit()
+    except:
+        await session.rollback()
+        raise
+    finally:
+        await session.close()
@@ -0,0 +1,146 @@
+"""Поиск почти-дубликатов постов (репосты с другим эмодзи, ссылкой или подписью).
+
+Отпечаток — 64-битный SimHash по словам текста без ссылок, @упоминаний, эмодзи
+и хвостовой подписи канала («Подписывайтесь на @…», строка из одних ссылок):
+на коротком посте одна такая строка сдвигает отпечаток дальше MAX_DISTANCE.
+Вес слова растёт с его длиной (короткие служебные слова почти не влияют).
+Похожие тексты дают отпечатки с малым расстоянием Хэмминга: на постах-репостах
+с приписками это 0–8 бит, у разных новостей — 25+ бит. Индекс делит отпечаток
+на max_distance + 1 полос: по принципу Дирихле два отпечатка на расстоянии
+<= max_distance совпадают хотя бы в одной полосе, поэтому сравниваются только
+кандидаты из общих корзин, а не все пары.
+"""
+import re
+from collections import Counter, defaultdict
+from hashlib import blake2b
+from typing import Dict, Iterable, List, Optional
+
+FINGERPRINT_BITS = 64
+MAX_DISTANCE = 8  # бит различия, при которых посты считаются одной новостью
+MAX_TOKEN_WEIGHT = 10
+
+_MASK = (1 << FINGERPRINT_BITS) - 1
+_URL_RE = re.compile(r"(https?://\S+|t\.me/\S+|www\.\S+)", re.IGNORECASE)
+_MENTION_RE = re.compile(r"@\w+", re.UNICODE)
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+# Строки и предложения текста: подпись бывает и отдельной строкой, и последней фразой
+_SEGMENT_RE = re.compile(r"\n|(?<=[.!?…])\s+")
+# Призыв подписаться или перейти в канал в начале хвостовой фразы
+_CTA_RE = re.compile(
+    r"^\W*(подпис|подпиш|переход|читайте|наш канал|больше новостей|источник|subscribe|follow|join)",
+    re.IGNORECASE,
+)
+
+
+def _strip_signature(text_value: str) -> str:
+    """Текст без хвостовых строк-призывов и строк из одних ссылок и @упоминаний"""
+    segments = _SEGMENT_RE.split(text_value)
+    end = len(segments)
+    while end > 0:
+        seg = _MENTION_RE.sub(" ", _URL_RE.sub(" ", segments[end - 1]))
+        if _WORD_RE.search(seg) and not _CTA_RE.match(seg):
+            break
+        end -= 1
+    # Пост из одной подписи оставляем как есть, иначе у него не будет отпечатка
+    return " ".join(segments[:end]) if end else text_value
+
+
+def _tokens(text_value: str) -> List[str]:
+    text_value = _strip_signature((text_value or "").lower())
+    text_value = _MENTION_RE.sub(" ", _URL_RE.sub(" ", text_value))
+    return [w for w in _WORD_RE.findall(text_value) if len(w) > 1 and not w.isdigit()]
+
+
+def _feature_hash(token: str) -> int:
+    return int.from_bytes(blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def simhash(text_value: str) -> Optional[int]:
+    """SimHash текста как знаковое 64-битное число (влезает в BIGINT); None для пустого текста"""
+    weights = Counter()
+    for token in _tokens(text_value):
+        weights[token] += min(len(token), MAX_TOKEN_WEIGHT)
+    if not weights:
+        return None
+    acc = [0] * FINGERPRINT_BITS
+    for token, weight in weights.items():
+        h = _feature_hash(token)
+        for bit in range(FINGERPRINT_BITS):
+            acc[bit] += weight if h >> bit & 1 else -weight
+    fp = sum(1 << bit for bit, v in enumerate(acc) if v > 0)
+    return fp - (1 << FINGERPRINT_BITS) if fp >> (FINGERPRINT_BITS - 1) else fp
+
+
+def hamming(a: int, b: int) -> int:
+    return ((a ^ b) & _MASK).bit_count()
+
+
+class SimhashIndex:
+    """LSH-индекс отпечатков: полосы по FINGERPRINT_BITS / (max_distance + 1) бит"""
+
+    def __init__(self, max_distance: int = MAX_DISTANCE):
+        self.max_distance = max_distance
+        self.bands = max_distance + 1
+        self.band_bits = FINGERPRINT_BITS // self.bands
+        self.buckets: Dict[tuple, List[tuple]] = defaultdict(list)
+
+    def _band_keys(self, fp: int):
+        fp &= _MASK
+        band_mask = (1 << self.band_bits) - 1
+        for band in range(self.bands):
+            yield band, (fp >> (band * self.band_bits)) & band_mask
+
+    def add(self, key, fp: int):
+        for band_key in self._band_keys(fp):
+            self.buckets[band_key].append((key, fp))
+
+    def query(self, fp: int) -> List:
+        """Ключи уже добавленных отпечатков на расстоянии <= max_distance"""
+        seen, found = set(), []
+        for band_key in self._band_keys(fp):
+            for key, other in self.buckets.get(band_key, ()):
+                if key not in seen:
+                    seen.add(key)
+                    if hamming(fp, other) <= self.max_distance:
+                        found.append(key)
+        return found
+
+
+def _get(item, key):
+    return item.get(key) if hasattr(item, "get") else getattr(item, key, None)
+
+
+def group_near_duplicates(items: Iterable, max_distance: int = MAX_DISTANCE) -> List[List]:
+    """Сгруппировать посты-дубликаты; первый элемент группы — первый встреченный пост.
+
+    Сначала склеиваются точные совпадения text_hash, затем почти-дубликаты по
+    SimHash (колонка simhash, либо отпечаток считается из text).
+    """
+    groups: List[List] = []
+    by_hash: Dict[str, int] = {}
+    index = SimhashIndex(max_distance)
+    for item in items:
+        text_hash = _get(item, "text_hash")
+        if text_hash and text_hash in by_hash:
+            groups[by_hash[text_hash]].append(item)
+            continue
+        fp = _get(item, "simhash")
+        if fp is None:
+            fp = simhash(_get(item, "text") or "")
+        match = index.query(fp) if fp is not None else []
+        if match:
+            group_id = min(match)
+            groups[group_id].append(item)
+        else:
+            group_id = len(groups)
+            groups.append([item])
+            if fp is not None:
+                index.add(group_id, fp)
+        if text_hash:
+            by_hash[text_hash] = group_id
+    return groups
+
+
+def collapse_near_duplicates(items: Iterable, max_distance: int = MAX_DISTANCE) -> List:
+    """По одному посту на новость с сохранением исходного порядка"""
+    return [group[0] for group in group_near_duplicates(items, max_distance)]
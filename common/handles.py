@@ -0,0 +1,98 @@
+"""Разбор списков каналов для /add, /remove и /import.
+
+Принимаются @handle, голое имя, ссылки t.me/имя (в том числе t.me/s/имя и
+ссылки на пост) и RSS-мосты вида …/telegram/channel/имя. Файл импорта —
+OPML (атрибуты xmlUrl/htmlUrl/text/title у outline) или CSV/текст по строкам.
+"""
+import csv
+import io
+import re
+import xml.etree.ElementTree as ET
+from typing import Iterable, List, Optional, Tuple
+
+MAX_HANDLES = 500  # каналов за одну команду
+MAX_IMPORT_BYTES = 1024 * 1024
+
+# Имя канала в Telegram: 5–32 символа, латиница, цифры и _, начинается с буквы
+_HANDLE_RE = re.compile(r"^[A-Za-z][A-Za-z0-9_]{3,31}$")
+_TME_RE = re.compile(r"^(?:https?://)?(?:www\.)?(?:t|telegram)\.me/(?:s/)?([^/?#\s]+)", re.IGNORECASE)
+_RSS_BRIDGE_RE = re.compile(r"/telegram/channel/([^/?#\s]+)", re.IGNORECASE)
+_SPLIT_RE = re.compile(r"[\s,;]+")
+# Заголовки колонок CSV, которые не надо принимать за имя канала
+_HEADER_WORDS = {"channel", "channels", "handle", "username", "name", "title", "url", "link"}
+
+
+def normalize_handle(raw: str, strict: bool = False) -> Optional[str]:
+    """Имя канала без @ или None; strict — голое слово без @ и ссылки не принимается"""
+    raw = (raw or "").strip().strip("\"'<>")
+    m = _TME_RE.match(raw) or _RSS_BRIDGE_RE.search(raw)
+    if m:
+        candidate = m.group(1)
+    elif raw.startswith("@"):
+        candidate = raw[1:]
+    elif strict:
+        return None
+    else:
+        candidate = raw
+    return candidate if _HANDLE_RE.match(candidate) else None
+
+
+def _unique(handles: Iterable[str]) -> List[str]:
+    seen, out = set(), []
+    for h in handles:
+        if h.lower() not in seen:
+            seen.add(h.lower())
+            out.append(h)
+    return out
+
+
+def parse_handles(text_value: str) -> Tuple[List[str], List[str]]:
+    """Аргументы команды -> (имена каналов без повторов, нераспознанные токены)"""
+    handles, invalid = [], []
+    for token in _SPLIT_RE.split(text_value or ""):
+        if not token:
+            continue
+        handle = normalize_handle(token)
+        if handle:
+            handles.append(handle)
+        else:
+            invalid.append(token)
+    return _unique(handles), invalid
+
+
+def _parse_opml(content: str) -> List[str]:
+    root = ET.fromstring(content)
+    handles = []
+    for outline in root.iter("outline"):
+        for attr in ("xmlUrl", "htmlUrl", "url", "text", "title"):
+            handle = normalize_handle(outline.get(attr) or "", strict=attr not in ("text", "title"))
+            if handle:
+                handles.append(handle)
+                break
+    return handles
+
+
+def _parse_rows(content: str) -> List[str]:
+    """CSV или текст: в строке берётся первая ячейка-ссылка или @имя; голое слово — только если ячейка одна"""
+    handles = []
+    for row in csv.reader(io.StringIO(content)):
+        cells = [c.strip() for cell in row for c in _SPLIT_RE.split(cell) if c.strip()]
+        handle = next((h for h in (normalize_handle(c, strict=True) for c in cells) if h), None)
+        if handle is None and len(cells) == 1 and cells[0].lower() not in _HEADER_WORDS:
+            handle = normalize_handle(cells[0])
+        if handle:
+            handles.append(handle)
+    return handles
+
+
+def parse_import(content: str) -> List[str]:
+    """Имена каналов из OPML, CSV или списка строк; ValueError — битый OPML"""
+    content = (content or "").lstrip("﻿").strip()
+    if content.startswith("<"):
+        try:
+            handles = _parse_opml(content)
+        except ET.ParseError as exc:
+            raise ValueError(f"Invalid OPML: {exc}") from exc
+    else:
+        handles = _parse_rows(content)
+    return _unique(handles)
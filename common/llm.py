@@ -0,0 +1,149 @@
+"""Асинхронный клиент LLM для дайджестов и суммаризации.
+
+Каждый вызов ограничен дедлайном, общим token bucket по запросам в минуту и
+семафором одновременных запросов; сбои и таймауты повторяются с
+экспоненциальной паузой. LLM_MODE=mock включает детерминированный локальный
+бэкенд без сети — для тестов пропускной способности и задержек.
+"""
+import os
+import random
+import asyncio
+import logging
+import time
+from hashlib import sha256
+from typing import Optional
+
+from .metrics import LLM_CALL_SECONDS, LLM_TOKENS
+from .ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+LLM_MODE = os.getenv("LLM_MODE", "gemini")  # gemini | mock
+API_KEY = os.getenv("GEMINI_API_KEY")
+MODEL_NAME = os.getenv("LLM_MODEL", "gemini-1.5-flash")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))  # дедлайн одного вызова, сек
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "4"))
+LLM_RATE_PER_MIN = float(os.getenv("LLM_RATE_PER_MIN", "60"))
+LLM_BURST = float(os.getenv("LLM_BURST", "5"))
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "3"))  # повторов после первой попытки
+LLM_BACKOFF = float(os.getenv("LLM_BACKOFF", "1.0"))  # базовая пауза перед повтором, сек
+LLM_MOCK_LATENCY = float(os.getenv("LLM_MOCK_LATENCY", "0.2"))
+LLM_MOCK_FAIL_EVERY = int(os.getenv("LLM_MOCK_FAIL_EVERY", "0"))  # каждый N-й вызов мока падает; 0 — никогда
+
+
+class LLMError(Exception):
+    pass
+
+
+class GeminiBackend:
+    name = "gemini"
+
+    def __init__(self, api_key: str, model_name: str):
+        # Импорт SDK (grpc, protobuf) — секунды; делается при первом обращении к LLM, а не при старте
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self.model = genai.GenerativeModel(model_name)
+
+    async def generate(self, prompt: str, temperature: float) -> str:
+        resp = await self.model.generate_content_async(prompt, generation_config={"temperature": temperature})
+        usage = getattr(resp, "usage_metadata", None)
+        if usage is not None:
+            LLM_TOKENS.labels(self.name, "prompt").inc(getattr(usage, "prompt_token_count", 0) or 0)
+            LLM_TOKENS.labels(self.name, "completion").inc(getattr(usage, "candidates_token_count", 0) or 0)
+        return (getattr(resp, "text", None) or "").strip()
+
+
+class MockBackend:
+    """Детерминированный ответ из хвоста промпта с фиксированной задержкой"""
+
+    name = "mock"
+
+    def __init__(self, latency: float = LLM_MOCK_LATENCY, fail_every: int = LLM_MOCK_FAIL_EVERY):
+        self.latency = latency
+        self.fail_every = fail_every
+        self.calls = 0
+
+    async def generate(self, prompt: str, temperature: float) -> str:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if self.fail_every and self.calls % self.fail_every == 0:
+            raise LLMError("mock failure")
+        lines = [line.strip() for line in prompt.strip().splitlines() if line.strip()]
+        tail = " ".join(lines[-3:])[:300]
+        txt = f"{tail} [mock {sha256(prompt.encode('utf-8')).hexdigest()[:8]}]"
+        # Примерно 4 символа на токен — чтобы у мока были правдоподобные метрики
+        LLM_TOKENS.labels(self.name, "prompt").inc(len(prompt) // 4)
+        LLM_TOKENS.labels(self.name, "completion").inc(len(txt) // 4)
+        return txt
+
+
+class LLMClient:
+    def __init__(self, backend, timeout: float = LLM_TIMEOUT, concurrency: int = LLM_CONCURRENCY,
+                 rate_per_min: float = LLM_RATE_PER_MIN, burst: float = LLM_BURST,
+                 retries: int = LLM_RETRIES, backoff: float = LLM_BACKOFF):
+        self.backend = backend
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.bucket = TokenBucket(rate_per_min / 60, burst)
+
+    @property
+    def name(self) -> str:
+        return self.backend.name
+
+    async def generate(self, prompt: str, temperature: float = 0.25) -> str:
+        """Текст ответа (может быть пустым); LLMError, если все попытки исчерпаны"""
+        last_exc: Optional[BaseException] = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                delay = self.backoff * 2 ** (attempt - 1)
+                await asyncio.sleep(delay + random.uniform(0, delay / 2))
+            await self.bucket.acquire()
+            async with self.semaphore:
+                started = time.monotonic()
+                try:
+                    txt = await asyncio.wait_for(self.backend.generate(prompt, temperature), self.timeout)
+                except asyncio.TimeoutError as exc:
+                    last_exc = exc
+                    LLM_CALL_SECONDS.labels(self.name, "timeout").observe(time.monotonic() - started)
+                    logger.warning("LLM call timed out after %.1fs (attempt %d)", self.timeout, attempt + 1)
+                    continue
+                except Exception as exc:
+                    last_exc = exc
+                    LLM_CALL_SECONDS.labels(self.name, "error").observe(time.monotonic() - started)
+                    logger.warning("LLM call failed (attempt %d): %s", attempt + 1, exc)
+                    continue
+                LLM_CALL_SECONDS.labels(self.name, "ok").observe(time.monotonic() - started)
+                logger.debug("LLM call took %.2fs", time.monotonic() - started)
+                return txt
+        raise LLMError(f"LLM call failed after {self.retries + 1} attempts: {last_exc}")
+
+
+def _build_client() -> Optional[LLMClient]:
+    if LLM_MODE == "mock":
+        logger.info("LLM running in mock mode")
+        return LLMClient(MockBackend())
+    if not API_KEY:
+        logger.info("LLM disabled: GEMINI_API_KEY not set")
+        return None
+    try:
+        return LLMClient(GeminiBackend(API_KEY, MODEL_NAME))
+    except ImportError:
+        logger.info("LLM disabled: google-generativeai package missing")
+        return None
+    except Exception as exc:  # pragma: no cover
+        logger.warning("LLM disabled: failed to init Gemini client: %s", exc)
+        return None
+
+
+_client: Optional[LLMClient] = None
+_client_built = False
+
+def get_client() -> Optional[LLMClient]:
+    """Клиент создаётся при первом вызове; None — LLM выключен"""
+    global _client, _client_built
+    if not _client_built:
+        _client = _build_client()
+        _client_built = True
+    return _client
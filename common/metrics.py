@@ -0,0 +1,133 @@
+"""Метрики Prometheus для ридера и бота.
+
+Каждый процесс поднимает свой HTTP-эндпоинт (start_metrics_server, порт из
+METRICS_PORT; 0 — выключено). Без пакета prometheus-client метрики
+становятся пустышками: горячие пути инструментируются безусловно.
+"""
+import os
+import time
+import asyncio
+import logging
+
+try:
+    from prometheus_client import Counter, Gauge, Histogram, start_http_server
+except ImportError:  # pragma: no cover
+    Counter = Gauge = Histogram = start_http_server = None  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+LOOP_LAG_INTERVAL = 1.0  # секунд между замерами задержки event loop
+
+# Бакеты под наши масштабы: RPC и запросы в БД — от миллисекунд, LLM и доставка — до минут
+FAST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SLOW_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+class _NoopMetric:
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def dec(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+    def observe(self, value):
+        pass
+
+
+def _metric(kind, name, doc, labels=(), **kwargs):
+    if kind is None:
+        return _NoopMetric()
+    return kind(name, doc, labels, **kwargs)
+
+
+# ---------- Reader ----------
+READER_CYCLE_SECONDS = _metric(
+    Histogram, "reader_cycle_seconds", "Один проход планировщика опроса (без сна)", buckets=FAST_BUCKETS)
+READER_POLL_LAG_SECONDS = _metric(
+    Histogram, "reader_poll_lag_seconds", "Опоздание опроса канала относительно next_poll_at", buckets=SLOW_BUCKETS)
+READER_FETCH_SECONDS = _metric(
+    Histogram, "reader_fetch_seconds", "Догрузка новых сообщений одного канала", ["outcome"], buckets=SLOW_BUCKETS)
+READER_QUEUE_DEPTH = _metric(Gauge, "reader_ingest_queue_depth", "Результатов опроса в очереди на запись")
+TELEGRAM_RPC_TOTAL = _metric(Counter, "telegram_rpc_total", "Вызовы Telegram API", ["method", "outcome"])
+TELEGRAM_RPC_SECONDS = _metric(
+    Histogram, "telegram_rpc_seconds", "Длительность вызовов Telegram API", ["method"], buckets=FAST_BUCKETS)
+FLOOD_WAIT_SECONDS = _metric(Counter, "telegram_flood_wait_seconds_total", "Секунды FloodWait", ["method"])
+RATE_LIMIT_WAIT_SECONDS = _metric(
+    Counter, "telegram_rate_limit_wait_seconds_total", "Ожидание общего бюджета Telegram API", ["method_class"])
+
+# ---------- Database ----------
+ADD_MESSAGES_ROWS = _metric(Counter, "add_messages_rows_total", "Строки записи сообщений", ["result"])
+ADD_MESSAGES_SECONDS = _metric(
+    Histogram, "add_messages_seconds", "Запись пачки сообщений (с курсорами)", buckets=FAST_BUCKETS)
+
+# ---------- LLM ----------
+LLM_CALL_SECONDS = _metric(
+    Histogram, "llm_call_seconds", "Одна попытка вызова LLM", ["backend", "outcome"], buckets=SLOW_BUCKETS)
+LLM_TOKENS = _metric(Counter, "llm_tokens_total", "Токены LLM", ["backend", "kind"])
+BUILD_DIGEST_SECONDS = _metric(
+    Histogram, "build_digest_seconds", "Сборка дайджеста", ["digest_source"], buckets=SLOW_BUCKETS)
+DIGESTS_TOTAL = _metric(Counter, "digests_total", "Дайджесты по источнику текста", ["digest_source"])
+
+# ---------- Scheduler / dispatch ----------
+SCHEDULER_DUE_USERS = _metric(Counter, "scheduler_due_users_total", "Пользователи, забранные планировщиком")
+SCHEDULER_TICK_SECONDS = _metric(Histogram, "scheduler_tick_seconds", "Тик планировщика", buckets=SLOW_BUCKETS)
+DISPATCH_LAG_SECONDS = _metric(
+    Histogram, "dispatch_lag_seconds", "Доставка дайджеста относительно next_digest_at", buckets=SLOW_BUCKETS)
+SEND_QUEUE_DEPTH = _metric(Gauge, "send_queue_depth", "Сообщений в очереди отправки")
+USER_CACHE_REQUESTS = _metric(
+    Counter, "user_cache_requests_total", "Чтения кэша пользователей и подписок бота", ["cache", "result"])
+
+# ---------- Event loop / startup ----------
+EVENT_LOOP_LAG_SECONDS = _metric(
+    Histogram, "event_loop_lag_seconds", "Опоздание пробуждения event loop", buckets=FAST_BUCKETS)
+COLD_START_SECONDS = _metric(Gauge, "cold_start_seconds", "Фазы холодного старта процесса", ["phase"])
+
+
+class StartupTimer:
+    """Фазы холодного старта от первой строки main.py: одна строка в лог и cold_start_seconds{phase}"""
+
+    def __init__(self, service: str, started: float):
+        self.service = service
+        self.started = self.last = started
+        self.phases = {}
+
+    def mark(self, phase: str):
+        now = time.monotonic()
+        self.phases[phase] = now - self.last
+        self.last = now
+
+    def report(self):
+        total = self.last - self.started
+        for phase, seconds in self.phases.items():
+            COLD_START_SECONDS.labels(phase).set(seconds)
+        COLD_START_SECONDS.labels("total").set(total)
+        logger.info(
+            f"{self.service} cold start {total:.2f}s: "
+            + ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in self.phases.items())
+        )
+
+
+def start_metrics_server(default_port: int) -> bool:
+    port = int(os.getenv("METRICS_PORT", str(default_port)))
+    if not port:
+        return False
+    if start_http_server is None:
+        logger.info("Metrics disabled: prometheus-client package missing")
+        return False
+    start_http_server(port)
+    logger.info(f"Metrics endpoint on :{port}/metrics")
+    return True
+
+
+async def monitor_event_loop(interval: float = LOOP_LAG_INTERVAL):
+    """Насколько позже обещанного просыпается sleep — блокировки loop видны сразу"""
+    while True:
+        started = time.monotonic()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG_SECONDS.observe(max(0.0, time.monotonic() - started - interval))
@@ -0,0 +1,84 @@
+-- Базовые таблицы; messages и digests в 0004 становятся секционированными
+DO $$ BEGIN
+    IF NOT EXISTS (SELECT FROM pg_tables WHERE schemaname = 'public' AND tablename = 'users') THEN
+        CREATE TABLE users (
+            id SERIAL PRIMARY KEY,
+            tg_id BIGINT UNIQUE NOT NULL,
+            plan TEXT NOT NULL DEFAULT 'free',
+            valid_until TIMESTAMPTZ,
+            tz TEXT DEFAULT 'Europe/Amsterdam',
+            digest_hours INTEGER[] DEFAULT ARRAY[9,19],
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        );
+    END IF;
+END $$;
+
+DO $$ BEGIN
+    IF NOT EXISTS (SELECT FROM pg_tables WHERE schemaname = 'public' AND tablename = 'channels') THEN
+        CREATE TABLE channels (
+            id SERIAL PRIMARY KEY,
+            handle TEXT UNIQUE NOT NULL,
+            visibility TEXT NOT NULL DEFAULT 'public',
+            status TEXT NOT NULL DEFAULT 'active',
+            last_msg_id BIGINT DEFAULT 0,
+            last_checked_at TIMESTAMPTZ,
+            shard INTEGER DEFAULT 0,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        );
+    END IF;
+END $$;
+
+DO $$ BEGIN
+    IF NOT EXISTS (SELECT FROM pg_tables WHERE schemaname = 'public' AND tablename = 'subscriptions') THEN
+        CREATE TABLE subscriptions (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            channel_id INTEGER NOT NULL REFERENCES channels(id) ON DELETE CASCADE,
+            UNIQUE(user_id, channel_id)
+        );
+    END IF;
+END $$;
+
+DO $$ BEGIN
+    IF NOT EXISTS (SELECT FROM pg_tables WHERE schemaname = 'public' AND tablename = 'messages') THEN
+        CREATE TABLE messages (
+            id BIGSERIAL PRIMARY KEY,
+            channel_id INTEGER NOT NULL REFERENCES channels(id) ON DELETE CASCADE,
+            tg_message_id BIGINT NOT NULL,
+            msg_date TIMESTAMPTZ NOT NULL,
+            link TEXT,
+            text TEXT,
+            text_hash CHAR(64),
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            UNIQUE(channel_id, tg_message_id)
+        );
+    END IF;
+END $$;
+
+DO $$ BEGIN
+    IF NOT EXISTS (SELECT FROM pg_tables WHERE schemaname = 'public' AND tablename = 'digests') THEN
+        CREATE TABLE digests (
+            id BIGSERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            window_start TIMESTAMPTZ NOT NULL,
+            window_end TIMESTAMPTZ NOT NULL,
+            item_count INTEGER NOT NULL,
+            content_md TEXT NOT NULL,
+            sent_to TEXT NOT NULL DEFAULT 'user',
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        );
+    END IF;
+END $$;
+
+-- Создание индексов, если таблица существует
+DO $$ BEGIN
+    IF EXISTS (SELECT FROM pg_tables WHERE schemaname = 'public' AND tablename = 'subscriptions') THEN
+        CREATE INDEX IF NOT EXISTS idx_subscriptions_user ON subscriptions(user_id);
+    END IF;
+END $$;
+
+DO $$ BEGIN
+    IF EXISTS (SELECT FROM pg_tables WHERE schemaname = 'public' AND tablename = 'messages') THEN
+        CREATE INDEX IF NOT EXISTS idx_messages_channel_date ON messages(channel_id, msg_date DESC);
+    END IF;
+END $$;
@@ -0,0 +1 @@
+CREATE INDEX IF NOT EXISTS idx_channels_shard ON channels(shard);
@@ -0,0 +1,4 @@
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS simhash BIGINT;
+
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS summary TEXT;
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS summarized_at TIMESTAMPTZ;
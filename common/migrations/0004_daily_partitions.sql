@@ -0,0 +1,99 @@
+-- Секция parent за каждый день [from_day, to_day] (UTC). Строки этого дня,
+-- уже попавшие в DEFAULT, переносятся в новую секцию перед подключением
+CREATE OR REPLACE FUNCTION ensure_daily_partitions(parent TEXT, key TEXT, from_day DATE, to_day DATE)
+RETURNS INTEGER LANGUAGE plpgsql AS $$
+DECLARE
+    d DATE;
+    part TEXT;
+    bounds TEXT;
+    range_filter TEXT;
+    has_rows BOOLEAN;
+    created INTEGER = 0;
+BEGIN
+    range_filter = quote_ident(key) || ' >= $1 AND ' || quote_ident(key) || ' < $2';
+    FOR d IN SELECT generate_series(from_day, to_day, INTERVAL '1 day')::date LOOP
+        part = parent || '_p' || to_char(d, 'YYYYMMDD');
+        CONTINUE WHEN to_regclass(part) IS NOT NULL;
+        bounds = ' FOR VALUES FROM (' || quote_literal(d::timestamp AT TIME ZONE 'UTC')
+              || ') TO (' || quote_literal((d + 1)::timestamp AT TIME ZONE 'UTC') || ')';
+        EXECUTE 'SELECT EXISTS (SELECT 1 FROM ' || quote_ident(parent || '_default') || ' WHERE ' || range_filter || ')'
+            INTO has_rows USING d::timestamp AT TIME ZONE 'UTC', (d + 1)::timestamp AT TIME ZONE 'UTC';
+        IF has_rows THEN
+            EXECUTE 'CREATE TABLE ' || quote_ident(part) || ' (LIKE ' || quote_ident(parent)
+                 || ' INCLUDING DEFAULTS INCLUDING CONSTRAINTS)';
+            EXECUTE 'WITH moved AS (DELETE FROM ' || quote_ident(parent || '_default') || ' WHERE ' || range_filter
+                 || ' RETURNING *) INSERT INTO ' || quote_ident(part) || ' SELECT * FROM moved'
+                USING d::timestamp AT TIME ZONE 'UTC', (d + 1)::timestamp AT TIME ZONE 'UTC';
+            EXECUTE 'ALTER TABLE ' || quote_ident(parent) || ' ATTACH PARTITION ' || quote_ident(part) || bounds;
+        ELSE
+            EXECUTE 'CREATE TABLE ' || quote_ident(part) || ' PARTITION OF ' || quote_ident(parent) || bounds;
+        END IF;
+        created = created + 1;
+    END LOOP;
+    RETURN created;
+END $$;
+
+-- Старые базы: messages и digests были обычными таблицами — переносим в
+-- секционированные по дням (msg_date / created_at), id сохраняются
+DO $$ BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = to_regclass('messages')) = 'r' THEN
+        ALTER TABLE messages RENAME TO messages_legacy;
+        ALTER TABLE messages_legacy RENAME CONSTRAINT messages_pkey TO messages_legacy_pkey;
+        ALTER INDEX IF EXISTS idx_messages_channel_date RENAME TO idx_messages_legacy_channel_date;
+        ALTER INDEX IF EXISTS idx_messages_text_hash RENAME TO idx_messages_legacy_text_hash;
+        ALTER INDEX IF EXISTS idx_messages_unsummarized RENAME TO idx_messages_legacy_unsummarized;
+        CREATE TABLE messages (
+            id BIGINT NOT NULL DEFAULT nextval('messages_id_seq'),
+            channel_id INTEGER NOT NULL REFERENCES channels(id) ON DELETE CASCADE,
+            tg_message_id BIGINT NOT NULL,
+            msg_date TIMESTAMPTZ NOT NULL,
+            link TEXT,
+            text TEXT,
+            text_hash CHAR(64),
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            simhash BIGINT,
+            summary TEXT,
+            summarized_at TIMESTAMPTZ,
+            PRIMARY KEY (id, msg_date),
+            UNIQUE (channel_id, tg_message_id, msg_date)
+        ) PARTITION BY RANGE (msg_date);
+        ALTER SEQUENCE messages_id_seq OWNED BY messages.id;
+        CREATE TABLE messages_default PARTITION OF messages DEFAULT;
+        PERFORM ensure_daily_partitions('messages', 'msg_date', (NOW() AT TIME ZONE 'UTC')::date - 7, (NOW() AT TIME ZONE 'UTC')::date);
+        INSERT INTO messages (id, channel_id, tg_message_id, msg_date, link, text, text_hash, created_at, simhash, summary, summarized_at)
+        SELECT id, channel_id, tg_message_id, msg_date, link, text, text_hash, created_at, simhash, summary, summarized_at
+        FROM messages_legacy;
+        DROP TABLE messages_legacy;
+    END IF;
+
+    IF (SELECT relkind FROM pg_class WHERE oid = to_regclass('digests')) = 'r' THEN
+        ALTER TABLE digests RENAME TO digests_legacy;
+        ALTER TABLE digests_legacy RENAME CONSTRAINT digests_pkey TO digests_legacy_pkey;
+        CREATE TABLE digests (
+            id BIGINT NOT NULL DEFAULT nextval('digests_id_seq'),
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            window_start TIMESTAMPTZ NOT NULL,
+            window_end TIMESTAMPTZ NOT NULL,
+            item_count INTEGER NOT NULL,
+            content_md TEXT NOT NULL,
+            sent_to TEXT NOT NULL DEFAULT 'user',
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at);
+        ALTER SEQUENCE digests_id_seq OWNED BY digests.id;
+        CREATE TABLE digests_default PARTITION OF digests DEFAULT;
+        PERFORM ensure_daily_partitions('digests', 'created_at', (NOW() AT TIME ZONE 'UTC')::date - 7, (NOW() AT TIME ZONE 'UTC')::date);
+        INSERT INTO digests (id, user_id, window_start, window_end, item_count, content_md, sent_to, created_at)
+        SELECT id, user_id, window_start, window_end, item_count, content_md, sent_to, created_at
+        FROM digests_legacy;
+        DROP TABLE digests_legacy;
+    END IF;
+END $$;
+
+CREATE INDEX IF NOT EXISTS idx_messages_channel_date ON messages(channel_id, msg_date DESC);
+CREATE INDEX IF NOT EXISTS idx_messages_text_hash ON messages(text_hash);
+CREATE INDEX IF NOT EXISTS idx_messages_unsummarized ON messages(msg_date) WHERE summary IS NULL;
+CREATE INDEX IF NOT EXISTS idx_digests_created_at ON digests(created_at);
+
+SELECT ensure_daily_partitions('messages', 'msg_date', (NOW() AT TIME ZONE 'UTC')::date, (NOW() AT TIME ZONE 'UTC')::date + 3);
+SELECT ensure_daily_partitions('digests', 'created_at', (NOW() AT TIME ZONE 'UTC')::date, (NOW() AT TIME ZONE 'UTC')::date + 3);
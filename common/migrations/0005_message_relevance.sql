@@ -0,0 +1 @@
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS relevance REAL;
@@ -0,0 +1,10 @@
+CREATE TABLE IF NOT EXISTS reader_nodes (
+    node_id TEXT PRIMARY KEY,
+    heartbeat_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS shard_leases (
+    shard INTEGER PRIMARY KEY,
+    owner TEXT,
+    expires_at TIMESTAMPTZ
+);
@@ -0,0 +1,28 @@
+ALTER TABLE users ADD COLUMN IF NOT EXISTS next_digest_at TIMESTAMPTZ;
+CREATE INDEX IF NOT EXISTS idx_users_next_digest_at ON users(next_digest_at);
+
+-- Ближайший после after_ts момент HH:00 из hours в часовом поясе пользователя
+CREATE OR REPLACE FUNCTION compute_next_digest_at(hours INTEGER[], user_tz TEXT, after_ts TIMESTAMPTZ)
+RETURNS TIMESTAMPTZ LANGUAGE sql STABLE AS $$
+    SELECT MIN((d + make_interval(hours => h)) AT TIME ZONE COALESCE(user_tz, 'UTC'))
+    FROM unnest(hours) AS h,
+         generate_series(
+             date_trunc('day', after_ts AT TIME ZONE COALESCE(user_tz, 'UTC')),
+             date_trunc('day', after_ts AT TIME ZONE COALESCE(user_tz, 'UTC')) + INTERVAL '1 day',
+             INTERVAL '1 day'
+         ) AS d
+    WHERE (d + make_interval(hours => h)) AT TIME ZONE COALESCE(user_tz, 'UTC') > after_ts
+$$;
+
+CREATE OR REPLACE FUNCTION users_set_next_digest_at() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.next_digest_at = compute_next_digest_at(NEW.digest_hours, NEW.tz, NOW());
+    RETURN NEW;
+END $$;
+
+CREATE OR REPLACE TRIGGER trg_users_next_digest_at
+    BEFORE INSERT OR UPDATE OF digest_hours, tz ON users
+    FOR EACH ROW EXECUTE FUNCTION users_set_next_digest_at();
+
+UPDATE users SET next_digest_at = compute_next_digest_at(digest_hours, tz, NOW())
+WHERE next_digest_at IS NULL AND cardinality(digest_hours) > 0;
@@ -0,0 +1,129 @@
+-- Счётчики для /debug без COUNT(*): итоги по таблицам и почасовые корзины
+-- сообщений/дайджестов, которые ведут statement-level триггеры по transition tables
+CREATE TABLE IF NOT EXISTS system_counters (
+    name TEXT PRIMARY KEY,
+    value BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS stats_hourly (
+    name TEXT NOT NULL,
+    bucket TIMESTAMPTZ NOT NULL,
+    value BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (name, bucket)
+);
+
+CREATE OR REPLACE FUNCTION bump_counter(counter TEXT, delta BIGINT) RETURNS void LANGUAGE sql AS $$
+    INSERT INTO system_counters (name, value) VALUES (counter, delta)
+    ON CONFLICT (name) DO UPDATE SET value = system_counters.value + EXCLUDED.value
+$$;
+
+-- TG_ARGV[0] — имя счётчика; строки считаются по всей таблице
+CREATE OR REPLACE FUNCTION stats_count_rows() RETURNS trigger LANGUAGE plpgsql AS $$
+DECLARE
+    delta BIGINT;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT COUNT(*) INTO delta FROM new_rows;
+    ELSE
+        SELECT -COUNT(*) INTO delta FROM old_rows;
+    END IF;
+    IF delta <> 0 THEN
+        PERFORM bump_counter(TG_ARGV[0], delta);
+    END IF;
+    RETURN NULL;
+END $$;
+
+CREATE OR REPLACE FUNCTION stats_active_channels() RETURNS trigger LANGUAGE plpgsql AS $$
+DECLARE
+    delta BIGINT = 0;
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        delta = delta + (SELECT COUNT(*) FROM new_rows WHERE status = 'active');
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        delta = delta - (SELECT COUNT(*) FROM old_rows WHERE status = 'active');
+    END IF;
+    IF delta <> 0 THEN
+        PERFORM bump_counter('active_channels', delta);
+    END IF;
+    RETURN NULL;
+END $$;
+
+-- Корзины по часу msg_date / created_at (UTC); старше двух суток не ведутся.
+-- ORDER BY — единый порядок блокировок корзин у параллельных писателей
+CREATE OR REPLACE FUNCTION stats_messages_hourly() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO stats_hourly (name, bucket, value)
+        SELECT 'messages', date_trunc('hour', msg_date, 'UTC'), COUNT(*) FROM new_rows
+        WHERE msg_date > NOW() - INTERVAL '2 days' GROUP BY 2 ORDER BY 2
+        ON CONFLICT (name, bucket) DO UPDATE SET value = stats_hourly.value + EXCLUDED.value;
+    ELSE
+        INSERT INTO stats_hourly (name, bucket, value)
+        SELECT 'messages', date_trunc('hour', msg_date, 'UTC'), -COUNT(*) FROM old_rows
+        WHERE msg_date > NOW() - INTERVAL '2 days' GROUP BY 2 ORDER BY 2
+        ON CONFLICT (name, bucket) DO UPDATE SET value = stats_hourly.value + EXCLUDED.value;
+    END IF;
+    RETURN NULL;
+END $$;
+
+CREATE OR REPLACE FUNCTION stats_digests_hourly() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO stats_hourly (name, bucket, value)
+        SELECT 'digests', date_trunc('hour', created_at, 'UTC'), COUNT(*) FROM new_rows
+        WHERE created_at > NOW() - INTERVAL '2 days' GROUP BY 2 ORDER BY 2
+        ON CONFLICT (name, bucket) DO UPDATE SET value = stats_hourly.value + EXCLUDED.value;
+    ELSE
+        INSERT INTO stats_hourly (name, bucket, value)
+        SELECT 'digests', date_trunc('hour', created_at, 'UTC'), -COUNT(*) FROM old_rows
+        WHERE created_at > NOW() - INTERVAL '2 days' GROUP BY 2 ORDER BY 2
+        ON CONFLICT (name, bucket) DO UPDATE SET value = stats_hourly.value + EXCLUDED.value;
+    END IF;
+    RETURN NULL;
+END $$;
+
+-- Transition tables допускают только одно событие на триггер
+CREATE OR REPLACE TRIGGER trg_users_count_ins AFTER INSERT ON users
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION stats_count_rows('users_count');
+CREATE OR REPLACE TRIGGER trg_users_count_del AFTER DELETE ON users
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION stats_count_rows('users_count');
+CREATE OR REPLACE TRIGGER trg_subscriptions_count_ins AFTER INSERT ON subscriptions
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION stats_count_rows('subscriptions_count');
+CREATE OR REPLACE TRIGGER trg_subscriptions_count_del AFTER DELETE ON subscriptions
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION stats_count_rows('subscriptions_count');
+CREATE OR REPLACE TRIGGER trg_channels_active_ins AFTER INSERT ON channels
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION stats_active_channels();
+CREATE OR REPLACE TRIGGER trg_channels_active_upd AFTER UPDATE ON channels
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION stats_active_channels();
+CREATE OR REPLACE TRIGGER trg_channels_active_del AFTER DELETE ON channels
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION stats_active_channels();
+CREATE OR REPLACE TRIGGER trg_messages_hourly_ins AFTER INSERT ON messages
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION stats_messages_hourly();
+CREATE OR REPLACE TRIGGER trg_messages_hourly_del AFTER DELETE ON messages
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION stats_messages_hourly();
+CREATE OR REPLACE TRIGGER trg_digests_hourly_ins AFTER INSERT ON digests
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION stats_digests_hourly();
+CREATE OR REPLACE TRIGGER trg_digests_hourly_del AFTER DELETE ON digests
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION stats_digests_hourly();
+
+-- Полный пересчёт (первый запуск или ручная сверка: SELECT resync_system_stats()).
+-- SHARE-блокировки не дают писателям изменить таблицы между подсчётом и записью
+CREATE OR REPLACE FUNCTION resync_system_stats() RETURNS void LANGUAGE plpgsql AS $$
+BEGIN
+    LOCK TABLE users, channels, subscriptions, messages, digests, system_counters, stats_hourly IN SHARE ROW EXCLUSIVE MODE;
+    DELETE FROM system_counters;
+    INSERT INTO system_counters (name, value) VALUES
+        ('users_count', (SELECT COUNT(*) FROM users)),
+        ('active_channels', (SELECT COUNT(*) FROM channels WHERE status = 'active')),
+        ('subscriptions_count', (SELECT COUNT(*) FROM subscriptions));
+    DELETE FROM stats_hourly;
+    INSERT INTO stats_hourly (name, bucket, value)
+    SELECT 'messages', date_trunc('hour', msg_date, 'UTC'), COUNT(*) FROM messages
+    WHERE msg_date > NOW() - INTERVAL '2 days' GROUP BY 2;
+    INSERT INTO stats_hourly (name, bucket, value)
+    SELECT 'digests', date_trunc('hour', created_at, 'UTC'), COUNT(*) FROM digests
+    WHERE created_at > NOW() - INTERVAL '2 days' GROUP BY 2;
+END $$;
+
+SELECT resync_system_stats() WHERE NOT EXISTS (SELECT 1 FROM system_counters);
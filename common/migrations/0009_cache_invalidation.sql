@@ -0,0 +1,48 @@
+-- Уведомления для кэша пользователей и подписок в процессе бота (common.user_cache).
+-- Канал bot_cache, payload 'user:<tg_id>' или 'subs:<tg_id>'; одинаковые
+-- уведомления внутри транзакции Postgres схлопывает сам.
+
+-- Только поля, которые читают команды бота: сдвиг next_digest_at
+-- планировщиком и upsert в /start уведомлений не дают
+CREATE OR REPLACE FUNCTION notify_user_changed() RETURNS trigger LANGUAGE plpgsql AS $$
+DECLARE
+    r users;
+BEGIN
+    IF TG_OP = 'DELETE' THEN r := OLD; ELSE r := NEW; END IF;
+    PERFORM pg_notify('bot_cache', 'user:' || r.tg_id);
+    RETURN NULL;
+END $$;
+
+CREATE OR REPLACE TRIGGER trg_users_cache_upd
+    AFTER UPDATE OF plan, valid_until, tz, digest_hours ON users
+    FOR EACH ROW
+    WHEN (OLD.plan IS DISTINCT FROM NEW.plan
+          OR OLD.valid_until IS DISTINCT FROM NEW.valid_until
+          OR OLD.tz IS DISTINCT FROM NEW.tz
+          OR OLD.digest_hours IS DISTINCT FROM NEW.digest_hours)
+    EXECUTE FUNCTION notify_user_changed();
+CREATE OR REPLACE TRIGGER trg_users_cache_del
+    AFTER DELETE ON users
+    FOR EACH ROW EXECUTE FUNCTION notify_user_changed();
+
+-- Подписки: одно уведомление на пользователя за оператор, сколько бы
+-- каналов ни добавил bulk-запрос. При каскадном удалении пользователя
+-- строки users уже нет — его покрывает trg_users_cache_del
+CREATE OR REPLACE FUNCTION notify_subscriptions_changed() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM pg_notify('bot_cache', 'subs:' || u.tg_id)
+        FROM (SELECT DISTINCT user_id FROM new_rows) n JOIN users u ON u.id = n.user_id;
+    ELSE
+        PERFORM pg_notify('bot_cache', 'subs:' || u.tg_id)
+        FROM (SELECT DISTINCT user_id FROM old_rows) o JOIN users u ON u.id = o.user_id;
+    END IF;
+    RETURN NULL;
+END $$;
+
+CREATE OR REPLACE TRIGGER trg_subscriptions_cache_ins
+    AFTER INSERT ON subscriptions REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_subscriptions_changed();
+CREATE OR REPLACE TRIGGER trg_subscriptions_cache_del
+    AFTER DELETE ON subscriptions REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_subscriptions_changed();
@@ -0,0 +1,4 @@
+-- Аренда пользователя планировщиком: next_digest_at сдвигается только после
+-- доставки, а упавшая или не завершённая отправка забирается снова, когда
+-- истечёт digest_claimed_until
+ALTER TABLE users ADD COLUMN IF NOT EXISTS digest_claimed_until TIMESTAMPTZ;
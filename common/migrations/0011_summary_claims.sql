@@ -0,0 +1,5 @@
+-- Захват сообщений суммаризатором: воркеры в разных ридерах не берут один
+-- text_hash одновременно, а текст, на котором LLM раз за разом падает,
+-- перестаёт забираться после SUMMARY_MAX_ATTEMPTS попыток
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS summary_attempts SMALLINT NOT NULL DEFAULT 0;
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS summary_claimed_until TIMESTAMPTZ;
@@ -1,126 +1,416 @@
+import os
+import time
+from hashlib import sha256
 from sqlalchemy import text
 from .db import session_scope
+from .dedup import simhash
+from .relevance import RELEVANCE_THRESHOLD, relevance_scores
+from .metrics import ADD_MESSAGES_ROWS, ADD_MESSAGES_SECONDS
+
+# SQL вынесен в константы: те же запросы использует асинхронный слой (common.models_async)
+
+UPSERT_USER_SQL = text("""
+    INSERT INTO users (tg_id) VALUES (:tg_id)
+    ON CONFLICT (tg_id) DO UPDATE SET tg_id = EXCLUDED.tg_id
+    RETURNING id, plan, tz, digest_hours
+""")
+
+GET_USER_BY_TG_SQL = text("""SELECT * FROM users WHERE tg_id=:tg_id""")
+
+SET_USER_HOURS_SQL = text("""UPDATE users SET digest_hours=:h WHERE tg_id=:tg_id""")
+
+ENSURE_CHANNEL_SQL = text("""
+    INSERT INTO channels (handle, status) VALUES (:h, 'active')
+    ON CONFLICT (handle) DO UPDATE SET status='active'
+    RETURNING id, handle
+""")
+
+# Подписка на список каналов одним запросом: пользователь и каналы
+# создаются при необходимости, added — подписка новая
+BULK_SUBSCRIBE_SQL = text("""
+    WITH u AS (
+        INSERT INTO users (tg_id) VALUES (:tg)
+        ON CONFLICT (tg_id) DO UPDATE SET tg_id = EXCLUDED.tg_id
+        RETURNING id
+    ), ch AS (
+        INSERT INTO channels (handle, status)
+        SELECT DISTINCT h, 'active' FROM unnest(CAST(:h AS TEXT[])) AS h
+        ON CONFLICT (handle) DO UPDATE SET status='active'
+        RETURNING id, handle
+    ), ins AS (
+        INSERT INTO subscriptions (user_id, channel_id)
+        SELECT u.id, ch.id FROM u CROSS JOIN ch
+        ON CONFLICT DO NOTHING
+        RETURNING channel_id
+    )
+    SELECT ch.handle, ins.channel_id IS NOT NULL AS added
+    FROM ch LEFT JOIN ins ON ins.channel_id = ch.id
+    ORDER BY ch.handle
+""")
+
+BULK_UNSUBSCRIBE_SQL = text("""
+    DELETE FROM subscriptions s
+    USING users u, channels c
+    WHERE u.tg_id=:tg AND s.user_id=u.id AND s.channel_id=c.id
+      AND c.handle = ANY(CAST(:h AS TEXT[]))
+    RETURNING c.handle
+""")
+
+LIST_USER_CHANNELS_SQL = text("""
+    SELECT c.handle FROM subscriptions s
+    JOIN users u ON u.id=s.user_id
+    JOIN channels c ON c.id=s.channel_id
+    WHERE u.tg_id=:tg
+    ORDER BY c.handle
+""")
+
+# Забирает пачку пользователей, у которых подошло время дайджеста, в аренду на
+# :lease секунд: параллельные воркеры пропускают занятые и арендованные строки.
+# next_digest_at не трогается — его сдвигает COMPLETE_DIGEST_SQL после доставки,
+# так что дайджест, не доставленный из-за падения процесса или ошибки отправки,
+# заберут снова по истечении аренды (доставка «хотя бы раз»: повтор после
+# save_digest, но до отправки, сохранит дайджест дважды). Повторы идут, пока
+# слоту не больше :retry секунд; дальше — expired: слот пропускается и
+# next_digest_at сдвигается сразу. Первая попытка (аренды ещё не было) не
+# истекает — после простоя бота опоздавшие дайджесты всё равно уходят.
+CLAIM_DUE_USERS_SQL = text("""
+    WITH due AS (
+        SELECT id, next_digest_at,
+               digest_claimed_until IS NOT NULL
+                   AND next_digest_at < :now - make_interval(secs => :retry) AS expired
+        FROM users
+        WHERE next_digest_at <= :now AND (digest_claimed_until IS NULL OR digest_claimed_until <= :now)
+        ORDER BY next_digest_at
+        LIMIT :n
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE users u
+    SET digest_claimed_until = CASE WHEN due.expired THEN NULL ELSE :now + make_interval(secs => :lease) END,
+        next_digest_at = CASE WHEN due.expired
+                              THEN compute_next_digest_at(u.digest_hours, u.tz, :now)
+                              ELSE u.next_digest_at END
+    FROM due
+    WHERE u.id = due.id
+    RETURNING u.*, due.next_digest_at AS scheduled_at, due.expired
+""")
+
+# Дайджест доставлен (или отправлять было нечего): следующий слот и снять аренду.
+# Если пользователь за это время сменил часы, триггер уже пересчитал next_digest_at
+COMPLETE_DIGEST_SQL = text("""
+    UPDATE users
+    SET next_digest_at = CASE WHEN next_digest_at = CAST(:scheduled AS TIMESTAMPTZ)
+                              THEN compute_next_digest_at(digest_hours, tz, NOW())
+                              ELSE next_digest_at END,
+        digest_claimed_until = NULL
+    WHERE id = :u
+""")
+
+# Уникальный ключ секционированной messages обязан включать msg_date, и
+# ON CONFLICT ловит повтор только с той же датой: сообщение, пришедшее снова с
+# другой msg_date (правка, повторная выборка, другая секция), вставилось бы
+# второй раз. Поэтому уже сохранённые пары (channel_id, tg_message_id)
+# отсеиваются NOT EXISTS (префикс уникального индекса, по индексу в каждой
+# секции), а повторы внутри пачки — DISTINCT ON с самой ранней датой.
+# Параллельные вставки одного сообщения с разными датами NOT EXISTS не
+# видит: перед вставкой транзакция берёт LOCK_CHANNELS_SQL на каналы пачки.
+# ON CONFLICT остаётся страховкой на гонку с одинаковой датой.
+INSERT_MESSAGES_SQL = text("""
+    WITH ins AS (
+        INSERT INTO messages(channel_id, tg_message_id, msg_date, link, text, text_hash, simhash, relevance)
+        SELECT DISTINCT ON (v.c, v.mid) v.* FROM unnest(
+            CAST(:c AS INTEGER[]), CAST(:mid AS BIGINT[]), CAST(:dt AS TIMESTAMPTZ[]),
+            CAST(:link AS TEXT[]), CAST(:text AS TEXT[]), CAST(:h AS TEXT[]), CAST(:sh AS BIGINT[]),
+            CAST(:rel AS REAL[])
+        ) AS v(c, mid, dt, link, text, h, sh, rel)
+        WHERE NOT EXISTS (SELECT 1 FROM messages m WHERE m.channel_id = v.c AND m.tg_message_id = v.mid)
+        ORDER BY v.c, v.mid, v.dt
+        ON CONFLICT (channel_id, tg_message_id, msg_date) DO NOTHING
+        RETURNING 1
+    )
+    SELECT COUNT(*) FROM ins
+""")
+
+# Транзакционные advisory-локи на каналы пачки, по возрастанию id — без дедлоков
+# между писателями; снимаются коммитом
+LOCK_CHANNELS_SQL = text("""
+    SELECT COUNT(*) FROM (
+        SELECT pg_advisory_xact_lock(:ns, v.c) FROM (
+            SELECT DISTINCT c FROM unnest(CAST(:c AS INTEGER[])) AS c ORDER BY c
+        ) v
+    ) l
+""")
+
+ADVANCE_CURSORS_SQL = text("""
+    UPDATE channels c
+    SET last_msg_id=GREATEST(COALESCE(c.last_msg_id, 0), v.last_id), last_checked_at=NOW()
+    FROM unnest(CAST(:c AS INTEGER[]), CAST(:m AS BIGINT[])) AS v(id, last_id)
+    WHERE c.id=v.id
+""")
+
+USER_WINDOW_MESSAGES_SQL = text("""
+    SELECT m.* FROM messages m
+    JOIN subscriptions s ON s.channel_id=m.channel_id
+    WHERE s.user_id=:u AND m.msg_date BETWEEN :a AND :b
+      AND (m.relevance IS NULL OR m.relevance >= :min_rel)
+      AND (m.summary IS NULL OR m.summary <> '')
+    ORDER BY m.msg_date DESC
+    LIMIT :n
+""")
+
+SUBSCRIBED_CHANNELS_SQL = text("""
+    SELECT user_id, channel_id FROM subscriptions
+    WHERE user_id = ANY(CAST(:u AS INTEGER[]))
+""")
+
+# Окно каждого канала отдельно, не больше :n свежих строк на канал — больше в
+# дайджест пользователя всё равно не попадёт. summary = '' — суммаризатор
+# отбраковал пост: отсекается до ранжирования, чтобы не занимать место в top-K
+CHANNEL_WINDOW_MESSAGES_SQL = text("""
+    SELECT channel_id, msg_date, link, text, text_hash, simhash, summary, relevance FROM (
+        SELECT m.*, ROW_NUMBER() OVER (PARTITION BY m.channel_id ORDER BY m.msg_date DESC) AS rn
+        FROM messages m
+        WHERE m.channel_id = ANY(CAST(:c AS INTEGER[])) AND m.msg_date BETWEEN :a AND :b
+          AND (m.relevance IS NULL OR m.relevance >= :min_rel)
+          AND (m.summary IS NULL OR m.summary <> '')
+    ) w
+    WHERE rn <= :n
+    ORDER BY channel_id, msg_date DESC
+""")
+
+SAVE_DIGEST_SQL = text("""
+    INSERT INTO digests(user_id, window_start, window_end, item_count, content_md, sent_to)
+    VALUES (:u,:a,:b,:n,:c,:to)
+""")
+
+# Захват свежих сообщений без summary, новые первыми. SKIP LOCKED разводит
+# воркеры по строкам, а UPDATE после чужого коммита перепроверяет
+# summary_claimed_until — один text_hash достаётся одному воркеру, даже если
+# его строки лежат в разных каналах. Каждый захват — попытка: после
+# :max_attempts неудач (LLM вернул None, воркер упал) текст больше не берётся
+CLAIM_UNSUMMARIZED_SQL = text("""
+    WITH cand AS (
+        SELECT text_hash FROM messages
+        WHERE summary IS NULL AND text IS NOT NULL AND msg_date > NOW() - make_interval(hours => :hours)
+          AND (relevance IS NULL OR relevance >= :min_rel)
+          AND summary_attempts < :max_attempts
+          AND (summary_claimed_until IS NULL OR summary_claimed_until <= NOW())
+        ORDER BY msg_date DESC
+        LIMIT :n
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE messages m
+    SET summary_claimed_until = NOW() + make_interval(secs => :lease),
+        summary_attempts = m.summary_attempts + 1
+    WHERE m.text_hash IN (SELECT text_hash FROM cand)
+      AND m.summary IS NULL AND m.msg_date > NOW() - make_interval(hours => :hours)
+      AND (m.summary_claimed_until IS NULL OR m.summary_claimed_until <= NOW())
+    RETURNING m.text_hash, m.text, m.msg_date
+""")
+
+# Репост старого текста: summary уже есть у другой строки с тем же text_hash
+COPY_KNOWN_SUMMARIES_SQL = text("""
+    UPDATE messages m SET summary=k.summary, summarized_at=NOW()
+    FROM (
+        SELECT DISTINCT ON (text_hash) text_hash, summary FROM messages
+        WHERE text_hash = ANY(CAST(:h AS TEXT[])) AND summary IS NOT NULL
+    ) k
+    WHERE m.text_hash=k.text_hash AND m.summary IS NULL AND m.msg_date > NOW() - make_interval(hours => :hours)
+    RETURNING m.text_hash
+""")
+
+STORE_SUMMARIES_SQL = text("""
+    UPDATE messages m SET summary=v.summary, summarized_at=NOW()
+    FROM unnest(CAST(:h AS TEXT[]), CAST(:s AS TEXT[])) AS v(text_hash, summary)
+    WHERE m.text_hash=v.text_hash AND m.summary IS NULL AND m.msg_date > NOW() - make_interval(hours => :hours)
+""")
+
+# Счётчики ведут триггеры (system_counters, stats_hourly): чтение не зависит от размера таблиц.
+# Окно 24 часа — с точностью до часа, по корзинам UTC
+SYSTEM_STATS_SQL = text("""
+    SELECT name, value FROM system_counters
+    UNION ALL
+    SELECT name || '_24h', SUM(value) FROM stats_hourly
+    WHERE bucket > date_trunc('hour', NOW() - INTERVAL '24 hours', 'UTC')
+    GROUP BY name
+""")
+
+SYSTEM_STATS_KEYS = ('users_count', 'active_channels', 'subscriptions_count', 'messages_24h', 'digests_24h')
+
+ADD_MESSAGES_CHUNK = 1000  # строк в одном INSERT
+INGEST_LOCK_NS = 7_301_003  # первый ключ pg_advisory_xact_lock(ns, channel_id) при вставке сообщений
+SUMMARY_LOOKBACK_HOURS = 24  # старше — в дайджест уже не попадёт, суммаризировать незачем
+CLAIM_BATCH = 500  # пользователей, забираемых планировщиком за раз
+DIGEST_CLAIM_LEASE = int(os.getenv("DIGEST_CLAIM_LEASE", "900"))  # сек аренды; дольше не доставлено — забирается снова
+SUMMARY_CLAIM_LEASE = int(os.getenv("SUMMARY_CLAIM_LEASE", "600"))  # сек; не сохранил summary — текст забирается снова
+SUMMARY_MAX_ATTEMPTS = int(os.getenv("SUMMARY_MAX_ATTEMPTS", "3"))  # захватов на текст, потом он остаётся без summary
+DIGEST_RETRY_WINDOW = int(os.getenv("DIGEST_RETRY_WINDOW", "3600"))  # сек после слота, пока недоставленный дайджест повторяется
+WINDOW_LIMIT = 200  # сообщений в окне дайджеста одного пользователя
 
 def upsert_user(tg_id: int):
     with session_scope() as s:
-        res = s.execute(text("""
-            INSERT INTO users (tg_id) VALUES (:tg_id)
-            ON CONFLICT (tg_id) DO UPDATE SET tg_id = EXCLUDED.tg_id
-            RETURNING id, plan, tz, digest_hours
-        """), {'tg_id': tg_id}).mappings().first()
+        res = s.execute(UPSERT_USER_SQL, {'tg_id': tg_id}).mappings().first()
         return res
 
 def get_user_by_tg(tg_id: int):
     with session_scope() as s:
-        res = s.execute(text("""SELECT * FROM users WHERE tg_id=:tg_id"""), {'tg_id': tg_id}).mappings().first()
+        res = s.execute(GET_USER_BY_TG_SQL, {'tg_id': tg_id}).mappings().first()
         return res
 
 def set_user_hours(tg_id: int, hours):
     with session_scope() as s:
-        s.execute(text("""UPDATE users SET digest_hours=:h WHERE tg_id=:tg_id"""), {'h': hours, 'tg_id': tg_id})
+        s.execute(SET_USER_HOURS_SQL, {'h': hours, 'tg_id': tg_id})
 
 def ensure_channel(handle: str):
     handle = handle.lstrip('@')
     with session_scope() as s:
-        res = s.execute(text("""
-            INSERT INTO channels (handle, status) VALUES (:h, 'active')
-            ON CONFLICT (handle) DO UPDATE SET status='active'
-            RETURNING id, handle
-        """), {'h': handle}).mappings().first()
+        res = s.execute(ENSURE_CHANNEL_SQL, {'h': handle}).mappings().first()
         return res
 
-def subscribe_user_to_channel(tg_id: int, handle: str):
-    ch = ensure_channel(handle)
+def subscription_result(rows) -> dict:
+    """Строки BULK_SUBSCRIBE_SQL -> {'added': [...], 'existing': [...]}"""
+    result = {'added': [], 'existing': []}
+    for r in rows:
+        result['added' if r.added else 'existing'].append(r.handle)
+    return result
+
+def subscribe_user_to_channels(tg_id: int, handles) -> dict:
+    handles = [h.lstrip('@') for h in handles]
+    if not handles:
+        return {'added': [], 'existing': []}
     with session_scope() as s:
-        uid = s.execute(text("""SELECT id FROM users WHERE tg_id=:tg"""), {'tg': tg_id}).scalar()
-        s.execute(text("""
-            INSERT INTO subscriptions (user_id, channel_id) VALUES (:u, :c)
-            ON CONFLICT DO NOTHING
-        """), {'u': uid, 'c': ch['id']})
+        return subscription_result(s.execute(BULK_SUBSCRIBE_SQL, {'tg': tg_id, 'h': handles}).all())
+
+def subscribe_user_to_channel(tg_id: int, handle: str):
+    subscribe_user_to_channels(tg_id, [handle])
 
 def list_user_channels(tg_id: int):
     with session_scope() as s:
-        res = s.execute(text("""
-            SELECT c.handle FROM subscriptions s
-            JOIN users u ON u.id=s.user_id
-            JOIN channels c ON c.id=s.channel_id
-            WHERE u.tg_id=:tg
-            ORDER BY c.handle
-        """), {'tg': tg_id}).scalars().all()
+        res = s.execute(LIST_USER_CHANNELS_SQL, {'tg': tg_id}).scalars().all()
         return ['@'+h for h in res]
 
-def remove_user_channel(tg_id: int, handle: str):
-    handle = handle.lstrip('@')
+def remove_user_channels(tg_id: int, handles) -> list:
+    """Отписка от списка каналов; возвращает имена, от которых действительно отписали"""
+    handles = [h.lstrip('@') for h in handles]
+    if not handles:
+        return []
     with session_scope() as s:
-        uid = s.execute(text("SELECT id FROM users WHERE tg_id=:tg"), {'tg': tg_id}).scalar()
-        cid = s.execute(text("SELECT id FROM channels WHERE handle=:h"), {'h': handle}).scalar()
-        if uid and cid:
-            s.execute(text("DELETE FROM subscriptions WHERE user_id=:u AND channel_id=:c"), {'u': uid, 'c': cid})
+        return s.execute(BULK_UNSUBSCRIBE_SQL, {'tg': tg_id, 'h': handles}).scalars().all()
 
-def due_users(hour_now: int, minute_now: int):
+def remove_user_channel(tg_id: int, handle: str):
+    remove_user_channels(tg_id, [handle])
+
+def claim_due_users(now, limit: int = CLAIM_BATCH):
     with session_scope() as s:
-        res = s.execute(text("""
-            SELECT * FROM users
-            WHERE :h = ANY(digest_hours)
-        """), {'h': hour_now}).mappings().all()
+        res = s.execute(CLAIM_DUE_USERS_SQL, claim_params(now, limit)).mappings().all()
         return res
 
+def claim_params(now, limit: int) -> dict:
+    return {'now': now, 'n': limit, 'lease': float(DIGEST_CLAIM_LEASE), 'retry': float(DIGEST_RETRY_WINDOW)}
+
+def complete_digest(user_id: int, scheduled_at):
+    with session_scope() as s:
+        s.execute(COMPLETE_DIGEST_SQL, {'u': user_id, 'scheduled': scheduled_at})
+
+def message_text_hash(text_value) -> str:
+    return sha256((text_value or '').lower().encode('utf-8')).hexdigest()
+
+def message_chunks(batch):
+    """Параметры INSERT_MESSAGES_SQL по кускам из ADD_MESSAGES_CHUNK сообщений"""
+    for i in range(0, len(batch), ADD_MESSAGES_CHUNK):
+        chunk = batch[i:i + ADD_MESSAGES_CHUNK]
+        yield len(chunk), {
+            'c': [m['channel_id'] for m in chunk],
+            'mid': [m['tg_message_id'] for m in chunk],
+            'dt': [m['msg_date'] for m in chunk],
+            'link': [m.get('link') for m in chunk],
+            'text': [m.get('text') for m in chunk],
+            'h': [message_text_hash(m.get('text')) for m in chunk],
+            'sh': [simhash(m.get('text')) for m in chunk],
+            # Реклама и офтоп получают низкую оценку и дальше до LLM не доходят
+            'rel': relevance_scores([m.get('text') for m in chunk]),
+        }
+
+def lock_params(batch) -> dict:
+    return {'ns': INGEST_LOCK_NS, 'c': sorted({m['channel_id'] for m in batch})}
+
+def cursor_params(cursors):
+    return {'c': list(cursors), 'm': list(cursors.values())}
+
+def record_ingest(result, started: float):
+    """Метрики записи: время с учётом коммита и строки по исходу"""
+    ADD_MESSAGES_SECONDS.observe(time.monotonic() - started)
+    ADD_MESSAGES_ROWS.labels("inserted").inc(result['inserted'])
+    ADD_MESSAGES_ROWS.labels("duplicate").inc(result['duplicates'])
+
+def _insert_messages(s, batch):
+    result = {'inserted': 0, 'duplicates': 0}
+    s.execute(LOCK_CHANNELS_SQL, lock_params(batch))
+    for size, params in message_chunks(batch):
+        inserted = s.execute(INSERT_MESSAGES_SQL, params).scalar()
+        result['inserted'] += inserted
+        result['duplicates'] += size - inserted
+    return result
+
 def add_messages(batch):
+    """Пакетная вставка сообщений: один INSERT ... SELECT FROM unnest на ADD_MESSAGES_CHUNK строк.
+
+    Возвращает {'inserted': новых строк, 'duplicates': уже существовавших}.
+    """
     if not batch:
-        return
-    from hashlib import sha256
-    with session_scope() as s:
-        for m in batch:
-            h = sha256((m.get('text') or '').lower().encode('utf-8')).hexdigest()
-            s.execute(text("""
-                INSERT INTO messages(channel_id, tg_message_id, msg_date, link, text, text_hash)
-                VALUES (:c, :mid, :dt, :link, :text, :h)
-                ON CONFLICT (channel_id, tg_message_id) DO NOTHING
-            """), {'c': m['channel_id'], 'mid': m['tg_message_id'], 'dt': m['msg_date'],
-                     'link': m['link'], 'text': m['text'], 'h': h})
+        return {'inserted': 0, 'duplicates': 0}
+    started = time.monotonic()
+    with session_scope() as s:
+        result = _insert_messages(s, batch)
+    record_ingest(result, started)
+    return result
+
+def store_ingest_batch(batch, cursors):
+    """Сообщения и курсоры каналов ({channel_id: last_msg_id}) в одной транзакции.
+
+    Курсор не может уехать вперёд сохранённых сообщений: либо коммитится всё, либо ничего.
+    """
+    result = {'inserted': 0, 'duplicates': 0}
+    started = time.monotonic()
+    with session_scope() as s:
+        if batch:
+            result = _insert_messages(s, batch)
+        if cursors:
+            s.execute(ADVANCE_CURSORS_SQL, cursor_params(cursors))
+    record_ingest(result, started)
+    return result
 
 def get_user_window_messages(user_id: int, start_ts, end_ts):
-    q = text("""
-        SELECT m.* FROM messages m
-        JOIN subscriptions s ON s.channel_id=m.channel_id
-        WHERE s.user_id=:u AND m.msg_date BETWEEN :a AND :b
-        ORDER BY m.msg_date DESC
-        LIMIT 200
-    """)
     with session_scope() as s:
-        return s.execute(q, {'u': user_id, 'a': start_ts, 'b': end_ts}).mappings().all()
+        return s.execute(
+            USER_WINDOW_MESSAGES_SQL,
+            {'u': user_id, 'a': start_ts, 'b': end_ts, 'n': WINDOW_LIMIT, 'min_rel': RELEVANCE_THRESHOLD},
+        ).mappings().all()
+
+def get_subscribed_channels(user_ids):
+    """{user_id: [channel_id]} для пачки пользователей одним запросом"""
+    result = {u: [] for u in user_ids}
+    with session_scope() as s:
+        for row in s.execute(SUBSCRIBED_CHANNELS_SQL, {'u': list(user_ids)}):
+            result[row.user_id].append(row.channel_id)
+    return result
+
+def get_channel_window_messages(channel_ids, start_ts, end_ts, limit: int = WINDOW_LIMIT):
+    with session_scope() as s:
+        return s.execute(
+            CHANNEL_WINDOW_MESSAGES_SQL,
+            {'c': list(channel_ids), 'a': start_ts, 'b': end_ts, 'n': limit, 'min_rel': RELEVANCE_THRESHOLD},
+        ).all()
 
 def save_digest(user_id: int, start_ts, end_ts, item_count: int, content_md: str, sent_to: str='user'):
     with session_scope() as s:
-        s.execute(text("""
-            INSERT INTO digests(user_id, window_start, window_end, item_count, content_md, sent_to)
-            VALUES (:u,:a,:b,:n,:c,:to)
-        """), {'u': user_id, 'a': start_ts, 'b': end_ts, 'n': item_count, 'c': content_md, 'to': sent_to})
+        s.execute(SAVE_DIGEST_SQL, {'u': user_id, 'a': start_ts, 'b': end_ts, 'n': item_count, 'c': content_md, 'to': sent_to})
+
+def stats_dict(rows) -> dict:
+    stats = dict.fromkeys(SYSTEM_STATS_KEYS, 0)
+    stats.update({name: int(value) for name, value in rows})
+    return stats
 
 def get_system_stats():
     """Получить статистику системы для отладки"""
     with session_scope() as s:
-        stats = {}
-        
-        # Количество пользователей
-        stats['users_count'] = s.execute(text("SELECT COUNT(*) FROM users")).scalar()
-        
-        # Количество активных каналов
-        stats['active_channels'] = s.execute(text("SELECT COUNT(*) FROM channels WHERE status='active'")).scalar()
-        
-        # Количество подписок
-        stats['subscriptions_count'] = s.execute(text("SELECT COUNT(*) FROM subscriptions")).scalar()
-        
-        # Количество сообщений за последние 24 часа
-        stats['messages_24h'] = s.execute(text("""
-            SELECT COUNT(*) FROM messages 
-            WHERE msg_date > NOW() - INTERVAL '24 hours'
-        """)).scalar()
-        
-        # Количество дайджестов за последние 24 часа
-        stats['digests_24h'] = s.execute(text("""
-            SELECT COUNT(*) FROM digests 
-            WHERE created_at > NOW() - INTERVAL '24 hours'
-        """)).scalar()
-        
-        return stats
+        return stats_dict(s.execute(SYSTEM_STATS_SQL))
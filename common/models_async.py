@@ -0,0 +1,153 @@
+"""Асинхронные версии хелперов common.models поверх asyncpg.
+
+Запросы общие с синхронным модулем, отличается только сессия: вызовы из
+хэндлеров и фоновых задач не блокируют event loop.
+"""
+import time
+
+from .db import async_session_scope
+from .relevance import RELEVANCE_THRESHOLD
+from .models import (
+    UPSERT_USER_SQL, GET_USER_BY_TG_SQL, SET_USER_HOURS_SQL, ENSURE_CHANNEL_SQL,
+    BULK_SUBSCRIBE_SQL, BULK_UNSUBSCRIBE_SQL,
+    LIST_USER_CHANNELS_SQL, CLAIM_DUE_USERS_SQL, COMPLETE_DIGEST_SQL, CLAIM_BATCH, INSERT_MESSAGES_SQL, LOCK_CHANNELS_SQL, ADVANCE_CURSORS_SQL,
+    USER_WINDOW_MESSAGES_SQL, SUBSCRIBED_CHANNELS_SQL, CHANNEL_WINDOW_MESSAGES_SQL, WINDOW_LIMIT, SAVE_DIGEST_SQL, SYSTEM_STATS_SQL,
+    CLAIM_UNSUMMARIZED_SQL, COPY_KNOWN_SUMMARIES_SQL, STORE_SUMMARIES_SQL, SUMMARY_LOOKBACK_HOURS,
+    SUMMARY_CLAIM_LEASE, SUMMARY_MAX_ATTEMPTS,
+    claim_params, lock_params, message_chunks, cursor_params, record_ingest, stats_dict, subscription_result,
+)
+
+async def upsert_user(tg_id: int):
+    async with async_session_scope() as s:
+        return (await s.execute(UPSERT_USER_SQL, {'tg_id': tg_id})).mappings().first()
+
+async def get_user_by_tg(tg_id: int):
+    async with async_session_scope() as s:
+        return (await s.execute(GET_USER_BY_TG_SQL, {'tg_id': tg_id})).mappings().first()
+
+async def set_user_hours(tg_id: int, hours):
+    async with async_session_scope() as s:
+        await s.execute(SET_USER_HOURS_SQL, {'h': hours, 'tg_id': tg_id})
+
+async def ensure_channel(handle: str):
+    handle = handle.lstrip('@')
+    async with async_session_scope() as s:
+        return (await s.execute(ENSURE_CHANNEL_SQL, {'h': handle})).mappings().first()
+
+async def subscribe_user_to_channels(tg_id: int, handles) -> dict:
+    handles = [h.lstrip('@') for h in handles]
+    if not handles:
+        return {'added': [], 'existing': []}
+    async with async_session_scope() as s:
+        return subscription_result((await s.execute(BULK_SUBSCRIBE_SQL, {'tg': tg_id, 'h': handles})).all())
+
+async def subscribe_user_to_channel(tg_id: int, handle: str):
+    await subscribe_user_to_channels(tg_id, [handle])
+
+async def list_user_channels(tg_id: int):
+    async with async_session_scope() as s:
+        res = (await s.execute(LIST_USER_CHANNELS_SQL, {'tg': tg_id})).scalars().all()
+        return ['@'+h for h in res]
+
+async def remove_user_channels(tg_id: int, handles) -> list:
+    handles = [h.lstrip('@') for h in handles]
+    if not handles:
+        return []
+    async with async_session_scope() as s:
+        return (await s.execute(BULK_UNSUBSCRIBE_SQL, {'tg': tg_id, 'h': handles})).scalars().all()
+
+async def remove_user_channel(tg_id: int, handle: str):
+    await remove_user_channels(tg_id, [handle])
+
+async def claim_due_users(now, limit: int = CLAIM_BATCH):
+    async with async_session_scope() as s:
+        return (await s.execute(CLAIM_DUE_USERS_SQL, claim_params(now, limit))).mappings().all()
+
+async def complete_digest(user_id: int, scheduled_at):
+    async with async_session_scope() as s:
+        await s.execute(COMPLETE_DIGEST_SQL, {'u': user_id, 'scheduled': scheduled_at})
+
+async def _insert_messages(s, batch):
+    result = {'inserted': 0, 'duplicates': 0}
+    await s.execute(LOCK_CHANNELS_SQL, lock_params(batch))
+    for size, params in message_chunks(batch):
+        inserted = (await s.execute(INSERT_MESSAGES_SQL, params)).scalar()
+        result['inserted'] += inserted
+        result['duplicates'] += size - inserted
+    return result
+
+async def add_messages(batch):
+    if not batch:
+        return {'inserted': 0, 'duplicates': 0}
+    started = time.monotonic()
+    async with async_session_scope() as s:
+        result = await _insert_messages(s, batch)
+    record_ingest(result, started)
+    return result
+
+async def store_ingest_batch(batch, cursors):
+    result = {'inserted': 0, 'duplicates': 0}
+    started = time.monotonic()
+    async with async_session_scope() as s:
+        if batch:
+            result = await _insert_messages(s, batch)
+        if cursors:
+            await s.execute(ADVANCE_CURSORS_SQL, cursor_params(cursors))
+    record_ingest(result, started)
+    return result
+
+async def get_user_window_messages(user_id: int, start_ts, end_ts):
+    async with async_session_scope() as s:
+        return (await s.execute(
+            USER_WINDOW_MESSAGES_SQL,
+            {'u': user_id, 'a': start_ts, 'b': end_ts, 'n': WINDOW_LIMIT, 'min_rel': RELEVANCE_THRESHOLD},
+        )).mappings().all()
+
+async def get_subscribed_channels(user_ids):
+    """{user_id: [channel_id]} для пачки пользователей одним запросом"""
+    result = {u: [] for u in user_ids}
+    async with async_session_scope() as s:
+        for row in await s.execute(SUBSCRIBED_CHANNELS_SQL, {'u': list(user_ids)}):
+            result[row.user_id].append(row.channel_id)
+    return result
+
+async def get_channel_window_messages(channel_ids, start_ts, end_ts, limit: int = WINDOW_LIMIT):
+    async with async_session_scope() as s:
+        return (await s.execute(
+            CHANNEL_WINDOW_MESSAGES_SQL,
+            {'c': list(channel_ids), 'a': start_ts, 'b': end_ts, 'n': limit, 'min_rel': RELEVANCE_THRESHOLD},
+        )).all()
+
+async def claim_unsummarized(limit: int, hours: int = SUMMARY_LOOKBACK_HOURS):
+    """[(text_hash, text)] свежих сообщений без summary, захваченных этим воркером, по одному на text_hash"""
+    async with async_session_scope() as s:
+        rows = await s.execute(CLAIM_UNSUMMARIZED_SQL, {
+            'n': limit, 'hours': hours, 'min_rel': RELEVANCE_THRESHOLD,
+            'max_attempts': SUMMARY_MAX_ATTEMPTS, 'lease': float(SUMMARY_CLAIM_LEASE),
+        })
+        latest = {}
+        for r in sorted(rows, key=lambda r: r.msg_date, reverse=True):
+            latest.setdefault(r.text_hash, r.text)
+        return list(latest.items())
+
+async def copy_known_summaries(hashes, hours: int = SUMMARY_LOOKBACK_HOURS):
+    """Проставить summary из уже суммаризированных строк с тем же text_hash; вернуть покрытые хэши"""
+    if not hashes:
+        return set()
+    async with async_session_scope() as s:
+        return set((await s.execute(COPY_KNOWN_SUMMARIES_SQL, {'h': list(hashes), 'hours': hours})).scalars().all())
+
+async def store_summaries(summaries, hours: int = SUMMARY_LOOKBACK_HOURS):
+    """summaries: {text_hash: summary}; пустая строка — пост не для дайджеста (реклама/офтоп)"""
+    if not summaries:
+        return
+    async with async_session_scope() as s:
+        await s.execute(STORE_SUMMARIES_SQL, {'h': list(summaries), 's': list(summaries.values()), 'hours': hours})
+
+async def save_digest(user_id: int, start_ts, end_ts, item_count: int, content_md: str, sent_to: str='user'):
+    async with async_session_scope() as s:
+        await s.execute(SAVE_DIGEST_SQL, {'u': user_id, 'a': start_ts, 'b': end_ts, 'n': item_count, 'c': content_md, 'to': sent_to})
+
+async def get_system_stats():
+    async with async_session_scope() as s:
+        return stats_dict(await s.execute(SYSTEM_STATS_SQL))
@@ -0,0 +1,96 @@
+"""Ранжирование кандидатов в дайджест сразу для всех пользователей тика.
+
+Признаки поста — свежесть, релевантность и длина текста — считаются один раз
+на объединение окон всех пользователей пачки и дают оценку одним матричным
+умножением. Признак репостов — в скольких каналах самого пользователя вышла
+та же новость (репосты склеены через group_near_duplicates), — так оценка не
+зависит от того, кто ещё попал в пачку, и /digest_now ранжирует окно так же,
+как планировщик. Выбор лучшего поста в каждой группе и top-K каждого
+пользователя — сортировки numpy по всему массиву пар (пользователь, пост).
+"""
+from datetime import datetime
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from .dedup import group_near_duplicates
+from .relevance import NEUTRAL
+
+ROW_FEATURES = ("recency", "relevance", "length")
+ROW_WEIGHTS = np.array([1.0, 1.5, 0.3])
+REPOSTS_WEIGHT = 0.6
+RECENCY_HALF_LIFE_HOURS = 6.0
+LENGTH_NORM = 1000  # символов; длиннее — признак длины уже не растёт
+TOP_K = 10  # пунктов в дайджесте
+
+
+def feature_matrix(rows: Sequence, now: datetime) -> np.ndarray:
+    """Матрица len(rows)×len(ROW_FEATURES), все признаки в диапазоне около 0..1"""
+    age_hours = np.maximum(now.timestamp() - np.array([r.msg_date.timestamp() for r in rows]), 0.0) / 3600
+    recency = 0.5 ** (age_hours / RECENCY_HALF_LIFE_HOURS)
+
+    relevance = np.array([NEUTRAL if r.relevance is None else r.relevance for r in rows], dtype=np.float64)
+    lengths = np.array([len(r.text or "") for r in rows])
+    length = np.minimum(np.log1p(lengths) / np.log1p(LENGTH_NORM), 1.0)
+    return np.column_stack([recency, relevance, length])
+
+
+def repost_feature(users: np.ndarray, groups: np.ndarray, channels: np.ndarray) -> np.ndarray:
+    """Для каждой пары (пользователь, пост): log2 числа разных каналов пользователя с этой новостью"""
+    _, user_idx = np.unique(users, return_inverse=True)
+    _, key = np.unique(user_idx.astype(np.int64) * (groups.max() + 1) + groups, return_inverse=True)
+    pairs = np.unique(np.stack([key, channels]), axis=1)
+    channels_per_key = np.bincount(pairs[0], minlength=key.max() + 1)
+    return np.log2(channels_per_key[key])
+
+
+def rank_users(user_items: Dict[int, List], now: datetime, k: int = TOP_K) -> Dict[int, List]:
+    """{user_id: кандидаты} -> {user_id: до k лучших, по одному на новость, по убыванию оценки}
+
+    Кандидаты разных пользователей — общие объекты из ChannelWindowCache,
+    поэтому объединение строится по identity и каждый пост оценивается один раз.
+    """
+    result: Dict[int, List] = {u: [] for u in user_items}
+    index: Dict[int, int] = {}
+    union: List = []
+    user_col: List[int] = []
+    cand_col: List[int] = []
+    for user_id, items in user_items.items():
+        for row in items:
+            i = index.get(id(row))
+            if i is None:
+                i = index[id(row)] = len(union)
+                union.append(row)
+            user_col.append(user_id)
+            cand_col.append(i)
+    if not union:
+        return result
+
+    group_of = np.empty(len(union), dtype=np.int64)
+    for g, members in enumerate(group_near_duplicates(union)):
+        for row in members:
+            group_of[index[id(row)]] = g
+    row_scores = feature_matrix(union, now) @ ROW_WEIGHTS
+    channel_of = np.array([r.channel_id for r in union])
+
+    users = np.array(user_col)
+    cands = np.array(cand_col)
+    groups = group_of[cands]
+    cand_scores = row_scores[cands] + REPOSTS_WEIGHT * repost_feature(users, groups, channel_of[cands])
+
+    # Лучший пост каждой группы у каждого пользователя: первый после сортировки по (user, group, -score)
+    order = np.lexsort((-cand_scores, groups, users))
+    users, groups, cands, cand_scores = users[order], groups[order], cands[order], cand_scores[order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = (users[1:] != users[:-1]) | (groups[1:] != groups[:-1])
+    users, cands, cand_scores = users[first], cands[first], cand_scores[first]
+
+    # Top-k внутри пользователя: сортировка по (user, -score) и ранг от начала блока пользователя
+    order = np.lexsort((-cand_scores, users))
+    users, cands = users[order], cands[order]
+    starts = np.flatnonzero(np.r_[True, users[1:] != users[:-1]])
+    rank = np.arange(len(users)) - np.repeat(starts, np.diff(np.r_[starts, len(users)]))
+    keep = rank < k
+    for user_id, c in zip(users[keep].tolist(), cands[keep].tolist()):
+        result[user_id].append(union[c])
+    return result
@@ -0,0 +1,186 @@
+import os
+import time
+import asyncio
+import logging
+from hashlib import sha256
+from typing import Dict, Optional, Tuple
+
+from .cache import get_redis
+from .metrics import RATE_LIMIT_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Token bucket для asyncio: rate токенов в секунду, не больше capacity про запас"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self, tokens: float = 1.0):
+        # Лок сохраняет порядок ожидающих: никто не проскакивает вперёд очереди
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+
+# ---------- Общий бюджет Telegram API ----------
+# reader и bot работают под одним BOT_TOKEN и делят лимиты Telegram. Бюджет
+# задаётся по классам методов (read — get_chat/get_messages, send —
+# send_message) и хранится в Redis, так что оба процесса тратят одну корзину.
+# Без Redis (или пока он недоступен) — локальные TokenBucket с тем же бюджетом.
+
+TG_READ_RATE = float(os.getenv("TG_READ_RATE", "20"))  # запросов чтения в секунду на бота
+TG_SEND_RATE = float(os.getenv("TG_SEND_RATE", os.getenv("SEND_GLOBAL_RATE", "25")))  # сообщений в секунду на бота
+TG_BURST_SECONDS = float(os.getenv("TG_BURST_SECONDS", "1"))  # запас корзины в секундах бюджета
+TG_SHARED_FLOOD_WAIT = os.getenv("TG_SHARED_FLOOD_WAIT", "1") == "1"  # FloodWait одного процесса ставит на паузу класс во всех
+RATE_LIMIT_REDIS_RETRY = 5.0  # сек работы на локальном бюджете после ошибки Redis
+
+# Корзина с резервированием: токены списываются сразу (могут уйти в минус),
+# ответ — сколько ждать до своего слота. Один вызов на запрос, часы — Redis TIME.
+# Пока действует штраф FloodWait — 'p<секунды>' без списания: после паузы запрос повторяется.
+# KEYS[1] — корзина, KEYS[2] — штраф FloodWait; ARGV — rate, capacity, tokens
+_ACQUIRE_LUA = """
+local penalty = redis.call('PTTL', KEYS[2])
+if penalty > 0 then return 'p' .. tostring(penalty / 1000) end
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local b = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(b[1]) or capacity
+local ts = tonumber(b[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate) - tonumber(ARGV[3])
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate * 1000) + 1000)
+if tokens >= 0 then return '0' end
+return tostring(-tokens / rate)
+"""
+
+# Штраф только продлевается: короткий FloodWait не отменяет длинный
+_PENALIZE_LUA = """
+if redis.call('PTTL', KEYS[1]) < tonumber(ARGV[1]) then
+    redis.call('SET', KEYS[1], '1', 'PX', ARGV[1])
+end
+return 0
+"""
+
+
+def default_budgets() -> Dict[str, Tuple[float, float]]:
+    """{класс методов: (rate, capacity)}"""
+    return {
+        cls: (rate, max(1.0, rate * TG_BURST_SECONDS))
+        for cls, rate in (("read", TG_READ_RATE), ("send", TG_SEND_RATE))
+    }
+
+
+def _key_prefix() -> str:
+    # Бюджет принадлежит боту, а не процессу: ключ от хэша токена
+    token = os.getenv("BOT_TOKEN") or ""
+    return "tg:rate:" + sha256(token.encode("utf-8")).hexdigest()[:16]
+
+
+class RateLimiter:
+    """Локальный бюджет по классам методов: для одного процесса и как запасной путь без Redis"""
+
+    def __init__(self, budgets: Optional[Dict[str, Tuple[float, float]]] = None):
+        self.budgets = budgets or default_budgets()
+        self.buckets = {cls: TokenBucket(rate, capacity) for cls, (rate, capacity) in self.budgets.items()}
+        self.paused_until: Dict[str, float] = {}
+
+    async def _wait_penalty(self, method_class: str):
+        wait = self.paused_until.get(method_class, 0.0) - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def _local_acquire(self, method_class: str, tokens: float):
+        await self._wait_penalty(method_class)
+        await self.buckets[method_class].acquire(tokens)
+
+    async def acquire(self, method_class: str, tokens: float = 1.0):
+        started = time.monotonic()
+        await self._local_acquire(method_class, tokens)
+        RATE_LIMIT_WAIT_SECONDS.labels(method_class).inc(time.monotonic() - started)
+
+    async def penalize(self, method_class: str, seconds: float):
+        """FloodWait на seconds: остальные запросы класса ждут, а не ловят его повторно"""
+        until = time.monotonic() + seconds
+        self.paused_until[method_class] = max(self.paused_until.get(method_class, 0.0), until)
+
+
+class RedisRateLimiter(RateLimiter):
+    """Бюджет в Redis, общий для всех процессов бота; при ошибке Redis — локальный"""
+
+    def __init__(self, redis, budgets: Optional[Dict[str, Tuple[float, float]]] = None,
+                 prefix: Optional[str] = None, shared_flood_wait: bool = TG_SHARED_FLOOD_WAIT):
+        super().__init__(budgets)
+        self.redis = redis
+        self.prefix = prefix or _key_prefix()
+        self.shared_flood_wait = shared_flood_wait
+        self._acquire_script = redis.register_script(_ACQUIRE_LUA)
+        self._penalize_script = redis.register_script(_PENALIZE_LUA)
+        self._redis_down_until = 0.0
+
+    def _redis_up(self) -> bool:
+        return time.monotonic() >= self._redis_down_until
+
+    def _fallback(self, exc: Exception):
+        # Без паузы каждый запрос ждал бы таймаута Redis
+        self._redis_down_until = time.monotonic() + RATE_LIMIT_REDIS_RETRY
+        logger.warning(f"Rate limiter: Redis unavailable, local budget for {RATE_LIMIT_REDIS_RETRY:.0f}s: {exc}")
+
+    def _keys(self, method_class: str):
+        return [f"{self.prefix}:{method_class}", f"{self.prefix}:flood:{method_class}"]
+
+    async def acquire(self, method_class: str, tokens: float = 1.0):
+        rate, capacity = self.budgets[method_class]
+        started = time.monotonic()
+        if not self._redis_up():
+            await super().acquire(method_class, tokens)
+            return
+        await self._wait_penalty(method_class)
+        while True:
+            try:
+                reply = await self._acquire_script(keys=self._keys(method_class), args=[rate, capacity, tokens])
+            except Exception as exc:
+                self._fallback(exc)
+                await self._local_acquire(method_class, tokens)
+                break
+            reply = reply.decode() if isinstance(reply, bytes) else str(reply)
+            if reply.startswith("p"):
+                await asyncio.sleep(float(reply[1:]))
+                continue
+            if float(reply) > 0:
+                await asyncio.sleep(float(reply))
+            break
+        RATE_LIMIT_WAIT_SECONDS.labels(method_class).inc(time.monotonic() - started)
+
+    async def penalize(self, method_class: str, seconds: float):
+        await super().penalize(method_class, seconds)
+        if not self.shared_flood_wait or not self._redis_up():
+            return
+        try:
+            await self._penalize_script(keys=self._keys(method_class)[1:], args=[int(seconds * 1000)])
+        except Exception as exc:
+            self._fallback(exc)
+
+
+def create_rate_limiter(budgets: Optional[Dict[str, Tuple[float, float]]] = None) -> RateLimiter:
+    """Общий бюджет через Redis, если он настроен (REDIS_URL/REDIS_HOST), иначе локальный"""
+    redis = get_redis()
+    if redis is None:
+        return RateLimiter(budgets)
+    return RedisRateLimiter(redis, budgets)
@@ -0,0 +1,198 @@
+"""Локальная оценка релевантности постов: реклама и офтоп отсекаются до LLM.
+
+Правила по ключевым словам (маркировка рекламы — сразу 0) плюс линейная
+модель на хэшированных признаках слов, посчитанная для всего батча одним
+матричным умножением. Пост без сигналов получает sigmoid(0) = 0.5 — выше
+порога: отсекаются только уверенно рекламные и офтопные посты, остальное
+решает ранжирование, где релевантность — один из признаков. Без обученных весов (RELEVANCE_WEIGHTS) модель
+собирается из словарей ниже; train() обучает логистическую регрессию на
+размеченных постах и сохраняет веса в .npy.
+"""
+import os
+import re
+import sys
+import zlib
+import logging
+from typing import Iterable, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+RELEVANCE_THRESHOLD = float(os.getenv("RELEVANCE_THRESHOLD", "0.3"))  # ниже — в дайджест не попадает
+RELEVANCE_WEIGHTS = os.getenv("RELEVANCE_WEIGHTS")  # путь к .npy из train()
+N_FEATURES = 2 ** 14
+STEM_LEN = 5  # грубый стемминг: слово обрезается до основы
+NEUTRAL = 0.5  # пост без текста
+
+_WORD_RE = re.compile(r"[\w#]+", re.UNICODE)
+
+# Маркировка рекламы: такой пост в дайджест не идёт никогда
+AD_MARKERS = re.compile(
+    r"\berid\b|#реклам|на правах рекламы|партн[её]рский материал|\bsponsored\b|#ad\b|#promo\b",
+    re.IGNORECASE,
+)
+
+# Основы слов (первые STEM_LEN букв) и их веса для модели по умолчанию
+TOPIC_STEMS = {
+    "нейро": 2.0, "искус": 1.5, "интел": 1.0, "машин": 0.8, "обуче": 0.8, "модел": 1.0, "датас": 1.2,
+    "алгор": 1.0, "генер": 0.8, "агент": 0.6, "робот": 0.8, "чатбо": 1.2, "техно": 0.8, "иссле": 0.6,
+    "бенчм": 1.0, "opena": 2.0, "anthr": 2.0, "claud": 1.5, "gemin": 1.5, "gpt": 2.0, "chatg": 2.0,
+    "llm": 2.0, "ai": 1.5, "ml": 1.2, "ии": 2.0, "deepm": 2.0, "nvidi": 1.2, "gpu": 1.0, "mistr": 1.2,
+    "llama": 1.5, "huggi": 1.5, "arxiv": 1.5, "api": 0.6,
+    # Общие технологические новости
+    "apple": 1.0, "iphon": 1.0, "andro": 1.0, "micro": 1.0, "googl": 1.0, "яндек": 0.8, "pytho": 1.2,
+    "linux": 1.0, "githu": 1.0, "старт": 0.6, "смарт": 0.8, "прило": 0.6, "верси": 0.5, "релиз": 0.8,
+    "обнов": 0.5, "разра": 0.8, "прогр": 0.8, "софт": 0.6, "чип": 0.8, "проце": 0.6, "компь": 0.6,
+    "серве": 0.6, "облак": 0.6, "кибер": 0.8, "уязви": 0.8,
+}
+AD_STEMS = {
+    "промо": -3.0, "скидк": -2.5, "розыг": -2.5, "подпи": -0.5, "курсы": -0.8, "вебин": -1.2,
+    "мараф": -1.5, "зараб": -2.0, "доход": -1.5, "инвес": -1.0, "крипт": -1.0, "казин": -3.0,
+    "ставк": -2.5, "бонус": -2.0, "акция": -1.5, "акции": -1.5, "купит": -1.2, "закаж": -1.5,
+    "заказ": -1.2, "беспл": -1.0, "перех": -0.4, "ссылк": -0.3, "регис": -0.8,
+}
+# Уверенный офтоп: быт, развлечения, спорт
+OFFTOPIC_STEMS = {
+    "праздн": -1.5, "оркес": -1.5, "морож": -1.5, "погод": -1.0, "футбо": -1.5, "матч": -1.0,
+    "рецеп": -1.5, "горос": -2.0, "астро": -1.5, "свадь": -1.5, "сериа": -1.0, "знаме": -1.0,
+}
+# Нейтральный пост — 0.5, не ниже RELEVANCE_THRESHOLD: фильтр не трогает то,
+# о чём словари молчат
+DEFAULT_BIAS = 0.0
+
+_FILLER = "Компания рассказала о планах на следующий год и поделилась подробностями с журналистами. "
+# Контрольные посты для check(): (текст, должен ли пройти порог)
+CHECK_POSTS = (
+    ("Сегодня в парке прошёл городской праздник, играл оркестр и продавали мороженое.", False),
+    ("OpenAI выпустила новую модель GPT: нейросеть обходит конкурентов в бенчмарках.", True),
+    ("Скидки до 70% и розыгрыш призов! Переходи по ссылке и регистрируйся.", False),
+    ("Apple представила новый iPhone с собственным модемом и более ёмкой батареей.", True),
+    ("Microsoft купила стартап, который делает инструменты для разработчиков.", True),
+    ("Вышла новая версия Python 3.13: интерпретатор стал быстрее, добавлен экспериментальный JIT.", True),
+    # Длинный пост с одним упоминанием темы: длина не должна топить оценку
+    (_FILLER * 7 + "Среди партнёров упомянули OpenAI. " + _FILLER * 7, True),
+    ("Завтра в городе ожидается солнечная погода, вечером начнётся футбольный матч.", False),
+)
+
+
+def tokens(text: str) -> List[str]:
+    return [w[:STEM_LEN] for w in _WORD_RE.findall(text.lower())]
+
+
+def feature_index(token: str) -> int:
+    # crc32, а не hash(): индексы должны совпадать между процессами и запусками
+    return zlib.crc32(token.encode("utf-8")) % N_FEATURES
+
+
+class Features(NamedTuple):
+    """Разреженная матрица n×N_FEATURES в виде троек (строка, признак, значение)"""
+    n: int
+    rows: np.ndarray
+    cols: np.ndarray
+    vals: np.ndarray
+
+    def dot(self, w: np.ndarray) -> np.ndarray:
+        return np.bincount(self.rows, weights=w[self.cols] * self.vals, minlength=self.n)
+
+    def t_dot(self, v: np.ndarray) -> np.ndarray:
+        return np.bincount(self.cols, weights=v[self.rows] * self.vals, minlength=N_FEATURES)
+
+
+def featurize(texts: Sequence[Optional[str]]) -> Features:
+    """Бинарные признаки: есть ли основа в посте. Без деления на длину — длинный пост не размывается"""
+    rows, cols, vals = [], [], []
+    for i, text in enumerate(texts):
+        for col in {feature_index(tok) for tok in tokens(text or "")}:
+            rows.append(i)
+            cols.append(col)
+            vals.append(1.0)
+    return Features(
+        len(texts), np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64), np.array(vals, dtype=np.float64),
+    )
+
+
+class RelevanceModel:
+    def __init__(self, weights: np.ndarray, bias: float):
+        self.weights = weights.astype(np.float32)
+        self.bias = float(bias)
+
+    @classmethod
+    def from_lexicon(cls) -> "RelevanceModel":
+        w = np.zeros(N_FEATURES, dtype=np.float32)
+        for stem, weight in {**TOPIC_STEMS, **AD_STEMS, **OFFTOPIC_STEMS}.items():
+            w[feature_index(stem)] += weight
+        return cls(w, DEFAULT_BIAS)
+
+    @classmethod
+    def load(cls, path: str) -> "RelevanceModel":
+        data = np.load(path)
+        return cls(data[:-1], data[-1])
+
+    def save(self, path: str):
+        np.save(path, np.append(self.weights, np.float32(self.bias)))
+
+    def score(self, texts: Sequence[Optional[str]]) -> np.ndarray:
+        """Вероятность «пост по теме и не реклама» для каждого текста, 0..1"""
+        if not len(texts):
+            return np.zeros(0)
+        scores = 1.0 / (1.0 + np.exp(-(featurize(texts).dot(self.weights) + self.bias)))
+        for i, text in enumerate(texts):
+            if not text:
+                scores[i] = NEUTRAL
+            elif AD_MARKERS.search(text):
+                scores[i] = 0.0
+        return scores
+
+
+def train(texts: Sequence[str], labels: Iterable[int], epochs: int = 200, lr: float = 0.5,
+          l2: float = 1e-4) -> RelevanceModel:
+    """Логистическая регрессия полным градиентным спуском; labels: 1 — по теме, 0 — мусор"""
+    X = featurize(texts)
+    y = np.asarray(list(labels), dtype=np.float32)
+    base = RelevanceModel.from_lexicon()
+    w, b = base.weights.copy(), base.bias
+    for _ in range(epochs):
+        p = 1.0 / (1.0 + np.exp(-(X.dot(w) + b)))
+        grad = p - y
+        w -= lr * (X.t_dot(grad) / len(y) + l2 * w)
+        b -= lr * float(grad.mean())
+    return RelevanceModel(w, b)
+
+
+_model: Optional[RelevanceModel] = None
+
+def get_model() -> RelevanceModel:
+    global _model
+    if _model is None:
+        if RELEVANCE_WEIGHTS and os.path.exists(RELEVANCE_WEIGHTS):
+            _model = RelevanceModel.load(RELEVANCE_WEIGHTS)
+            logger.info(f"Relevance model loaded from {RELEVANCE_WEIGHTS}")
+        else:
+            _model = RelevanceModel.from_lexicon()
+    return _model
+
+
+def relevance_scores(texts: Sequence[Optional[str]]) -> List[float]:
+    """Оценки для батча add_messages, округлённые под колонку REAL"""
+    return [round(float(s), 3) for s in get_model().score(texts)]
+
+
+def check(model: Optional[RelevanceModel] = None) -> List[str]:
+    """Прогон CHECK_POSTS через модель и порог; список расхождений, пустой — всё верно"""
+    model = model or get_model()
+    scores = model.score([text for text, _ in CHECK_POSTS])
+    return [
+        f"{score:.3f} {'<' if expected else '>='} {RELEVANCE_THRESHOLD}: {text}"
+        for (text, expected), score in zip(CHECK_POSTS, scores)
+        if (score >= RELEVANCE_THRESHOLD) != expected
+    ]
+
+
+if __name__ == "__main__":
+    # python -m common.relevance — проверка весов и порога после изменения словарей или обучения
+    failures = check()
+    for line in failures:
+        print(line)
+    print("relevance check " + ("FAILED" if failures else "ok"))
+    sys.exit(1 if failures else 0)
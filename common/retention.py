@@ -0,0 +1,231 @@
+"""Хранение секций messages/digests: новые дни заранее, старые — в архив.
+
+Секция старше срока хранения выгружается в gzip-CSV (COPY), затем
+отсоединяется и удаляется в одной транзакции. Восстановление — обратный
+COPY в родительскую таблицу:
+
+    python -m common.retention run
+    python -m common.retention list
+    python -m common.retention restore archive/messages_p20240101.csv.gz
+"""
+import os
+import re
+import sys
+import gzip
+import logging
+import argparse
+from datetime import date, datetime, timedelta, timezone
+
+from sqlalchemy import text
+
+from .db import engine, session_scope
+
+logger = logging.getLogger(__name__)
+
+# Секционированная таблица -> ключ секционирования
+PARTITIONED_TABLES = {'messages': 'msg_date', 'digests': 'created_at'}
+RETENTION_DAYS = {
+    'messages': int(os.getenv("MESSAGES_RETENTION_DAYS", "30")),
+    'digests': int(os.getenv("DIGESTS_RETENTION_DAYS", "90")),
+}
+PARTITIONS_AHEAD = int(os.getenv("PARTITIONS_AHEAD", "3"))  # дней вперёд
+ARCHIVE_DIR = os.path.abspath(os.getenv("ARCHIVE_DIR", os.path.join(os.getcwd(), "archive")))
+RETENTION_LOCK_ID = 7_301_015  # pg_advisory_lock: один архиватор на кластер
+DETACH_LOCK_TIMEOUT = '5s'
+
+# Почасовые корзины /debug нужны только за последние сутки (триггеры ведут двое)
+PRUNE_STATS_SQL = text("DELETE FROM stats_hourly WHERE bucket < NOW() - INTERVAL '2 days'")
+
+ENSURE_PARTITIONS_SQL = text("SELECT ensure_daily_partitions(:parent, :key, :a, :b)")
+
+LIST_PARTITIONS_SQL = text("""
+    SELECT c.relname AS name, to_date(right(c.relname, 8), 'YYYYMMDD') AS day
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = to_regclass(:parent) AND c.relname ~ '_p[0-9]{8}$'
+    ORDER BY day
+""")
+
+ARCHIVE_NAME_RE = re.compile(r'^(?P<parent>[a-z_]+?)_(?:p(?P<day>\d{8})|default_before\d{8})\.csv\.gz$')
+IDENT_RE = re.compile(r'^[a-z_][a-z0-9_]*$')
+
+
+def _ident(name: str) -> str:
+    # Имена берутся из PARTITIONED_TABLES, pg_class и заголовка архива — но в SQL подставляются строкой
+    if not IDENT_RE.match(name):
+        raise ValueError(f"Bad identifier: {name!r}")
+    return f'"{name}"'
+
+
+def _utc_today() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+def ensure_partitions(days_ahead: int = PARTITIONS_AHEAD) -> int:
+    """Создать секции на сегодня и days_ahead дней вперёд, вернуть число новых"""
+    today = _utc_today()
+    created = 0
+    with session_scope() as s:
+        for parent, key in PARTITIONED_TABLES.items():
+            created += s.execute(ENSURE_PARTITIONS_SQL, {
+                'parent': parent, 'key': key, 'a': today, 'b': today + timedelta(days=days_ahead),
+            }).scalar()
+    return created
+
+
+def list_partitions(parent: str):
+    with session_scope() as s:
+        return [(r.name, r.day) for r in s.execute(LIST_PARTITIONS_SQL, {'parent': parent})]
+
+
+def _copy_to_archive(cur, copy_sql: str, path: str) -> int:
+    """COPY ... TO STDOUT в gzip-файл; файл появляется под своим именем только целиком"""
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb') as gz:
+            cur.copy_expert(copy_sql, gz)
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp, path)
+    return cur.rowcount
+
+
+def archive_partition(parent: str, name: str, archive_dir: str = ARCHIVE_DIR) -> str:
+    """Выгрузить секцию в архив, затем отсоединить и удалить её одной транзакцией"""
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{name}.csv.gz")
+    conn = engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        # SHARE не даёт писать в эту секцию, пока она выгружается; вставки в другие дни не ждут
+        cur.execute(f"LOCK TABLE {_ident(name)} IN SHARE MODE")
+        rows = _copy_to_archive(cur, f"COPY (SELECT * FROM {_ident(name)}) TO STDOUT WITH (FORMAT csv, HEADER)", path)
+        # DETACH берёт эксклюзивный лок родителя — не стоим в очереди за долгими запросами, повторим завтра
+        cur.execute(f"SET LOCAL lock_timeout = '{DETACH_LOCK_TIMEOUT}'")
+        cur.execute(f"ALTER TABLE {_ident(parent)} DETACH PARTITION {_ident(name)}")
+        cur.execute(f"DROP TABLE {_ident(name)}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    logger.info(f"Archived partition {name} ({rows} rows) to {path}")
+    return path
+
+
+def archive_default_rows(parent: str, key: str, cutoff: date, archive_dir: str = ARCHIVE_DIR):
+    """Старые строки из DEFAULT (пришли задним числом, когда секции дня не было) — тоже в архив"""
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{parent}_default_before{cutoff:%Y%m%d}.csv.gz")
+    default = _ident(f"{parent}_default")
+    older = f"{_ident(key)} < '{cutoff.isoformat()} 00:00:00+00'::timestamptz"
+    conn = engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(f"SELECT EXISTS (SELECT 1 FROM {default} WHERE {older})")
+        if not cur.fetchone()[0]:
+            conn.rollback()
+            return None
+        rows = _copy_to_archive(
+            cur, f"COPY (DELETE FROM {default} WHERE {older} RETURNING *) TO STDOUT WITH (FORMAT csv, HEADER)", path,
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    logger.info(f"Archived {rows} rows from {parent}_default to {path}")
+    return path
+
+
+def run_retention(archive_dir: str = ARCHIVE_DIR) -> dict:
+    """Секции вперёд + архив всего, что старше RETENTION_DAYS; повторный запуск безопасен"""
+    result = {'created': 0, 'archived': [], 'stats_pruned': 0}
+    with engine.connect() as lock_conn:
+        if not lock_conn.execute(text("SELECT pg_try_advisory_lock(:k)"), {'k': RETENTION_LOCK_ID}).scalar():
+            logger.info("Retention already running elsewhere, skipping")
+            return result
+        lock_conn.commit()  # лок сессионный, транзакцию держать открытой незачем
+        try:
+            result['created'] = ensure_partitions()
+            today = _utc_today()
+            for parent, key in PARTITIONED_TABLES.items():
+                cutoff = today - timedelta(days=RETENTION_DAYS[parent])
+                for name, day in list_partitions(parent):
+                    if day < cutoff:
+                        result['archived'].append(archive_partition(parent, name, archive_dir))
+                path = archive_default_rows(parent, key, cutoff, archive_dir)
+                if path:
+                    result['archived'].append(path)
+            with session_scope() as s:
+                result['stats_pruned'] = s.execute(PRUNE_STATS_SQL).rowcount
+        finally:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:k)"), {'k': RETENTION_LOCK_ID})
+            lock_conn.commit()
+    return result
+
+
+def restore_archive(path: str) -> int:
+    """Загрузить архив обратно в родительскую таблицу; секция дня создаётся при необходимости.
+
+    Восстановленный день старше срока хранения уйдёт в архив при следующем
+    запуске — для долгого хранения увеличьте *_RETENTION_DAYS.
+    """
+    m = ARCHIVE_NAME_RE.match(os.path.basename(path))
+    if not m or m.group('parent') not in PARTITIONED_TABLES:
+        raise ValueError(f"Not a retention archive: {path}")
+    parent = m.group('parent')
+    if m.group('day'):
+        day = datetime.strptime(m.group('day'), '%Y%m%d').date()
+        with session_scope() as s:
+            s.execute(ENSURE_PARTITIONS_SQL, {'parent': parent, 'key': PARTITIONED_TABLES[parent], 'a': day, 'b': day})
+
+    conn = engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        with gzip.open(path, 'rt', encoding='utf-8', newline='') as f:
+            # Колонки по заголовку: архив мог быть снят до добавления новых колонок
+            columns = ', '.join(_ident(c) for c in f.readline().strip().split(','))
+            cur.copy_expert(f"COPY {_ident(parent)} ({columns}) FROM STDIN WITH (FORMAT csv)", f)
+        rows = cur.rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    logger.info(f"Restored {rows} rows into {parent} from {path}")
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m common.retention", description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("run", help="создать секции вперёд и архивировать старые")
+    sub.add_parser("ensure", help="только создать секции вперёд")
+    sub.add_parser("list", help="показать секции")
+    restore = sub.add_parser("restore", help="загрузить архив обратно")
+    restore.add_argument("path")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if args.cmd == "run":
+        result = run_retention()
+        print(f"created {result['created']} partitions, archived {len(result['archived'])}")
+        for path in result['archived']:
+            print(path)
+    elif args.cmd == "ensure":
+        print(f"created {ensure_partitions()} partitions")
+    elif args.cmd == "list":
+        for parent in PARTITIONED_TABLES:
+            for name, day in list_partitions(parent):
+                print(f"{parent}\t{name}\t{day}")
+    elif args.cmd == "restore":
+        print(f"restored {restore_archive(args.path)} rows")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""Центральная очередь исходящих сообщений бота.
+
+Все send_message идут через неё: общий лимит Telegram на бота (~30 сообщений в
+секунду, бюджет send из common.ratelimit, общий с другими процессами через
+Redis), не чаще одного сообщения в секунду в один чат, а FloodWait ставит на
+паузу всю очередь, а не только один воркер. Сообщения одного чата уходят в
+порядке постановки (куски длинного дайджеста не перемешиваются).
+"""
+import os
+import time
+import asyncio
+import logging
+from collections import defaultdict
+
+from .metrics import FLOOD_WAIT_SECONDS, SEND_QUEUE_DEPTH, TELEGRAM_RPC_TOTAL
+from .ratelimit import RateLimiter, create_rate_limiter
+from .tgclient import FloodWait
+
+logger = logging.getLogger(__name__)
+
+SEND_CHAT_INTERVAL = float(os.getenv("SEND_CHAT_INTERVAL", "1.0"))  # секунд между сообщениями в один чат
+SEND_WORKERS = int(os.getenv("SEND_WORKERS", "16"))
+SEND_MAX_FLOOD_RETRIES = 3
+CHAT_STATE_SWEEP = 60.0  # сек между чистками состояния чатов без отправок
+
+
+class SendQueue:
+    def __init__(self, client, limiter: RateLimiter = None,
+                 chat_interval: float = SEND_CHAT_INTERVAL, workers: int = SEND_WORKERS):
+        self.client = client
+        self.limiter = limiter or create_rate_limiter()
+        self.chat_interval = chat_interval
+        self.workers = workers
+        self.queue = asyncio.Queue()
+        self.chat_locks = defaultdict(asyncio.Lock)
+        self.chat_next_at = {}
+        # Сообщений чата, взятых воркерами: держат лок или ждут его
+        self.chat_pending = defaultdict(int)
+        self.paused_until = 0.0
+        self.flood_wait_total = 0.0
+        self.swept_at = time.monotonic()
+        self._tasks = []
+
+    def _ensure_workers(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def send(self, chat_id: int, text: str, **kwargs):
+        """Поставить сообщение в очередь и дождаться отправки (исключение пробрасывается вызывающему)"""
+        self._ensure_workers()
+        fut = asyncio.get_running_loop().create_future()
+        await self.queue.put((chat_id, text, kwargs, fut))
+        SEND_QUEUE_DEPTH.set(self.queue.qsize())
+        return await fut
+
+    async def _wait_for_slot(self, chat_id: int):
+        while True:
+            now = time.monotonic()
+            wait = max(self.paused_until, self.chat_next_at.get(chat_id, 0.0)) - now
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+        await self.limiter.acquire("send")
+
+    async def _deliver(self, chat_id: int, text: str, kwargs):
+        for attempt in range(SEND_MAX_FLOOD_RETRIES + 1):
+            await self._wait_for_slot(chat_id)
+            try:
+                result = await self.client.send_message(chat_id=chat_id, text=text, **kwargs)
+                TELEGRAM_RPC_TOTAL.labels("send_message", "ok").inc()
+                return result
+            except FloodWait as e:
+                TELEGRAM_RPC_TOTAL.labels("send_message", "flood_wait").inc()
+                FLOOD_WAIT_SECONDS.labels("send_message").inc(e.value)
+                logger.warning(f"FloodWait {e.value}s while sending to {chat_id}, pausing send queue")
+                # Пауза нужна и после последней попытки: иначе следующие сообщения упрутся в тот же FloodWait
+                self.flood_wait_total += e.value
+                self.paused_until = max(self.paused_until, time.monotonic() + e.value)
+                await self.limiter.penalize("send", e.value)
+                if attempt == SEND_MAX_FLOOD_RETRIES:
+                    raise
+            except Exception:
+                TELEGRAM_RPC_TOTAL.labels("send_message", "error").inc()
+                raise
+            finally:
+                self.chat_next_at[chat_id] = time.monotonic() + self.chat_interval
+
+    def _sweep(self):
+        """Забыть чаты, у которых нет отправки в работе и интервал уже прошёл: иначе словари растут без конца"""
+        now = time.monotonic()
+        self.swept_at = now
+        for chat_id in [c for c, at in self.chat_next_at.items() if at <= now]:
+            if self.chat_pending.get(chat_id):
+                continue
+            del self.chat_next_at[chat_id]
+            self.chat_locks.pop(chat_id, None)
+
+    async def _worker(self):
+        while True:
+            chat_id, text, kwargs, fut = await self.queue.get()
+            SEND_QUEUE_DEPTH.set(self.queue.qsize())
+            self.chat_pending[chat_id] += 1
+            try:
+                # Лок чата захватывается сразу после get, без await между ними — порядок FIFO сохраняется
+                async with self.chat_locks[chat_id]:
+                    try:
+                        result = await self._deliver(chat_id, text, kwargs)
+                        if not fut.done():
+                            fut.set_result(result)
+                    except Exception as exc:
+                        if not fut.done():
+                            fut.set_exception(exc)
+                    finally:
+                        self.queue.task_done()
+            finally:
+                self.chat_pending[chat_id] -= 1
+                if not self.chat_pending[chat_id]:
+                    del self.chat_pending[chat_id]
+            if time.monotonic() - self.swept_at >= CHAT_STATE_SWEEP:
+                self._sweep()
@@ -0,0 +1,82 @@
+import os
+import math
+import socket
+from sqlalchemy import text
+from .db import async_session_scope
+
+READER_SHARDS = int(os.getenv("READER_SHARDS", "1"))  # на сколько шардов делим каналы
+LEASE_TTL = int(os.getenv("READER_LEASE_TTL", "60"))  # секунд до истечения аренды без heartbeat
+
+def default_node_id() -> str:
+    return os.getenv("READER_NODE_ID") or f"{socket.gethostname()}-{os.getpid()}"
+
+async def assign_channel_shards(num_shards: int = READER_SHARDS, new_only: bool = False):
+    """Шард канала = id % num_shards; трогаем только строки, где он не совпадает.
+
+    new_only — только каналы без шарда (по индексу idx_channels_shard): так
+    heartbeat не сканирует всю таблицу, а полный пересчёт нужен лишь при старте,
+    когда могло смениться число шардов.
+    """
+    where = "shard IS NULL" if new_only else "shard IS DISTINCT FROM mod(id, :n)"
+    async with async_session_scope() as s:
+        await s.execute(text(f"UPDATE channels SET shard = mod(id, :n) WHERE {where}"), {'n': num_shards})
+
+async def heartbeat(node_id: str, num_shards: int = READER_SHARDS, ttl: int = LEASE_TTL):
+    """Продлить аренду своих шардов и перебалансировать их между живыми ридерами.
+
+    Каждый ридер держит не больше ceil(num_shards / живых ридеров) шардов:
+    лишние отпускает, недостающие забирает из свободных или просроченных.
+    Шарды умершего ридера освобождаются по истечении ttl.
+    Продление — отдельная короткая транзакция: перебалансировка её не задерживает.
+    Возвращает отсортированный список своих шардов.
+    """
+    params = {'node': node_id, 'n': num_shards, 'ttl': ttl}
+    async with async_session_scope() as s:
+        await s.execute(text("""
+            INSERT INTO reader_nodes (node_id, heartbeat_at) VALUES (:node, NOW())
+            ON CONFLICT (node_id) DO UPDATE SET heartbeat_at = NOW()
+        """), params)
+        owned = (await s.execute(text("""
+            UPDATE shard_leases SET expires_at = NOW() + make_interval(secs => :ttl)
+            WHERE owner = :node AND shard < :n
+            RETURNING shard
+        """), params)).scalars().all()
+    owned = sorted(owned)
+
+    async with async_session_scope() as s:
+        await s.execute(text("DELETE FROM reader_nodes WHERE heartbeat_at < NOW() - make_interval(secs => :ttl)"), params)
+        await s.execute(text("""
+            INSERT INTO shard_leases (shard) SELECT generate_series(0, :n - 1)
+            ON CONFLICT (shard) DO NOTHING
+        """), params)
+
+        live = (await s.execute(text("SELECT COUNT(*) FROM reader_nodes"))).scalar() or 1
+        fair = math.ceil(num_shards / live)
+
+        if len(owned) > fair:
+            excess = owned[fair:]
+            await s.execute(text("""
+                UPDATE shard_leases SET owner = NULL, expires_at = NULL
+                WHERE owner = :node AND shard = ANY(:excess)
+            """), {**params, 'excess': excess})
+            owned = owned[:fair]
+        elif len(owned) < fair:
+            claimed = (await s.execute(text("""
+                UPDATE shard_leases SET owner = :node, expires_at = NOW() + make_interval(secs => :ttl)
+                WHERE shard IN (
+                    SELECT shard FROM shard_leases
+                    WHERE shard < :n AND (owner IS NULL OR expires_at < NOW())
+                    ORDER BY shard
+                    LIMIT :k
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING shard
+            """), {**params, 'k': fair - len(owned)})).scalars().all()
+            owned = sorted(owned + list(claimed))
+        return owned
+
+async def release_shards(node_id: str):
+    """Отпустить шарды при штатной остановке, чтобы их сразу подхватили другие"""
+    async with async_session_scope() as s:
+        await s.execute(text("UPDATE shard_leases SET owner = NULL, expires_at = NULL WHERE owner = :node"), {'node': node_id})
+        await s.execute(text("DELETE FROM reader_nodes WHERE node_id = :node"), {'node': node_id})
@@ -0,0 +1,23 @@
+import math
+from typing import Dict, Iterable
+
+
+def percentile(values: Iterable[float], q: float) -> float:
+    """Перцентиль методом ближайшего ранга, q в диапазоне 0..100"""
+    data = sorted(values)
+    if not data:
+        return 0.0
+    rank = max(1, math.ceil(q / 100 * len(data)))
+    return float(data[min(rank, len(data)) - 1])
+
+
+def describe(values: Iterable[float]) -> Dict[str, float]:
+    """Сводка по задержкам: count/p50/p90/p99/max"""
+    data = sorted(values)
+    return {
+        'count': len(data),
+        'p50': percentile(data, 50),
+        'p90': percentile(data, 90),
+        'p99': percentile(data, 99),
+        'max': float(data[-1]) if data else 0.0,
+    }
@@ -1,30 +1,13 @@
 import os
 import logging
+from hashlib import sha256
 from typing import List, Tuple, Dict, Optional
 
-try:
-    import google.generativeai as genai
-except ImportError:  # pragma: no cover
-    genai = None  # type: ignore
+from .cache import TTLCache, get_redis
+from .llm import MODEL_NAME, LLMError, get_client
 
 logger = logging.getLogger(__name__)
 
-API_KEY = os.getenv("GEMINI_API_KEY")
-MODEL_NAME = os.getenv("LLM_MODEL", "gemini-1.5-flash")
-model = None
-if API_KEY and genai:
-    try:
-        genai.configure(api_key=API_KEY)
-        model = genai.GenerativeModel(MODEL_NAME)
-    except Exception as exc:  # pragma: no cover
-        logger.warning("LLM disabled: failed to init Gemini client: %s", exc)
-        model = None
-else:
-    if not API_KEY:
-        logger.info("LLM disabled: GEMINI_API_KEY not set")
-    if not genai:
-        logger.info("LLM disabled: google-generativeai package missing")
-
 PROMPT = """Ты — опытный контент-редактор. Сделай дайджест строго по формату:
 
 ⚡ Новости к этому часу
@@ -38,40 +21,160 @@ PROMPT = """Ты — опытный контент-редактор. Сдела
 {content}
 """
 
+SUMMARY_PROMPT = """Ты — опытный контент-редактор. Перескажи пост из Telegram-канала в 1–2 предложениях: только суть, без эмодзи, хэштегов и ссылок.
+Если это реклама или пост не по теме (искусственный интеллект/технологии) — верни строку: ПРОПУСТИТЬ.
+
+Пост:
+{text}
+"""
+SUMMARY_SKIP = "ПРОПУСТИТЬ"
+SUMMARY_INPUT_LIMIT = 2000  # символов поста в промпте
+SUMMARY_MAX_LEN = 400
+
+# Версия промпта меняется вместе с текстом PROMPT — старые записи кэша перестают совпадать
+PROMPT_VERSION = sha256(PROMPT.encode("utf-8")).hexdigest()[:12]
+DIGEST_CACHE_TTL = int(os.getenv("DIGEST_CACHE_TTL", "3600"))
+DIGEST_CACHE_SIZE = int(os.getenv("DIGEST_CACHE_SIZE", "256"))
+DIGEST_MAX_ITEMS = 10  # пунктов в одном дайджесте
+_digest_cache = TTLCache(maxsize=DIGEST_CACHE_SIZE, ttl=DIGEST_CACHE_TTL)
+
+
+def digest_cache_key(items: List[Dict[str, str]]) -> str:
+    """Ключ по упорядоченному набору text_hash (и ссылок — они попадают в текст дайджеста) + модель и промпт"""
+    llm = get_client()
+    parts = [llm.name if llm else "", MODEL_NAME, PROMPT_VERSION]
+    for it in items:
+        th = it.get("text_hash") or sha256((it.get("text") or "").lower().encode("utf-8")).hexdigest()
+        parts.append(f"{th}|{it.get('link') or ''}")
+    return "digest:" + sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+async def _cache_get(key: str) -> Optional[str]:
+    txt = _digest_cache.get(key)
+    if txt is not None:
+        return txt
+    client = get_redis()
+    if client is None:
+        return None
+    try:
+        raw = await client.get(key)
+    except Exception as exc:
+        logger.warning("Digest cache: Redis get failed: %s", exc)
+        return None
+    if raw is None:
+        return None
+    txt = raw.decode("utf-8")
+    _digest_cache.set(key, txt)
+    return txt
+
+
+async def _cache_set(key: str, txt: str):
+    _digest_cache.set(key, txt)
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        await client.set(key, txt.encode("utf-8"), ex=DIGEST_CACHE_TTL)
+    except Exception as exc:
+        logger.warning("Digest cache: Redis set failed: %s", exc)
+
+
+def _title(it: Dict[str, str]) -> str:
+    return next((line for line in (it.get("text") or "").strip().splitlines() if line.strip()), "")[:120]
+
+
+def _extractive_summary(text_value: str) -> str:
+    """Без LLM: первые предложения после заголовка, до SUMMARY_MAX_LEN символов"""
+    lines = [line.strip() for line in (text_value or "").strip().splitlines() if line.strip()]
+    body = " ".join(lines[1:] or lines)
+    if len(body) <= SUMMARY_MAX_LEN:
+        return body
+    cut = body[:SUMMARY_MAX_LEN]
+    return cut[:cut.rfind(". ") + 1] if ". " in cut else cut.rstrip() + "…"
+
+
+async def summarize_message(text_value: str) -> Optional[str]:
+    """Краткая суть одного поста для дайджеста.
+
+    "" — пост не для дайджеста (реклама/офтоп), None — LLM не ответил, стоит повторить позже.
+    """
+    llm = get_client()
+    if not llm:
+        return _extractive_summary(text_value)
+    prompt = SUMMARY_PROMPT.format(text=(text_value or "")[:SUMMARY_INPUT_LIMIT])
+    try:
+        txt = await llm.generate(prompt, temperature=0.2)
+    except LLMError as exc:
+        logger.warning("LLM summary failed (%s)", exc)
+        return None
+    if not txt:
+        return None
+    if txt.upper().startswith(SUMMARY_SKIP):
+        return ""
+    return txt[:SUMMARY_MAX_LEN]
+
+
+def compose_digest(items: List[Dict[str, str]]) -> str:
+    """Дайджест из готовых summary сообщений — без вызова LLM"""
+    lines = ["⚡ Новости к этому часу", ""]
+    for it in items:
+        title = _title(it) or "Без названия"
+        url = it.get("link") or ""
+        head = f"[{title}]({url})" if url else title
+        lines.append(f"- {head} — {it['summary']}")
+    return "\n".join(lines).strip()
+
+
 def _fallback_digest(items: List[Dict[str, str]]) -> str:
     lines = ["⚡ Новости к этому часу", ""]
     for idx, it in enumerate(items, 1):
-        title = (it.get("text") or "").strip().split("\n")[0][:120] or "Без названия"
+        title = _title(it) or "Без названия"
         url = it.get("link") or ""
         bullet = f"{idx}. [{title}]({url})" if url else f"{idx}. {title}"
         lines.append(bullet)
     return "\n".join(lines).strip()
 
 
-def build_digest(items: List[Dict[str, str]]) -> Tuple[Optional[str], str]:
+def digest_items(items: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """Пункты, которые попадут в дайджест: без отбракованных суммаризатором, не больше DIGEST_MAX_ITEMS"""
+    # summary == "" — суммаризатор при ингесте признал пост рекламой/офтопом
+    return [it for it in items if it.get("summary") != ""][:DIGEST_MAX_ITEMS]
+
+
+async def build_digest(items: List[Dict[str, str]]) -> Tuple[Optional[str], str]:
+    items = digest_items(items)
     if not items:
         return None, "empty"
 
-    items = items[:10]
+    if all(it.get("summary") for it in items):
+        return compose_digest(items), "summary"
+
     fallback = _fallback_digest(items)
 
-    if len(items) < 3 or not model:
+    llm = get_client()
+    if len(items) < 3 or not llm:
         return fallback, "fallback"
 
+    # Одинаковый набор новостей у разных подписчиков — один вызов LLM
+    cache_key = digest_cache_key(items)
+    cached = await _cache_get(cache_key)
+    if cached:
+        return cached, "cache"
+
     prompt = PROMPT.format(
         content="\n\n".join(
-            f"- [{next((line for line in (it.get('text') or '').strip().splitlines() if line), '')[:120]}]({it.get('link') or ''})\n{(it.get('text') or '')[:300]}"
+            f"- [{_title(it)}]({it.get('link') or ''})\n{(it.get('text') or '')[:300]}"
             for it in items
         )
     )
 
     try:
-        resp = model.generate_content(prompt, generation_config={"temperature": 0.25})
-        txt = (getattr(resp, "text", None) or "").strip()
+        txt = await llm.generate(prompt, temperature=0.25)
         if txt:
+            await _cache_set(cache_key, txt)
             return txt, "llm"
         logger.warning("LLM returned empty response, using fallback")
-    except Exception as exc:
+    except LLMError as exc:
         logger.warning("LLM call failed (%s), using fallback", exc)
         return fallback, "error"
 
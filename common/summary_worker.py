@@ -0,0 +1,54 @@
+"""Фоновая суммаризация новых сообщений: один вызов LLM на уникальный text_hash.
+
+Готовые summary лежат рядом со строками messages, и дайджест собирается из
+них без LLM — стоимость растёт с числом уникальных постов, а не подписчиков.
+Воркер запущен в каждом ридере: тексты захватываются в БД (миграция
+0011_summary_claims), так что шарды не суммаризируют одно и то же.
+"""
+import os
+import asyncio
+import logging
+
+from .models_async import claim_unsummarized, copy_known_summaries, store_summaries
+from .summarize import summarize_message
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "4"))  # одновременных вызовов LLM
+SUMMARY_BATCH = int(os.getenv("SUMMARY_BATCH", "50"))  # text_hash за один проход
+SUMMARY_IDLE_SLEEP = float(os.getenv("SUMMARY_IDLE_SLEEP", "10"))  # пауза, когда суммаризировать нечего
+
+
+async def summarize_pending(semaphore: asyncio.Semaphore) -> int:
+    """Один проход: суммаризировать до SUMMARY_BATCH текстов, вернуть сколько обработано"""
+    pending = await claim_unsummarized(SUMMARY_BATCH)
+    if not pending:
+        return 0
+    known = await copy_known_summaries([h for h, _ in pending])
+    todo = [(h, t) for h, t in pending if h not in known]
+
+    async def one(text_hash, text_value):
+        async with semaphore:
+            return text_hash, await summarize_message(text_value)
+
+    results = await asyncio.gather(*(one(h, t) for h, t in todo))
+    summaries = {h: s for h, s in results if s is not None}
+    await store_summaries(summaries)
+    if todo:
+        logger.info(
+            f"Summarized {len(summaries)}/{len(todo)} messages "
+            f"({len(known)} reused, {sum(1 for s in summaries.values() if not s)} skipped as off-topic)"
+        )
+    return len(known) + len(summaries)
+
+
+async def run_summary_worker(concurrency: int = SUMMARY_CONCURRENCY):
+    semaphore = asyncio.Semaphore(concurrency)
+    while True:
+        try:
+            done = await summarize_pending(semaphore)
+        except Exception:
+            logger.exception("Summary worker pass failed")
+            done = 0
+        if not done:
+            await asyncio.sleep(SUMMARY_IDLE_SLEEP)
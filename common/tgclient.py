@@ -0,0 +1,407 @@
+"""Клиент Telegram для ридера и бота: настоящий Pyrogram или локальный фейк.
+
+TELEGRAM_CLIENT=fake подменяет Client на FakeClient: каналы и их посты
+генерируются (или проигрываются из записи) с заданной скоростью, RPC получают
+задержку и случайный FloodWait, исходящие send_message складываются в
+client.sent. Так весь конвейер reader -> Postgres -> bot гоняется без сети
+(scripts/e2e_fake.py).
+
+Запись реального трафика: TELEGRAM_RECORD=traffic.jsonl у ридера сохраняет
+каждый полученный пост; FAKE_TG_REPLAY=traffic.jsonl проигрывает его в фейке.
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from collections import Counter, deque
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+try:
+    from pyrogram import Client as PyrogramClient
+    from pyrogram.enums import ChatType
+    from pyrogram.errors import FloodWait
+except ImportError:  # pragma: no cover
+    PyrogramClient = ChatType = None  # type: ignore
+
+    class FloodWait(Exception):  # type: ignore[no-redef]
+        """Замена pyrogram.errors.FloodWait, когда pyrogram не установлен"""
+
+        def __init__(self, value: int = 0):
+            super().__init__(f"A wait of {value} seconds is required")
+            self.value = value
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_CLIENT = os.getenv("TELEGRAM_CLIENT", "pyrogram")  # pyrogram | fake
+TELEGRAM_RECORD = os.getenv("TELEGRAM_RECORD")  # JSONL, куда писать полученные посты
+FAKE_TG_REPLAY = os.getenv("FAKE_TG_REPLAY")  # JSONL записанного трафика; без него посты генерируются
+FAKE_TG_RATE = float(os.getenv("FAKE_TG_RATE", "20"))  # новых постов в секунду на все каналы
+FAKE_TG_BACKLOG = int(os.getenv("FAKE_TG_BACKLOG", "20"))  # постов в канале к моменту первого get_chat
+FAKE_TG_LATENCY = float(os.getenv("FAKE_TG_LATENCY", "0.05"))  # средняя задержка RPC, сек
+FAKE_TG_FLOOD_RATE = float(os.getenv("FAKE_TG_FLOOD_RATE", "0"))  # вероятность FloodWait на любой RPC
+FAKE_TG_FLOOD_SECONDS = int(os.getenv("FAKE_TG_FLOOD_SECONDS", "3"))
+FAKE_TG_SEND_LIMIT = int(os.getenv("FAKE_TG_SEND_LIMIT", "30"))  # send_message в секунду, дальше — FloodWait
+FAKE_TG_SEED = int(os.getenv("FAKE_TG_SEED", "0"))
+PUMP_INTERVAL = 0.1  # как часто фейк выпускает новые посты в обработчики апдейтов
+
+FAKE_CHAT_BASE = -1_000_000_000_000  # id каналов фейка: FAKE_CHAT_BASE - номер
+
+_WORDS = (
+    "нейросеть модель обучение датасет OpenAI Anthropic Gemini LLM агент бенчмарк GPU релиз API "
+    "сегодня компания представила новую версию которая работает быстрее и стоит дешевле пользователи "
+    "отмечают что качество ответов выросло а разработчики обещают обновления исследование статья"
+).split()
+
+
+# ---------- Объекты, похожие на pyrogram.types ----------
+class FakeChat(NamedTuple):
+    id: int
+    username: Optional[str]
+    type: object = ChatType.CHANNEL if ChatType else "channel"
+
+
+class FakeMessage(NamedTuple):
+    id: int
+    chat: Optional[FakeChat] = None
+    date: Optional[datetime] = None
+    text: Optional[str] = None
+    empty: bool = False
+
+
+class SentMessage(NamedTuple):
+    chat_id: int
+    text: str
+    kwargs: dict
+    at: float
+
+
+# ---------- Источники трафика ----------
+class FakeChannel:
+    def __init__(self, chat: FakeChat):
+        self.chat = chat
+        self.posts: List[FakeMessage] = []
+
+
+class FakeTraffic(ABC):
+    """Каналы фейка и выпуск постов со скоростью rate в секунду.
+
+    Посты выпускаются лениво: при каждом обращении добавляется столько, сколько
+    должно было выйти с момента старта. Дата поста — момент выпуска минус
+    случайный возраст из age_range (сек): в окно дайджеста, обрезанное до
+    начала часа, свежие посты иначе не попадают.
+    """
+
+    def __init__(self, rate: float = FAKE_TG_RATE, age_range: Tuple[float, float] = (0.0, 0.0),
+                 seed: int = FAKE_TG_SEED):
+        self.rate = rate
+        self.age_range = age_range
+        self.rng = random.Random(seed)
+        self.channels: Dict[str, FakeChannel] = {}
+        self.by_id: Dict[int, FakeChannel] = {}
+        self.order: List[str] = []
+        self.started_at: Optional[float] = None
+        self.released = 0
+
+    def add_channel(self, handle: str) -> FakeChannel:
+        handle = handle.lstrip("@").lower()
+        if handle not in self.channels:
+            ch = FakeChannel(FakeChat(FAKE_CHAT_BASE - len(self.order) - 1, handle))
+            self.channels[handle] = ch
+            self.by_id[ch.chat.id] = ch
+            self.order.append(handle)
+        return self.channels[handle]
+
+    def channel(self, handle: str) -> Optional[FakeChannel]:
+        return self.channels.get(handle.lstrip("@").lower())
+
+    @abstractmethod
+    def _next_post(self) -> Optional[Tuple[str, str]]:
+        """(handle, text) следующего поста; None — трафик закончился"""
+
+    def _publish(self, handle: str, text: str, now: float) -> FakeMessage:
+        ch = self.add_channel(handle)
+        age = self.rng.uniform(*self.age_range)
+        msg = FakeMessage(
+            id=len(ch.posts) + 1,
+            chat=ch.chat,
+            date=datetime.fromtimestamp(now - age, timezone.utc),
+            text=text,
+        )
+        ch.posts.append(msg)
+        return msg
+
+    def advance(self, now: float = None) -> List[FakeMessage]:
+        """Выпустить посты, которые должны были выйти к now; возвращает новые"""
+        now = time.time() if now is None else now
+        if self.started_at is None:
+            self.started_at = now
+        due = int((now - self.started_at) * self.rate) - self.released
+        published = []
+        for _ in range(max(due, 0)):
+            post = self._next_post()
+            if post is None:
+                break
+            published.append(self._publish(*post, now))
+            self.released += 1
+        return published
+
+
+class GeneratedTraffic(FakeTraffic):
+    """Синтетические посты по известным каналам; популярные каналы (первые) пишут чаще.
+
+    Канал появляется при первом get_chat, сразу с backlog старых постов.
+    """
+
+    def __init__(self, handles=(), backlog: int = FAKE_TG_BACKLOG, skew: float = 1.1, **kwargs):
+        super().__init__(**kwargs)
+        self.backlog = backlog
+        self.skew = skew
+        for handle in handles:
+            self.add_channel(handle)
+
+    def add_channel(self, handle: str) -> FakeChannel:
+        known = handle.lstrip("@").lower() in self.channels
+        ch = super().add_channel(handle)
+        if not known:
+            now = time.time()
+            for _ in range(self.backlog):
+                self._publish(ch.chat.username, self.text(), now)
+        return ch
+
+    def text(self) -> str:
+        words = self.rng.choices(_WORDS, k=self.rng.randint(10, 40))
+        return " ".join(words).capitalize() + "."
+
+    def _next_post(self):
+        if not self.order:
+            return None
+        # Номер канала по степенному закону: первый канал пишет чаще всех
+        while True:
+            i = int(self.rng.paretovariate(self.skew)) - 1
+            if i < len(self.order):
+                return self.order[i], self.text()
+
+
+class ReplayTraffic(FakeTraffic):
+    """Записанные посты (JSONL с полями channel и text) в исходном порядке.
+
+    id постов перенумеровываются подряд внутри канала: ридер листает id
+    страницами, и дыры в записи выглядели бы как голова канала.
+    """
+
+    def __init__(self, path: str, **kwargs):
+        super().__init__(**kwargs)
+        self.records: Iterator = iter(self._load(path))
+
+    def _load(self, path: str):
+        posts = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    rec = json.loads(line)
+                    posts.append((rec["channel"], rec["text"]))
+        for handle in dict.fromkeys(h for h, _ in posts):
+            self.add_channel(handle)
+        logger.info(f"Replaying {len(posts)} recorded posts from {path}")
+        return posts
+
+    def _next_post(self):
+        return next(self.records, None)
+
+
+# ---------- Клиенты ----------
+class FakeClient:
+    """Подмена pyrogram.Client в пределах того, что вызывают reader и bot.
+
+    Фильтры обработчиков не проверяются: посты каналов уходят в обработчики,
+    добавленные через add_handler (ридер), команды бота через on_message
+    фейк не присылает.
+    """
+
+    def __init__(self, name: str, traffic: FakeTraffic = None, latency: float = FAKE_TG_LATENCY,
+                 flood_rate: float = FAKE_TG_FLOOD_RATE, flood_seconds: int = FAKE_TG_FLOOD_SECONDS,
+                 send_limit: int = FAKE_TG_SEND_LIMIT, seed: int = FAKE_TG_SEED, **_pyrogram_kwargs):
+        self.name = name
+        self.traffic = traffic if traffic is not None else default_traffic()
+        self.latency = latency
+        self.flood_rate = flood_rate
+        self.flood_seconds = flood_seconds
+        self.send_limit = send_limit
+        self.rng = random.Random(seed)
+        self.loop = asyncio.get_event_loop()
+        self.me = FakeChat(0, name.rsplit("/", 1)[-1])
+        self.handlers = []
+        self.command_handlers = []
+        self.sent: List[SentMessage] = []
+        self.rpc_calls = Counter()
+        self.flood_waits = Counter()
+        self._send_times = deque()
+        self._pump_task = None
+        self.is_connected = False
+
+    # --- жизненный цикл ---
+    async def start(self):
+        self.is_connected = True
+        self._pump_task = asyncio.create_task(self._pump())
+        return self
+
+    async def stop(self):
+        self.is_connected = False
+        if self._pump_task:
+            self._pump_task.cancel()
+            await asyncio.gather(self._pump_task, return_exceptions=True)
+            self._pump_task = None
+        return self
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    def run(self):
+        async def forever():
+            async with self:
+                await asyncio.Event().wait()
+        self.loop.run_until_complete(forever())
+
+    # --- обработчики ---
+    def add_handler(self, handler, group: int = 0):
+        self.handlers.append(handler)
+        return handler, group
+
+    def on_message(self, filters=None, group: int = 0):
+        def decorator(func):
+            self.command_handlers.append((filters, func))
+            return func
+        return decorator
+
+    async def _pump(self):
+        callbacks = [h.callback for h in self.handlers if type(h).__name__ == "MessageHandler"]
+        while True:
+            for msg in self.traffic.advance():
+                for callback in callbacks:
+                    await callback(self, msg)
+            await asyncio.sleep(PUMP_INTERVAL)
+
+    # --- RPC ---
+    async def _rpc(self, method: str):
+        self.rpc_calls[method] += 1
+        if self.latency > 0:
+            await asyncio.sleep(self.rng.expovariate(1.0 / self.latency))
+        if self.flood_rate and self.rng.random() < self.flood_rate:
+            self.flood_waits[method] += 1
+            raise FloodWait(value=self.flood_seconds)
+
+    async def get_chat(self, chat_id):
+        await self._rpc("get_chat")
+        if isinstance(chat_id, int):
+            ch = self.traffic.by_id.get(chat_id)
+        elif isinstance(self.traffic, GeneratedTraffic):
+            ch = self.traffic.add_channel(chat_id)
+        else:
+            ch = self.traffic.channel(chat_id)
+        if ch is None:
+            raise ValueError(f"Chat {chat_id} not found in fake traffic")
+        return ch.chat
+
+    async def get_messages(self, chat_id, message_ids):
+        await self._rpc("get_messages")
+        self.traffic.advance()
+        ch = self.traffic.by_id.get(chat_id)
+        ids = [message_ids] if isinstance(message_ids, int) else list(message_ids)
+        posts = ch.posts if ch else []
+        result = [posts[i - 1] if 0 < i <= len(posts) else FakeMessage(id=i, empty=True) for i in ids]
+        return result[0] if isinstance(message_ids, int) else result
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await self._rpc("send_message")
+        now = time.monotonic()
+        while self._send_times and now - self._send_times[0] >= 1.0:
+            self._send_times.popleft()
+        if len(self._send_times) >= self.send_limit:
+            self.flood_waits["send_message"] += 1
+            raise FloodWait(value=1)
+        self._send_times.append(now)
+        self.sent.append(SentMessage(chat_id, text, kwargs, time.time()))
+        return FakeMessage(id=len(self.sent), chat=FakeChat(chat_id, None), date=datetime.now(timezone.utc), text=text)
+
+
+class TrafficRecorder:
+    """Обёртка над клиентом: посты из get_messages и из апдейтов дописываются в JSONL для FAKE_TG_REPLAY.
+
+    Пост, пришедший апдейтом и потом догруженный по ID, пишется один раз.
+    """
+
+    def __init__(self, client, path: str):
+        self._client = client
+        self._file = open(path, "a", encoding="utf-8")
+        self._seen = set()
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    async def __aenter__(self):
+        await self._client.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc):
+        self._file.close()
+        return await self._client.__aexit__(*exc)
+
+    def _record(self, messages, chat_id=None):
+        for msg in messages:
+            if not msg or msg.empty or not msg.text:
+                continue
+            key = (getattr(msg.chat, "id", chat_id), msg.id)
+            if key in self._seen:
+                continue
+            self._seen.add(key)
+            self._file.write(json.dumps({
+                "channel": getattr(msg.chat, "username", None) or str(key[0]),
+                "id": msg.id,
+                "date": msg.date.isoformat() if msg.date else None,
+                "text": msg.text,
+            }, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def add_handler(self, handler, group: int = 0):
+        """Апдейты MessageHandler записываются до передачи исходному обработчику"""
+        if type(handler).__name__ == "MessageHandler":
+            callback = handler.callback
+
+            async def recording(client, message):
+                self._record([message])
+                return await callback(client, message)
+
+            handler.callback = recording
+        return self._client.add_handler(handler, group)
+
+    async def get_messages(self, chat_id, message_ids):
+        result = await self._client.get_messages(chat_id, message_ids)
+        self._record(result if isinstance(result, list) else [result], chat_id)
+        return result
+
+
+def default_traffic() -> FakeTraffic:
+    if FAKE_TG_REPLAY:
+        return ReplayTraffic(FAKE_TG_REPLAY)
+    return GeneratedTraffic()
+
+
+def create_client(name: str, **kwargs):
+    """Client по TELEGRAM_CLIENT; kwargs — параметры pyrogram.Client (фейк их игнорирует)"""
+    if TELEGRAM_CLIENT == "fake":
+        logger.info(f"Using fake Telegram client for {name}")
+        client = FakeClient(name)
+    elif TELEGRAM_CLIENT == "pyrogram":
+        client = PyrogramClient(name, **kwargs)
+    else:
+        raise ValueError(f"Unknown TELEGRAM_CLIENT={TELEGRAM_CLIENT!r}")
+    if TELEGRAM_RECORD:
+        client = TrafficRecorder(client, TELEGRAM_RECORD)
+    return client
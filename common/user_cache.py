@@ -0,0 +1,120 @@
+"""Кэш пользователей и подписок в процессе бота.
+
+Команды бота читают строку пользователя и список его каналов из памяти.
+Записи сбрасываются по NOTIFY bot_cache из триггеров миграции
+0009_cache_invalidation — от любого процесса, включая ручной UPDATE, — и
+сразу после собственных записей бота. Пока соединение LISTEN не поднято,
+кэш не используется; после переподключения он очищается: пропущенные
+уведомления не восстановить.
+
+next_digest_at в закэшированной строке может отставать: его двигает
+планировщик, уведомлений на это нет, а командам поле не нужно.
+"""
+import os
+import asyncio
+import logging
+
+import asyncpg
+
+from .cache import TTLCache
+from .db import async_engine
+from .metrics import USER_CACHE_REQUESTS
+from .models_async import get_user_by_tg, list_user_channels, upsert_user
+
+logger = logging.getLogger(__name__)
+
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))  # пользователей в каждом из кэшей
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "600"))  # сек; страховка от потерянного уведомления
+CACHE_CHANNEL = "bot_cache"
+LISTEN_KEEPALIVE = 30.0  # сек между проверками соединения LISTEN
+LISTEN_RETRY_MAX = 60.0  # сек, потолок паузы между переподключениями
+
+
+def _listen_dsn() -> str:
+    # Тот же адрес, что у async_engine, но для asyncpg напрямую
+    return async_engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+class UserCache:
+    def __init__(self, maxsize: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL):
+        self.users = TTLCache(maxsize, ttl)
+        self.channels = TTLCache(maxsize, ttl)
+        self.listening = False
+        # Растёт при каждом сбросе: чтение, начатое до сброса, не кладёт в кэш устаревшее
+        self._generation = 0
+
+    async def _cached(self, name: str, cache: TTLCache, tg_id: int, load):
+        if self.listening:
+            value = cache.get(tg_id)
+            if value is not None:
+                USER_CACHE_REQUESTS.labels(name, "hit").inc()
+                return value
+        USER_CACHE_REQUESTS.labels(name, "miss" if self.listening else "bypass").inc()
+        generation = self._generation
+        value = await load(tg_id)
+        if value is not None and self.listening and generation == self._generation:
+            cache.set(tg_id, value)
+        return value
+
+    async def get_user(self, tg_id: int):
+        return await self._cached("user", self.users, tg_id, get_user_by_tg)
+
+    async def ensure_user(self, tg_id: int):
+        """Строка пользователя; если его нет — создать"""
+        user = await self.get_user(tg_id)
+        if user is None:
+            await upsert_user(tg_id)
+            user = await self.get_user(tg_id)
+        return user
+
+    async def list_channels(self, tg_id: int) -> list:
+        return list(await self._cached("channels", self.channels, tg_id, list_user_channels))
+
+    def invalidate(self, tg_id: int, user: bool = True, channels: bool = True):
+        self._generation += 1
+        if user:
+            self.users.pop(tg_id)
+        if channels:
+            self.channels.pop(tg_id)
+
+    def clear(self):
+        self._generation += 1
+        self.users.clear()
+        self.channels.clear()
+
+    def _on_notify(self, conn, pid, channel, payload: str):
+        kind, _, tg_id = payload.partition(":")
+        try:
+            tg_id = int(tg_id)
+        except ValueError:
+            logger.warning(f"Unexpected {CACHE_CHANNEL} payload: {payload!r}")
+            return
+        # user: — и строка, и подписки: удаление пользователя уносит их каскадом
+        self.invalidate(tg_id, user=kind == "user")
+
+    async def listen(self):
+        """Фоновая задача: держит LISTEN и переподключается с растущей паузой"""
+        delay = 1.0
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(_listen_dsn())
+                await conn.add_listener(CACHE_CHANNEL, self._on_notify)
+                self.clear()
+                self.listening = True
+                delay = 1.0
+                logger.info(f"User cache listening on {CACHE_CHANNEL}")
+                while True:
+                    await asyncio.sleep(LISTEN_KEEPALIVE)
+                    await asyncio.wait_for(conn.fetchval("SELECT 1"), timeout=LISTEN_KEEPALIVE)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"User cache LISTEN lost, retrying in {delay:.0f}s: {e}")
+            finally:
+                self.listening = False
+                self.clear()
+                if conn is not None and not conn.is_closed():
+                    conn.terminate()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, LISTEN_RETRY_MAX)
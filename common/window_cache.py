@@ -0,0 +1,69 @@
+"""Кэш окон каналов на один тик планировщика.
+
+Окно каждого канала читается из Postgres один раз за тик, сколько бы
+пользователей на него ни было подписано; лента пользователя собирается
+слиянием уже отсортированных списков его каналов. Чтения из БД растут с
+числом каналов, а не подписок.
+"""
+import heapq
+from itertools import islice
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from .models import WINDOW_LIMIT
+from .models_async import get_subscribed_channels, get_channel_window_messages
+
+
+class WindowRow(NamedTuple):
+    """Только поля, нужные для дайджеста"""
+    msg_date: object
+    channel_id: int
+    link: Optional[str]
+    text: Optional[str]
+    text_hash: Optional[str]
+    simhash: Optional[int]
+    summary: Optional[str]
+    relevance: Optional[float]
+
+
+def _by_date(row: WindowRow):
+    return row.msg_date
+
+
+class ChannelWindowCache:
+    def __init__(self, limit: int = WINDOW_LIMIT):
+        self.limit = limit
+        self._subscriptions: Dict[int, List[int]] = {}
+        # (start, end) -> channel_id -> строки по убыванию msg_date
+        self._windows: Dict[Tuple, Dict[int, List[WindowRow]]] = {}
+        self.channel_loads = 0
+
+    async def prefetch(self, user_windows: Dict[int, Tuple]):
+        """Загрузить подписки и окна каналов для {user_id: (start, end)}, которых ещё нет в кэше"""
+        new_users = [u for u in user_windows if u not in self._subscriptions]
+        if new_users:
+            self._subscriptions.update(await get_subscribed_channels(new_users))
+
+        needed: Dict[Tuple, set] = {}
+        for user_id, window in user_windows.items():
+            loaded = self._windows.get(window, {})
+            needed.setdefault(window, set()).update(
+                c for c in self._subscriptions.get(user_id, ()) if c not in loaded
+            )
+        for (start, end), channel_ids in needed.items():
+            if not channel_ids:
+                continue
+            windows = self._windows.setdefault((start, end), {})
+            for c in channel_ids:
+                windows[c] = []
+            for row in await get_channel_window_messages(channel_ids, start, end, self.limit):
+                windows[row.channel_id].append(WindowRow(
+                    row.msg_date, row.channel_id, row.link, row.text, row.text_hash, row.simhash, row.summary, row.relevance,
+                ))
+            self.channel_loads += len(channel_ids)
+
+    async def user_items(self, user_id: int, start, end) -> List[WindowRow]:
+        """Свежие сообщения из каналов пользователя за окно, как USER_WINDOW_MESSAGES_SQL"""
+        await self.prefetch({user_id: (start, end)})
+        windows = self._windows.get((start, end), {})
+        lists = [windows[c] for c in self._subscriptions.get(user_id, ()) if windows.get(c)]
+        return list(islice(heapq.merge(*lists, key=_by_date, reverse=True), self.limit))
@@ -1,10 +1,22 @@
+import time
+PROCESS_STARTED = time.monotonic()  # отсчёт холодного старта — до тяжёлых импортов
 import os, asyncio, pytz, logging
 # TODO(refactor): remove legacy reader once services/ingest/app/worker.py replaces channel polling.
 from datetime import datetime, timedelta
-from pyrogram import Client
+from pyrogram import filters
+from pyrogram.handlers import DisconnectHandler, MessageHandler
 from sqlalchemy import text
-from common.db import run_migrations, session_scope
-from common.models import add_messages
+from common.db import run_migrations, async_session_scope
+from common.tgclient import FloodWait, create_client
+from common.ratelimit import create_rate_limiter
+from common.models_async import store_ingest_batch
+from common.sharding import LEASE_TTL, assign_channel_shards, default_node_id, heartbeat, release_shards
+from common.stats import describe
+from common.summary_worker import run_summary_worker
+from common.metrics import (
+    FLOOD_WAIT_SECONDS, READER_CYCLE_SECONDS, READER_FETCH_SECONDS, READER_POLL_LAG_SECONDS, READER_QUEUE_DEPTH,
+    TELEGRAM_RPC_SECONDS, TELEGRAM_RPC_TOTAL, StartupTimer, monitor_event_loop, start_metrics_server,
+)
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -14,138 +26,494 @@ API_ID = int(os.getenv("TELEGRAM_API_ID"))
 API_HASH = os.getenv("TELEGRAM_API_HASH")
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 TZ = pytz.timezone(os.getenv("TZ", "Europe/Amsterdam"))
-CYCLE_PAUSE = 300  # 5 минут между проверками
+READER_MODE = os.getenv("READER_MODE", "poll")  # poll — периодический опрос, push — апдейты Telegram + догрузка пропусков
+RESYNC_DELAY = 5  # секунд после разрыва соединения до догрузки пропусков
+POLL_CONCURRENCY = int(os.getenv("READER_CONCURRENCY", "8"))  # одновременных опросов каналов
+POLL_MIN_INTERVAL = int(os.getenv("READER_POLL_MIN", "60"))  # самый частый опрос активного канала
+POLL_MAX_INTERVAL = int(os.getenv("READER_POLL_MAX", "3600"))  # самый редкий опрос «спящего» канала
+POLL_DEFAULT_INTERVAL = 300  # 5 минут для канала без истории
+CHANNELS_REFRESH = 60  # как часто перечитывать список каналов из БД
+STATS_REPORT_INTERVAL = 300  # как часто логировать статистику опроса
+FLUSH_SIZE = int(os.getenv("READER_FLUSH_SIZE", "500"))  # сообщений в одной записи в БД
+FLUSH_INTERVAL = float(os.getenv("READER_FLUSH_INTERVAL", "5"))  # максимум секунд до записи
+SUMMARY_WORKER = os.getenv("SUMMARY_WORKER", "1") == "1"  # суммаризация новых сообщений в фоне
+QUEUE_SIZE = 1000  # результатов опроса в очереди до записи (backpressure для фетчеров)
+FETCH_BATCH = 200  # максимум ID в одном get_messages
+MAX_PAGES_PER_CYCLE = int(os.getenv("READER_MAX_PAGES", "10"))  # страниц на канал за цикл
+NEW_CHANNEL_BACKFILL = int(os.getenv("READER_BACKFILL", "400"))  # ID до головы, с которых начинается новый канал
+GAP_PROBE_INTERVAL = int(os.getenv("READER_GAP_PROBE_INTERVAL", "3600"))  # не чаще раза в столько секунд на канал
+HEAD_PROBE_MAX_ID = 2 ** 31  # верхняя граница сетки поиска головы канала
+METRICS_DEFAULT_PORT = 9101
 
-# Создаем клиент для чтения каналов
-client = Client(
+# Создаем клиент для чтения каналов (TELEGRAM_CLIENT=fake — локальный фейк для нагрузочных прогонов)
+client = create_client(
     "channel_reader",
     api_id=API_ID,
     api_hash=API_HASH,
     bot_token=BOT_TOKEN,
 )
+# Бюджет чтения общий с ботом (тот же BOT_TOKEN) через Redis
+rate_limiter = create_rate_limiter()
+startup = StartupTimer("reader", PROCESS_STARTED)
+startup.mark("imports")
 
-def fetch_channels():
-    with session_scope() as s:
-        rows = s.execute(text("SELECT id, handle, last_msg_id FROM channels WHERE status='active' ORDER BY id"))
+async def fetch_channels(shards):
+    if not shards:
+        return []
+    async with async_session_scope() as s:
+        rows = await s.execute(text("""
+            SELECT c.id, c.handle, c.last_msg_id, c.last_checked_at
+            FROM channels c
+            WHERE c.status='active' AND c.shard = ANY(CAST(:shards AS INTEGER[]))
+            ORDER BY c.id
+        """), {'shards': list(shards)})
         return [dict(r._mapping) for r in rows]
 
-def update_last_msg_id(channel_id: int, last_id: int):
-    with session_scope() as s:
-        s.execute(text("UPDATE channels SET last_msg_id=:m, last_checked_at=NOW() WHERE id=:c"), {'m': last_id, 'c': channel_id})
+async def fetch_msgs_24h(channel_ids):
+    """Сообщений за сутки по каналам — только для стартового интервала новых в шарде каналов.
+
+    stats_hourly считает сообщения по всей системе, а не по каналу, поэтому
+    здесь счёт по idx_messages_channel_date; для уже известных каналов
+    интервал подстраивает сам опрос.
+    """
+    if not channel_ids:
+        return {}
+    async with async_session_scope() as s:
+        rows = await s.execute(text("""
+            SELECT channel_id, COUNT(*) FROM messages
+            WHERE channel_id = ANY(CAST(:c AS INTEGER[])) AND msg_date > NOW() - INTERVAL '24 hours'
+            GROUP BY channel_id
+        """), {'c': list(channel_ids)})
+        return dict(rows.all())
+
+# Кэш handle -> chat.id, чтобы не вызывать get_chat на каждом цикле
+_chat_ids = {}
+
+async def resolve_chat_id(handle: str):
+    if handle not in _chat_ids:
+        await rate_limiter.acquire("read")
+        started = time.monotonic()
+        try:
+            chat = await client.get_chat(f"@{handle}")
+        except FloodWait as e:
+            TELEGRAM_RPC_TOTAL.labels("get_chat", "flood_wait").inc()
+            FLOOD_WAIT_SECONDS.labels("get_chat").inc(e.value)
+            await rate_limiter.penalize("read", e.value)
+            raise
+        except Exception:
+            TELEGRAM_RPC_TOTAL.labels("get_chat", "error").inc()
+            raise
+        TELEGRAM_RPC_TOTAL.labels("get_chat", "ok").inc()
+        TELEGRAM_RPC_SECONDS.labels("get_chat").observe(time.monotonic() - started)
+        if not chat:
+            return None
+        _chat_ids[handle] = chat.id
+    return _chat_ids[handle]
+
+async def get_messages_batch(chat_id, message_ids):
+    """Один RPC на диапазон ID (до FETCH_BATCH штук), с ожиданием при FloodWait"""
+    while True:
+        await rate_limiter.acquire("read")
+        started = time.monotonic()
+        try:
+            result = await client.get_messages(chat_id, message_ids)
+        except FloodWait as e:
+            TELEGRAM_RPC_TOTAL.labels("get_messages", "flood_wait").inc()
+            FLOOD_WAIT_SECONDS.labels("get_messages").inc(e.value)
+            logger.warning(f"FloodWait {e.value}s on get_messages for chat {chat_id}")
+            # Пауза общая: следующий acquire ждёт её окончания в этом и других процессах
+            await rate_limiter.penalize("read", e.value)
+            continue
+        except Exception:
+            TELEGRAM_RPC_TOTAL.labels("get_messages", "error").inc()
+            raise
+        TELEGRAM_RPC_TOTAL.labels("get_messages", "ok").inc()
+        TELEGRAM_RPC_SECONDS.labels("get_messages").observe(time.monotonic() - started)
+        return result
+
+def head_probe_ids(low: int, high: int):
+    """До FETCH_BATCH ID от low до high: геометрическая сетка, если диапазон широкий, иначе линейная"""
+    if high - low < FETCH_BATCH:
+        return list(range(low, high + 1))
+    ratio = (high - low + 1) ** (1 / (FETCH_BATCH - 1))
+    return sorted({low + int(ratio ** i) - 1 for i in range(FETCH_BATCH)})
+
+async def probe_head(chat_id, low: int, refine: bool = False) -> int:
+    """Максимальный существующий ID не ниже low или 0 (бот не может читать историю — только ID).
+
+    Один RPC по геометрической сетке до HEAD_PROBE_MAX_ID находит нижнюю
+    оценку головы с точностью ~11%; refine — второй RPC по линейной сетке
+    между найденным ID и следующим узлом сетки.
+    """
+    ids = head_probe_ids(low, HEAD_PROBE_MAX_ID)
+    found = [m.id for m in (await get_messages_batch(chat_id, ids) or []) if m and not m.empty]
+    if not found or not refine:
+        return max(found, default=0)
+    head = max(found)
+    upper = next((i for i in ids if i > head), head)
+    if upper - head > 1:
+        found += [m.id for m in (await get_messages_batch(chat_id, head_probe_ids(head + 1, upper - 1)) or [])
+                  if m and not m.empty]
+    return max(found)
+
+def message_to_row(channel, handle, message):
+    return {
+        'channel_id': channel['id'],
+        'tg_message_id': message.id,
+        'msg_date': message.date.astimezone(TZ),
+        'link': f"https://t.me/{handle}/{message.id}",
+        'text': message.text,
+    }
 
 async def fetch_channel_messages(channel):
-    """Получение сообщений канала через Telegram API"""
+    """Получение новых сообщений канала пачками ID до головы канала.
+
+    Возвращает (messages, last_seen_id, complete): last_seen_id — максимальный
+    существующий ID, включая сообщения без текста, чтобы курсор не застревал;
+    complete — голова канала достигнута, а не исчерпан MAX_PAGES_PER_CYCLE.
+    Новый канал (курсор 0) начинается с NEW_CHANNEL_BACKFILL ID до головы, а
+    не с ID 1. Пустая страница — либо голова канала, либо FETCH_BATCH и больше
+    удалённых подряд: если probe_head находит сообщения дальше, курсор
+    переходит за пустую страницу. Ошибки не глотаются: poll_channel
+    откладывает следующий опрос и пишет outcome="error".
+    """
     handle = channel['handle'].lstrip('@')
-    last_msg_id = channel.get('last_msg_id', 0)
-    
+    last_msg_id = channel.get('last_msg_id') or 0
+
     logger.info(f"Fetching messages from @{handle} (last_msg_id: {last_msg_id})")
-    
-    try:
-        # Получаем информацию о канале
-        chat = await client.get_chat(f"@{handle}")
-        if not chat:
-            logger.error(f"Could not access channel @{handle}")
-            return []
-            
-        messages = []
-        
-        # Получаем последние сообщения из канала
-        # Используем get_messages вместо get_chat_history
+
+    chat_id = await resolve_chat_id(handle)
+    if not chat_id:
+        raise RuntimeError(f"Could not access channel @{handle}")
+
+    messages = []
+    last_seen_id = last_msg_id
+    # Известная нижняя оценка головы канала: пустые страницы до неё — пропуск, а не конец
+    known_head = channel.get('known_head', 0)
+    if not last_msg_id and time.time() - channel.get('gap_probed_at', 0) >= GAP_PROBE_INTERVAL:
+        channel['gap_probed_at'] = time.time()
+        known_head = await probe_head(chat_id, 1, refine=True)
+        last_seen_id = max(0, known_head - NEW_CHANNEL_BACKFILL)
+        logger.info(f"New channel @{handle}: head ~{known_head}, starting from {last_seen_id + 1}")
+    start_id = last_seen_id + 1
+    probed = False
+    complete = False
+
+    # Листаем страницы по FETCH_BATCH ID, пока не догоним голову канала
+    # или не упрёмся в лимит страниц за цикл
+    for _ in range(MAX_PAGES_PER_CYCLE):
+        page_end = start_id + FETCH_BATCH - 1
+        batch = await get_messages_batch(chat_id, list(range(start_id, page_end + 1)))
+        existing = [m for m in (batch or []) if m and not m.empty]
+        if not existing:
+            if known_head <= page_end and not probed and \
+                    time.time() - channel.get('gap_probed_at', 0) >= GAP_PROBE_INTERVAL:
+                probed = True
+                channel['gap_probed_at'] = time.time()
+                known_head = max(known_head, await probe_head(chat_id, page_end + 1))
+            if known_head <= page_end:
+                complete = True
+                break
+            # Дальше есть сообщения — вся страница удалена, курсор за неё
+            logger.info(f"Skipping empty IDs {start_id}-{page_end} in @{handle} (head >= {known_head})")
+            last_seen_id = page_end
+            start_id += FETCH_BATCH
+            continue
+        for message in existing:
+            last_seen_id = max(last_seen_id, message.id)
+            if message.text:
+                messages.append(message_to_row(channel, handle, message))
+        # Страница заполнена не до конца — голова канала внутри неё
+        if last_seen_id < page_end and known_head <= page_end:
+            complete = True
+            break
+        start_id += FETCH_BATCH
+    channel['known_head'] = max(known_head, last_seen_id)
+
+    logger.info(f"Found {len(messages)} new messages from @{handle}")
+    return messages, last_seen_id, complete
+
+def clamp_interval(seconds: float) -> float:
+    return max(POLL_MIN_INTERVAL, min(POLL_MAX_INTERVAL, seconds))
+
+def initial_interval(msgs_24h: int) -> float:
+    """Интервал из темпа за сутки: в среднем ~1 новое сообщение на опрос"""
+    if not msgs_24h:
+        return clamp_interval(POLL_DEFAULT_INTERVAL * 4)
+    return clamp_interval(86400 / msgs_24h)
+
+def next_interval(interval: float, new_messages: int) -> float:
+    """Активный канал опрашиваем чаще, пустой опрос — откладываем следующий"""
+    if new_messages == 0:
+        return clamp_interval(interval * 1.5)
+    return clamp_interval(interval / min(new_messages, 4))
+
+class IngestWriter:
+    """Потребитель очереди результатов опроса.
+
+    Фетчеры кладут (channel_id, messages, last_seen_id) в очередь, писатель
+    копит их и сбрасывает в БД по FLUSH_SIZE сообщений или раз в FLUSH_INTERVAL
+    секунд. Сообщения и last_msg_id коммитятся одной транзакцией.
+    """
+
+    def __init__(self):
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.buffer = []
+        self.cursors = {}
+        self.first_buffered_at = None
+
+    async def put(self, channel_id: int, messages, last_seen_id: int):
+        await self.queue.put((channel_id, messages, last_seen_id))
+        READER_QUEUE_DEPTH.set(self.queue.qsize())
+
+    def _flush_due(self) -> bool:
+        if len(self.buffer) >= FLUSH_SIZE:
+            return True
+        return self.first_buffered_at is not None and time.monotonic() - self.first_buffered_at >= FLUSH_INTERVAL
+
+    async def flush(self) -> bool:
+        if not self.buffer and not self.cursors:
+            return True
         try:
-            # Пытаемся получить сообщения начиная с последнего известного ID
-            start_id = last_msg_id + 1 if last_msg_id > 0 else 1
-            end_id = start_id + 50  # Получаем до 50 сообщений
-            
-            # Получаем сообщения по ID
-            for msg_id in range(start_id, end_id):
+            saved = await store_ingest_batch(self.buffer, self.cursors)
+        except Exception:
+            logger.exception(f"Failed to store {len(self.buffer)} messages, will retry")
+            return False
+        if self.buffer:
+            logger.info(
+                f"Saved {saved['inserted']} new messages ({saved['duplicates']} duplicates) "
+                f"from {len(self.cursors)} channels"
+            )
+        self.buffer, self.cursors = [], {}
+        self.first_buffered_at = None
+        return True
+
+    async def run(self):
+        try:
+            while True:
+                timeout = FLUSH_INTERVAL
+                if self.first_buffered_at is not None:
+                    timeout = max(0.0, FLUSH_INTERVAL - (time.monotonic() - self.first_buffered_at))
                 try:
-                    message = await client.get_messages(chat.id, msg_id)
-                    if message and message.text:
-                        # Создаем ссылку на сообщение
-                        link = f"https://t.me/{handle}/{message.id}"
-                        
-                        # Конвертируем дату в нужный часовой пояс
-                        msg_date = message.date.astimezone(TZ)
-                        
-                        messages.append({
-                            'channel_id': channel['id'],
-                            'tg_message_id': message.id,
-                            'msg_date': msg_date,
-                            'link': link,
-                            'text': message.text
-                        })
-                except Exception:
-                    # Если сообщение не найдено, пропускаем
-                    continue
-                    
-        except Exception as e:
-            logger.warning(f"Could not fetch messages by ID from @{handle}: {e}")
-            # Fallback: попробуем получить последние сообщения другим способом
+                    channel_id, messages, last_seen_id = await asyncio.wait_for(self.queue.get(), timeout)
+                    READER_QUEUE_DEPTH.set(self.queue.qsize())
+                    self.buffer.extend(messages)
+                    self.cursors[channel_id] = max(self.cursors.get(channel_id, 0), last_seen_id)
+                    if self.first_buffered_at is None:
+                        self.first_buffered_at = time.monotonic()
+                except asyncio.TimeoutError:
+                    pass
+                if self._flush_due() and not await self.flush():
+                    await asyncio.sleep(FLUSH_INTERVAL)
+        finally:
+            await self.flush()
+
+class ChannelPoller:
+    """Планировщик опроса каналов с ограничением конкурентности.
+
+    У каждого канала своё время следующего опроса: стартовое берётся из
+    channels.last_checked_at и темпа сообщений за сутки, дальше интервал
+    подстраивается по результату каждого опроса.
+
+    В push-режиме новые посты приходят апдейтами, а опрос нужен только для
+    догрузки пропусков от channels.last_msg_id: один раз на старте, после
+    переподключения и для новых каналов. Пока канал не догружен, апдейты
+    пишутся без сдвига курсора, чтобы не перепрыгнуть пропуск.
+    """
+
+    def __init__(self, writer: IngestWriter, push: bool = False, concurrency: int = POLL_CONCURRENCY):
+        self.writer = writer
+        self.push = push
+        self.synced = set()
+        self.by_handle = {}
+        self.shards = []
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.state = {}  # channel_id -> {'channel', 'interval', 'next_poll_at'}
+        self.in_flight = set()
+        self.tasks = set()
+        self.refreshed_at = 0.0
+        self.lags = []
+        self.fetch_durations = []
+        self.polls = 0
+        self.new_messages = 0
+        self.reported_at = time.monotonic()
+
+    def set_shards(self, shards):
+        if shards != self.shards:
+            logger.info(f"Owned shards changed: {self.shards} -> {shards}")
+            self.shards = shards
+            self.refreshed_at = 0.0
+
+    async def refresh_channels(self):
+        channels = await fetch_channels(self.shards)
+        msgs_24h = await fetch_msgs_24h([ch['id'] for ch in channels if ch['id'] not in self.state])
+        now = time.time()
+        active = {ch['id'] for ch in channels}
+        for ch in channels:
+            st = self.state.get(ch['id'])
+            if st:
+                # Курсор в памяти может быть новее, чем в БД
+                ch['last_msg_id'] = max(ch.get('last_msg_id') or 0, st['channel'].get('last_msg_id') or 0)
+                for key in ('known_head', 'gap_probed_at'):
+                    if key in st['channel']:
+                        ch[key] = st['channel'][key]
+                st['channel'] = ch
+                continue
+            interval = initial_interval(msgs_24h.get(ch['id'], 0))
+            checked = ch.get('last_checked_at')
+            next_poll_at = checked.timestamp() + interval if checked and not self.push else now
+            self.state[ch['id']] = {'channel': ch, 'interval': interval, 'next_poll_at': min(next_poll_at, now + interval)}
+        for cid in list(self.state):
+            if cid not in active:
+                del self.state[cid]
+                self.synced.discard(cid)
+        self.by_handle = {st['channel']['handle'].lstrip('@').lower(): st for st in self.state.values()}
+        self.refreshed_at = time.monotonic()
+        logger.info(f"Found {len(channels)} active channels to poll in shards {self.shards}")
+
+    def due_channels(self, now: float):
+        return [
+            st for cid, st in self.state.items()
+            if cid not in self.in_flight and st['next_poll_at'] <= now
+        ]
+
+    def seconds_until_next(self, now: float) -> float:
+        pending = [st['next_poll_at'] for cid, st in self.state.items() if cid not in self.in_flight]
+        if not pending:
+            return CHANNELS_REFRESH
+        return max(0.0, min(min(pending) - now, CHANNELS_REFRESH))
+
+    async def poll_channel(self, st):
+        ch = st['channel']
+        async with self.semaphore:
+            started = time.time()
+            self.lags.append(started - st['next_poll_at'])
+            READER_POLL_LAG_SECONDS.observe(max(0.0, started - st['next_poll_at']))
+            next_poll_at = None
+            outcome = "ok"
             try:
-                # Получаем последние сообщения через get_messages без указания ID
-                recent_messages = await client.get_messages(chat.id, limit=20)
-                for message in recent_messages:
-                    if message and message.id > last_msg_id and message.text:
-                        # Создаем ссылку на сообщение
-                        link = f"https://t.me/{handle}/{message.id}"
-                        
-                        # Конвертируем дату в нужный часовой пояс
-                        msg_date = message.date.astimezone(TZ)
-                        
-                        messages.append({
-                            'channel_id': channel['id'],
-                            'tg_message_id': message.id,
-                            'msg_date': msg_date,
-                            'link': link,
-                            'text': message.text
-                        })
-            except Exception as e2:
-                logger.error(f"Fallback method also failed for @{handle}: {e2}")
-                return []
-            
-        logger.info(f"Found {len(messages)} new messages from @{handle}")
-        return messages
-        
-    except Exception as e:
-        logger.error(f"Error fetching messages from @{handle}: {e}")
-        return []
+                messages, last_seen_id, complete = await fetch_channel_messages(ch)
+                await self.writer.put(ch['id'], messages, last_seen_id)
+                ch['last_msg_id'] = max(ch.get('last_msg_id') or 0, last_seen_id)
+                st['interval'] = next_interval(st['interval'], len(messages))
+                self.new_messages += len(messages)
+                if self.push and complete:
+                    # Пропуск догружен до головы, дальше канал живёт на апдейтах;
+                    # иначе апдейты сдвинули бы курсор через недогруженную дыру
+                    self.synced.add(ch['id'])
+                    next_poll_at = float('inf')
+                elif not complete:
+                    # Упёрлись в лимит страниц — дочитываем, не дожидаясь интервала
+                    next_poll_at = time.time() + POLL_MIN_INTERVAL
+            except Exception:
+                logger.exception(f"Polling @{ch['handle']} failed")
+                st['interval'] = clamp_interval(st['interval'] * 2)
+                outcome = "error"
+            finally:
+                self.polls += 1
+                self.fetch_durations.append(time.time() - started)
+                READER_FETCH_SECONDS.labels(outcome).observe(time.time() - started)
+                st['next_poll_at'] = next_poll_at or time.time() + st['interval']
+                self.in_flight.discard(ch['id'])
+
+    async def on_channel_post(self, _client, message):
+        username = getattr(message.chat, 'username', None)
+        st = self.by_handle.get((username or '').lower())
+        if not st:
+            return
+        ch = st['channel']
+        rows = [message_to_row(ch, username, message)] if message.text else []
+        if ch['id'] in self.synced:
+            ch['last_msg_id'] = max(ch.get('last_msg_id') or 0, message.id)
+            await self.writer.put(ch['id'], rows, message.id)
+        elif rows:
+            await self.writer.put(ch['id'], rows, 0)
+        self.new_messages += len(rows)
+
+    async def on_disconnect(self, _client):
+        """После переподключения апдейты могли потеряться — догружаем все каналы заново"""
+        logger.warning("Telegram connection lost, scheduling gap-fill for all channels")
+        self.synced.clear()
+        resync_at = time.time() + RESYNC_DELAY
+        for st in self.state.values():
+            st['next_poll_at'] = min(st['next_poll_at'], resync_at)
+
+    def report(self):
+        lag = describe(self.lags)
+        fetch = describe(self.fetch_durations)
+        intervals = [st['interval'] for st in self.state.values()]
+        logger.info(
+            f"Poll stats: {self.polls} polls, {self.new_messages} new messages, "
+            f"lag p50={lag['p50']:.1f}s p90={lag['p90']:.1f}s max={lag['max']:.1f}s, "
+            f"fetch p50={fetch['p50']:.2f}s p90={fetch['p90']:.2f}s, "
+            f"intervals min={min(intervals, default=0):.0f}s max={max(intervals, default=0):.0f}s"
+        )
+        self.lags, self.fetch_durations = [], []
+        self.polls = self.new_messages = 0
+        self.reported_at = time.monotonic()
+
+    async def run(self):
+        while True:
+            cycle_started = time.monotonic()
+            if time.monotonic() - self.refreshed_at >= CHANNELS_REFRESH:
+                try:
+                    await self.refresh_channels()
+                except Exception:
+                    logger.exception("Failed to refresh channel list")
+            for st in self.due_channels(time.time()):
+                self.in_flight.add(st['channel']['id'])
+                task = asyncio.create_task(self.poll_channel(st))
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+            if time.monotonic() - self.reported_at >= STATS_REPORT_INTERVAL:
+                self.report()
+            READER_CYCLE_SECONDS.observe(time.monotonic() - cycle_started)
+            await asyncio.sleep(max(1.0, self.seconds_until_next(time.time())))
+
+async def lease_shards(poller: ChannelPoller, node_id: str):
+    """Heartbeat аренды шардов: каждый ридер опрашивает только свои шарды каналов"""
+    while True:
+        try:
+            await assign_channel_shards(new_only=True)
+            poller.set_shards(await heartbeat(node_id))
+        except Exception:
+            logger.exception("Shard lease heartbeat failed")
+        await asyncio.sleep(LEASE_TTL / 3)
 
 async def main():
     run_migrations()
+    startup.mark("migrations")
+    start_metrics_server(METRICS_DEFAULT_PORT)
 
     logger.info("Reader service started with Telegram API")
 
-    async with client:
-        while True:
-            channels = fetch_channels()
-            logger.info(f"Found {len(channels)} active channels to poll")
+    writer = IngestWriter()
+    poller = ChannelPoller(writer, push=READER_MODE == "push")
+    if poller.push:
+        client.add_handler(MessageHandler(poller.on_channel_post, filters.channel))
+        client.add_handler(DisconnectHandler(poller.on_disconnect))
+        logger.info("Push mode: channel posts arrive as updates, polling only fills gaps")
 
-            if not channels:
-                logger.info("No channels to poll. Sleeping...")
-                await asyncio.sleep(CYCLE_PAUSE)
-                continue
+    node_id = default_node_id()
+    await assign_channel_shards()
+    poller.set_shards(await heartbeat(node_id))
+    startup.mark("shards")
 
-            all_messages = []
-
-            for ch in channels:
-                # Используем Telegram API для получения сообщений
-                messages = await fetch_channel_messages(ch)
-                if messages:
-                    all_messages.extend(messages)
-                    logger.info(f"Fetched {len(messages)} messages from @{ch['handle']}")
-                    
-                    # Обновляем last_msg_id для канала
-                    if messages:
-                        latest_id = max(msg['tg_message_id'] for msg in messages)
-                        update_last_msg_id(ch['id'], latest_id)
-
-            if all_messages:
-                # Сохраняем все сообщения в базу данных
-                add_messages(all_messages)
-                logger.info(f"Saved {len(all_messages)} messages to database")
-
-            logger.info(f"Completed fetching cycle. Sleeping for {CYCLE_PAUSE}s...")
-            await asyncio.sleep(CYCLE_PAUSE)
+    async with client:
+        startup.mark("connect")
+        startup.report()
+        writer_task = asyncio.create_task(writer.run())
+        lease_task = asyncio.create_task(lease_shards(poller, node_id))
+        background = [writer_task, lease_task, asyncio.create_task(monitor_event_loop())]
+        if SUMMARY_WORKER:
+            background.append(asyncio.create_task(run_summary_worker()))
+        try:
+            await poller.run()
+        finally:
+            for task in reversed(background):
+                task.cancel()
+            await asyncio.gather(*background, return_exceptions=True)
+            await release_shards(node_id)
 
 if __name__ == "__main__":
     asyncio.run(main())
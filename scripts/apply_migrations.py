@@ -0,0 +1,46 @@
+"""Применить миграции common/migrations (то же делают reader и bot при старте).
+
+    PYTHONPATH=. python scripts/apply_migrations.py
+    PYTHONPATH=. python scripts/apply_migrations.py --status
+"""
+import sys
+import logging
+import argparse
+
+from sqlalchemy import text
+
+from common.db import LEDGER_EXISTS_SQL, engine, load_migrations, run_migrations
+
+
+def status():
+    with engine.connect() as conn:
+        applied = {}
+        if conn.execute(LEDGER_EXISTS_SQL).scalar():
+            applied = {
+                r.version: r for r in conn.execute(text("SELECT version, checksum, applied_at FROM schema_migrations"))
+            }
+    for m in load_migrations():
+        row = applied.get(m.version)
+        if row is None:
+            state = "pending"
+        elif row.checksum != m.checksum:
+            state = "CHANGED"
+        else:
+            state = f"applied {row.applied_at:%Y-%m-%d %H:%M}"
+        print(f"{m.name:40s} {state}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--status", action="store_true", help="показать применённые и ожидающие миграции")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if args.status:
+        status()
+        return 0
+    print(f"applied {run_migrations()} migrations")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,305 @@
+"""Бенчмарк путей данных common.models на синтетической базе.
+
+Засевает Postgres пользователями, каналами (популярность по Zipf) и
+сообщениями, затем замеряет add_messages, get_user_window_messages,
+claim_due_users, list_user_channels, get_system_stats, окна каналов тика и
+ранжирование с дедупликацией из send_digest_to_user. Результат — JSON с
+параметрами прогона и перцентилями, его удобно сравнивать между коммитами:
+
+    PYTHONPATH=. python scripts/bench_models.py --users 5000 --channels 1000 --messages 200000
+    PYTHONPATH=. python scripts/bench_models.py --baseline reports/bench_models-old.json
+
+Только для отдельной базы: claim_due_users забирает всех просроченных
+пользователей, поэтому при чужих данных в users скрипт останавливается.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import subprocess
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from sqlalchemy import text
+
+from common.db import run_migrations, session_scope
+from common.stats import describe
+from common.dedup import group_near_duplicates
+from common.ranking import rank_users
+from common.window_cache import WindowRow
+from common.models import (
+    CLAIM_BATCH, WINDOW_LIMIT, add_messages, claim_due_users, get_channel_window_messages,
+    get_subscribed_channels, get_system_stats, get_user_window_messages, list_user_channels,
+)
+
+BENCH_TG_BASE = 9_000_000_000_000  # tg_id синтетических пользователей начинаются отсюда
+BENCH_HANDLE_PREFIX = "bench_"
+INGEST_BATCH = 200  # сообщений за вызов add_messages, как у пачки ридера
+
+TOPIC_WORDS = (
+    "нейросеть модель обучение датасет OpenAI Anthropic Gemini LLM агент бенчмарк GPU инференс "
+    "исследование алгоритм робот релиз API токены контекст векторный поиск статья arXiv"
+).split()
+FILLER_WORDS = (
+    "сегодня компания представила новую версию которая работает быстрее прошлой и стоит дешевле "
+    "пользователи отмечают что качество ответов заметно выросло а разработчики обещают обновления"
+).split()
+AD_TEXT = "#реклама Скидка 50% на курсы, переходите по ссылке и регистрируйтесь на бесплатный вебинар"
+
+SEED_USERS_SQL = text("""
+    INSERT INTO users (tg_id, digest_hours)
+    SELECT tg, ARRAY[9, 19] FROM unnest(CAST(:tg AS BIGINT[])) AS tg
+    ON CONFLICT (tg_id) DO NOTHING
+""")
+SEED_CHANNELS_SQL = text("""
+    INSERT INTO channels (handle, status) SELECT h, 'active' FROM unnest(CAST(:h AS TEXT[])) AS h
+    ON CONFLICT (handle) DO NOTHING
+""")
+SEED_SUBSCRIPTIONS_SQL = text("""
+    INSERT INTO subscriptions (user_id, channel_id)
+    SELECT u, c FROM unnest(CAST(:u AS INTEGER[]), CAST(:c AS INTEGER[])) AS v(u, c)
+    ON CONFLICT DO NOTHING
+""")
+BENCH_USERS_SQL = text("SELECT id, tg_id FROM users WHERE tg_id >= :base ORDER BY tg_id")
+CHANNELS_BY_HANDLE_SQL = text("""
+    SELECT c.id FROM unnest(CAST(:h AS TEXT[])) WITH ORDINALITY AS v(handle, n)
+    JOIN channels c ON c.handle = v.handle ORDER BY v.n
+""")
+FOREIGN_USERS_SQL = text("SELECT EXISTS (SELECT 1 FROM users WHERE tg_id < :base)")
+MAKE_USERS_DUE_SQL = text("UPDATE users SET next_digest_at = :t, digest_claimed_until = NULL WHERE tg_id >= :base")
+CLEANUP_USERS_SQL = text("DELETE FROM users WHERE tg_id >= :base")
+CLEANUP_CHANNELS_SQL = text("DELETE FROM channels WHERE left(handle, length(:p)) = :p")
+
+
+def zipf_weights(n: int, s: float) -> np.ndarray:
+    w = 1.0 / np.arange(1, n + 1) ** s
+    return w / w.sum()
+
+
+def synthetic_text(rng: random.Random) -> str:
+    words = rng.sample(TOPIC_WORDS, 4) + rng.choices(FILLER_WORDS, k=rng.randint(8, 40))
+    rng.shuffle(words)
+    return " ".join(words).capitalize() + "."
+
+
+def bench_handles(n: int):
+    return [f"{BENCH_HANDLE_PREFIX}{i:07d}" for i in range(n)]
+
+
+def seed(args, rng: random.Random, nprng: np.random.Generator, handles=None):
+    """Пользователи, каналы и подписки одним INSERT на таблицу; сообщения — отдельно, через add_messages.
+
+    handles — свои имена каналов (по умолчанию bench_NNNNNNN), популярность по их порядку.
+    """
+    handles = handles if handles is not None else bench_handles(args.channels)
+    with session_scope() as s:
+        s.execute(SEED_USERS_SQL, {'tg': [BENCH_TG_BASE + i for i in range(args.users)]})
+        s.execute(SEED_CHANNELS_SQL, {'h': handles})
+    with session_scope() as s:
+        users = s.execute(BENCH_USERS_SQL, {'base': BENCH_TG_BASE}).all()
+        channel_ids = s.execute(CHANNELS_BY_HANDLE_SQL, {'h': handles}).scalars().all()
+
+    # Число подписок у пользователя — геометрическое, выбор каналов — по Zipf: у топ-каналов тысячи подписчиков
+    popularity = zipf_weights(len(channel_ids), args.skew)
+    sub_users, sub_channels = [], []
+    for user in users:
+        n = min(len(channel_ids), int(nprng.geometric(1.0 / args.subs_per_user)))
+        for c in nprng.choice(len(channel_ids), size=n, replace=False, p=popularity):
+            sub_users.append(user.id)
+            sub_channels.append(channel_ids[c])
+    with session_scope() as s:
+        s.execute(SEED_SUBSCRIPTIONS_SQL, {'u': sub_users, 'c': sub_channels})
+    return users, channel_ids, len(sub_users)
+
+
+def synthetic_messages(args, rng: random.Random, nprng: np.random.Generator, channel_ids):
+    """Сообщения за последние args.hours часов; активность каналов тоже по Zipf, часть — репосты и реклама"""
+    now = datetime.now(timezone.utc)
+    activity = zipf_weights(len(channel_ids), args.skew)
+    next_id = {}
+    texts = []
+    for c in nprng.choice(len(channel_ids), size=args.messages, p=activity):
+        channel_id = channel_ids[c]
+        roll = rng.random()
+        if texts and roll < args.dup_rate:
+            body = rng.choice(texts) + rng.choice(("", " 🔥", " Подробнее по ссылке."))
+        elif roll < args.dup_rate + args.ad_rate:
+            body = AD_TEXT
+        else:
+            body = synthetic_text(rng)
+        texts.append(body)
+        next_id[channel_id] = next_id.get(channel_id, 0) + 1
+        yield {
+            'channel_id': channel_id,
+            'tg_message_id': next_id[channel_id],
+            'msg_date': now - timedelta(seconds=rng.uniform(0, args.hours * 3600)),
+            'link': f"https://t.me/c/{channel_id}/{next_id[channel_id]}",
+            'text': body,
+        }
+
+
+class Timings:
+    def __init__(self):
+        self.samples = {}
+        self.rows = {}
+
+    def run(self, name: str, fn, *args, rows=None, **kwargs):
+        started = time.perf_counter()
+        result = fn(*args, **kwargs)
+        self.samples.setdefault(name, []).append(time.perf_counter() - started)
+        if rows is not None:
+            self.rows[name] = self.rows.get(name, 0) + (rows(result) if callable(rows) else rows)
+        return result
+
+    def summary(self) -> dict:
+        out = {}
+        for name, values in self.samples.items():
+            total = sum(values)
+            stats = describe(values)
+            out[name] = {'count': stats.pop('count'), 'total_s': round(total, 4),
+                         'mean_ms': round(total / len(values) * 1000, 3)}
+            out[name].update({f"{k}_ms": round(v * 1000, 3) for k, v in stats.items()})
+            if name in self.rows:
+                out[name]['rows'] = self.rows[name]
+                out[name]['rows_per_s'] = round(self.rows[name] / total, 1) if total else None
+        return out
+
+
+def bench(args) -> dict:
+    rng = random.Random(args.seed)
+    nprng = np.random.default_rng(args.seed)
+    timings = Timings()
+
+    run_migrations()
+    with session_scope() as s:
+        if s.execute(FOREIGN_USERS_SQL, {'base': BENCH_TG_BASE}).scalar() and not args.force:
+            sys.exit("users has non-benchmark rows: point POSTGRES_DB at a scratch database or pass --force")
+        pg_version = s.execute(text("SELECT version()")).scalar()
+
+    seed_started = time.perf_counter()
+    users, channel_ids, subscriptions = seed(args, rng, nprng)
+    batch = []
+    for message in synthetic_messages(args, rng, nprng, channel_ids):
+        batch.append(message)
+        if len(batch) == INGEST_BATCH:
+            timings.run('add_messages', add_messages, batch, rows=len(batch))
+            batch = []
+    if batch:
+        timings.run('add_messages', add_messages, batch, rows=len(batch))
+    seed_seconds = time.perf_counter() - seed_started
+
+    now = datetime.now(timezone.utc)
+    start, end = now - timedelta(hours=args.window_hours), now
+    sample = rng.sample(users, min(args.samples, len(users)))
+    windows = {}
+    for user in sample:
+        windows[user.id] = timings.run(
+            'get_user_window_messages', get_user_window_messages, user.id, start, end, rows=len,
+        )
+        timings.run('list_user_channels', list_user_channels, user.tg_id, rows=len)
+    for _ in range(args.samples):
+        timings.run('get_system_stats', get_system_stats)
+
+    # Чтения тика планировщика: подписки пачки и окна всех их каналов
+    for i in range(0, len(sample), CLAIM_BATCH):
+        user_ids = [u.id for u in sample[i:i + CLAIM_BATCH]]
+        subs = timings.run('get_subscribed_channels', get_subscribed_channels, user_ids, rows=len)
+        channels = {c for cs in subs.values() for c in cs}
+        timings.run('get_channel_window_messages', get_channel_window_messages, list(channels), start, end,
+                    WINDOW_LIMIT, rows=len)
+
+    # Шаг дедупликации и ранжирования из send_digest_to_user
+    candidates = {
+        user_id: [WindowRow(r['msg_date'], r['channel_id'], r['link'], r['text'], r['text_hash'],
+                            r['simhash'], r['summary'], r['relevance']) for r in rows]
+        for user_id, rows in windows.items()
+    }
+    for items in candidates.values():
+        timings.run('group_near_duplicates', group_near_duplicates, items, rows=len(items))
+    timings.run('rank_users', rank_users, candidates, now, rows=sum(map(len, candidates.values())))
+
+    # Все синтетические пользователи просрочены — забираем пачками до конца, как тик планировщика
+    with session_scope() as s:
+        s.execute(MAKE_USERS_DUE_SQL, {'t': now - timedelta(minutes=1), 'base': BENCH_TG_BASE})
+    while timings.run('claim_due_users', claim_due_users, datetime.now(timezone.utc), rows=len):
+        pass
+
+    if not args.keep:
+        with session_scope() as s:
+            s.execute(CLEANUP_USERS_SQL, {'base': BENCH_TG_BASE})
+            s.execute(CLEANUP_CHANNELS_SQL, {'p': BENCH_HANDLE_PREFIX})
+
+    return {
+        'meta': {
+            'started_at': now.isoformat(),
+            'git_rev': git_rev(),
+            'python': platform.python_version(),
+            'postgres': pg_version,
+            'params': vars(args),
+            'dataset': {'users': len(users), 'channels': len(channel_ids), 'subscriptions': subscriptions,
+                        'messages': args.messages},
+            'seed_seconds': round(seed_seconds, 2),
+        },
+        'results': timings.summary(),
+    }
+
+
+def git_rev():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report: dict, baseline: dict) -> dict:
+    """p50/p99 текущего прогона относительно базового: < 1 — быстрее"""
+    deltas = {}
+    for name, cur in report['results'].items():
+        old = baseline.get('results', {}).get(name)
+        if not old:
+            continue
+        deltas[name] = {k: round(cur[k] / old[k], 3) if old[k] else None for k in ('p50_ms', 'p99_ms')}
+    return deltas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--channels", type=int, default=500)
+    parser.add_argument("--messages", type=int, default=50_000)
+    parser.add_argument("--subs-per-user", type=float, default=15, help="среднее число подписок")
+    parser.add_argument("--skew", type=float, default=1.1, help="показатель Zipf популярности каналов")
+    parser.add_argument("--dup-rate", type=float, default=0.1, help="доля репостов")
+    parser.add_argument("--ad-rate", type=float, default=0.05, help="доля рекламы")
+    parser.add_argument("--hours", type=float, default=48, help="разброс msg_date в прошлое")
+    parser.add_argument("--window-hours", type=float, default=12, help="окно дайджеста")
+    parser.add_argument("--samples", type=int, default=200, help="пользователей для замеров чтения")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default=None, help="путь к JSON (по умолчанию reports/bench_models-<время>.json)")
+    parser.add_argument("--baseline", default=None, help="JSON прошлого прогона для сравнения")
+    parser.add_argument("--keep", action="store_true", help="не удалять синтетические данные")
+    parser.add_argument("--force", action="store_true", help="запускать и при чужих пользователях в базе")
+    args = parser.parse_args(argv)
+
+    report = bench(args)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            report['vs_baseline'] = compare(report, json.load(f))
+
+    out = args.out or os.path.join("reports", f"bench_models-{datetime.now():%Y%m%dT%H%M%S}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+
+    for name, r in report['results'].items():
+        print(f"{name:30s} n={r['count']:<6d} p50={r['p50_ms']:9.2f}ms p99={r['p99_ms']:9.2f}ms"
+              + (f" {r['rows_per_s']:>10} rows/s" if r.get('rows_per_s') else ""))
+    print(f"written {out}")
+
+
+if __name__ == "__main__":
+    main()
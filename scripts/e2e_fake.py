@@ -0,0 +1,180 @@
+"""Сквозной нагрузочный прогон reader -> Postgres -> bot на фейковом Telegram.
+
+Засевает пользователей, каналы и подписки (как scripts/bench_models.py),
+запускает reader.main с FakeClient, который выпускает посты со скоростью
+--rate, затем делает всех пользователей просроченными и прогоняет тик
+планировщика бота. Итог — сообщений в секунду, записанных в БД, и
+дайджестов в секунду, доставленных в фейковый send_message:
+
+    PYTHONPATH=. python scripts/e2e_fake.py --users 1000 --channels 200 --rate 200 --duration 60
+    PYTHONPATH=. python scripts/e2e_fake.py --replay traffic.jsonl --flood-rate 0.01
+
+Нужна отдельная база (POSTGRES_*), LLM по умолчанию — мок.
+"""
+import os
+
+# До импорта reader/bot: клиенты и константы читаются из окружения при импорте
+os.environ.setdefault("TELEGRAM_CLIENT", "fake")
+os.environ.setdefault("TELEGRAM_API_ID", "1")
+os.environ.setdefault("TELEGRAM_API_HASH", "fake")
+os.environ.setdefault("BOT_TOKEN", "0:fake")
+os.environ.setdefault("LLM_MODE", "mock")
+os.environ.setdefault("METRICS_PORT", "0")
+os.environ.setdefault("READER_POLL_MIN", "1")
+os.environ.setdefault("READER_POLL_MAX", "10")
+os.environ.setdefault("READER_FLUSH_INTERVAL", "1")
+
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from sqlalchemy import text
+
+from common.db import run_migrations, session_scope
+from common.tgclient import GeneratedTraffic, ReplayTraffic
+from scripts.bench_models import (
+    BENCH_TG_BASE, CLEANUP_USERS_SQL, FOREIGN_USERS_SQL, MAKE_USERS_DUE_SQL, bench_handles, git_rev, seed,
+)
+import reader.main as reader
+import bot.main as bot
+
+# Возраст постов фейка: окно дайджеста заканчивается началом текущего часа
+POST_AGE_RANGE = (3600, 3 * 3600)
+
+COUNT_MESSAGES_SQL = text("""
+    SELECT COUNT(*) FROM messages m JOIN channels c ON c.id = m.channel_id
+    WHERE c.handle = ANY(CAST(:h AS TEXT[]))
+""")
+COUNT_DIGESTS_SQL = text("""
+    SELECT COUNT(*) FROM digests d JOIN users u ON u.id = d.user_id
+    WHERE u.tg_id >= :base AND d.created_at >= :since
+""")
+CLEANUP_CHANNELS_SQL = text("DELETE FROM channels WHERE handle = ANY(CAST(:h AS TEXT[]))")
+
+
+def count(sql, **params) -> int:
+    with session_scope() as s:
+        return s.execute(sql, params).scalar()
+
+
+async def run_ingest(traffic, handles, duration: float) -> dict:
+    """reader.main() на фейковом клиенте в течение duration секунд"""
+    reader.client.traffic = traffic
+    before = count(COUNT_MESSAGES_SQL, h=handles)
+    started = time.monotonic()
+    task = asyncio.create_task(reader.main())
+    await asyncio.sleep(duration)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)  # писатель сбрасывает буфер при остановке
+    seconds = time.monotonic() - started
+    ingested = count(COUNT_MESSAGES_SQL, h=handles) - before
+    return {
+        'seconds': round(seconds, 2),
+        'offered': sum(len(ch.posts) for ch in traffic.channels.values()),
+        'ingested': ingested,
+        'msgs_per_s': round(ingested / seconds, 1),
+        'rpc_calls': dict(reader.client.rpc_calls),
+        'flood_waits': dict(reader.client.flood_waits),
+    }
+
+
+async def run_dispatch() -> dict:
+    """Один тик планировщика по всем синтетическим пользователям"""
+    since = datetime.now(timezone.utc)
+    with session_scope() as s:
+        due = s.execute(MAKE_USERS_DUE_SQL, {'t': since - timedelta(minutes=1), 'base': BENCH_TG_BASE}).rowcount
+    sent_before = len(bot.bot.sent)
+    started = time.monotonic()
+    await bot.scheduler_tick()
+    await bot.send_queue.queue.join()
+    seconds = time.monotonic() - started
+    digests = count(COUNT_DIGESTS_SQL, base=BENCH_TG_BASE, since=since)
+    return {
+        'seconds': round(seconds, 2),
+        'users_due': due,
+        'digests': digests,
+        'digests_per_s': round(digests / seconds, 2),
+        'messages_sent': len(bot.bot.sent) - sent_before,
+        'rpc_calls': dict(bot.bot.rpc_calls),
+        'flood_waits': dict(bot.bot.flood_waits),
+        'send_queue_flood_wait_s': bot.send_queue.flood_wait_total,
+    }
+
+
+async def run(args) -> dict:
+    rng = random.Random(args.seed)
+    nprng = np.random.default_rng(args.seed)
+    run_migrations()
+    if count(FOREIGN_USERS_SQL, base=BENCH_TG_BASE) and not args.force:
+        sys.exit("users has non-benchmark rows: point POSTGRES_DB at a scratch database or pass --force")
+
+    traffic_kwargs = {'rate': args.rate, 'age_range': POST_AGE_RANGE, 'seed': args.seed}
+    if args.replay:
+        traffic = ReplayTraffic(args.replay, **traffic_kwargs)
+        handles = list(traffic.order)
+    else:
+        handles = bench_handles(args.channels)
+        traffic = GeneratedTraffic(handles, backlog=args.backlog, skew=args.skew, **traffic_kwargs)
+    for client in (reader.client, bot.bot):
+        client.latency, client.flood_rate = args.latency, args.flood_rate
+    _, _, subscriptions = seed(args, rng, nprng, handles)
+
+    try:
+        ingest = await run_ingest(traffic, handles, args.duration)
+        dispatch = await run_dispatch()
+    finally:
+        if not args.keep:
+            with session_scope() as s:
+                s.execute(CLEANUP_USERS_SQL, {'base': BENCH_TG_BASE})
+                s.execute(CLEANUP_CHANNELS_SQL, {'h': handles})
+    return {
+        'meta': {
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'git_rev': git_rev(),
+            'params': vars(args),
+            'dataset': {'users': args.users, 'channels': len(handles), 'subscriptions': subscriptions},
+        },
+        'ingest': ingest,
+        'dispatch': dispatch,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--channels", type=int, default=100)
+    parser.add_argument("--subs-per-user", type=float, default=10)
+    parser.add_argument("--skew", type=float, default=1.1, help="показатель Zipf популярности каналов")
+    parser.add_argument("--rate", type=float, default=100, help="постов в секунду на все каналы")
+    parser.add_argument("--backlog", type=int, default=20, help="постов в канале до старта")
+    parser.add_argument("--replay", default=None, help="JSONL записанного трафика (TELEGRAM_RECORD)")
+    parser.add_argument("--duration", type=float, default=30, help="секунд работы ридера")
+    parser.add_argument("--latency", type=float, default=0.05, help="средняя задержка RPC, сек")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="вероятность FloodWait на RPC")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default=None, help="путь к JSON (по умолчанию reports/e2e_fake-<время>.json)")
+    parser.add_argument("--keep", action="store_true", help="не удалять синтетические данные")
+    parser.add_argument("--force", action="store_true", help="запускать и при чужих пользователях в базе")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run(args))
+    out = args.out or os.path.join("reports", f"e2e_fake-{datetime.now():%Y%m%dT%H%M%S}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+
+    ingest, dispatch = report['ingest'], report['dispatch']
+    print(f"ingest:   {ingest['ingested']}/{ingest['offered']} messages in {ingest['seconds']}s "
+          f"= {ingest['msgs_per_s']} msgs/s, flood waits {ingest['flood_waits']}")
+    print(f"dispatch: {dispatch['digests']}/{dispatch['users_due']} digests in {dispatch['seconds']}s "
+          f"= {dispatch['digests_per_s']} digests/s, {dispatch['messages_sent']} messages sent")
+    print(f"written {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import random
+
+import pytest
+
+from common.dedup import (
+    FINGERPRINT_BITS, MAX_DISTANCE, SimhashIndex, collapse_near_duplicates, group_near_duplicates, hamming, simhash,
+)
+
+POST = "OpenAI выпустила GPT-5: модель быстрее и дешевле."
+
+
+def test_simhash_fits_bigint():
+    fp = simhash(POST)
+    assert -(1 << 63) <= fp < (1 << 63)
+    assert simhash("") is None
+    assert simhash("https://t.me/ai_news 2024") is None
+
+
+@pytest.mark.parametrize("repost", [
+    POST + "\n\nПодписывайтесь на @ai_news",
+    POST + " Подписывайтесь на @ai_news",
+    POST + "\n@ai_news @ml_digest",
+    POST + "\nhttps://t.me/ai_news",
+    "🔥 " + POST,
+])
+def test_signature_does_not_move_fingerprint(repost):
+    assert hamming(simhash(POST), simhash(repost)) <= MAX_DISTANCE
+
+
+def test_different_news_are_far():
+    other = "Apple представила новый iPhone с собственным модемом и более ёмкой батареей."
+    assert hamming(simhash(POST), simhash(other)) > MAX_DISTANCE
+
+
+def test_signature_only_post_keeps_fingerprint():
+    assert simhash("Подписывайтесь на наш канал!") is not None
+
+
+def test_hamming_masks_sign():
+    assert hamming(-1, 0) == FINGERPRINT_BITS
+    assert hamming(5, 5) == 0
+
+
+def test_index_finds_all_neighbours_within_distance():
+    rng = random.Random(1)
+    index = SimhashIndex()
+    base = rng.getrandbits(FINGERPRINT_BITS)
+    index.add("far", base ^ ((1 << (MAX_DISTANCE + 4)) - 1))
+    for d in range(MAX_DISTANCE + 1):
+        bits = rng.sample(range(FINGERPRINT_BITS), d)
+        index.add(d, base ^ sum(1 << b for b in bits))
+    assert sorted(index.query(base)) == list(range(MAX_DISTANCE + 1))
+
+
+def test_group_near_duplicates():
+    items = [
+        {"text": POST, "text_hash": "a"},
+        {"text": "Apple представила новый iPhone.", "text_hash": "b"},
+        {"text": POST + "\n\nПодписывайтесь на @ai_news", "text_hash": "c"},
+        {"text": "другой текст с тем же хэшем", "text_hash": "a"},
+    ]
+    groups = group_near_duplicates(items)
+    assert [[it["text_hash"] for it in g] for g in groups] == [["a", "c", "a"], ["b"]]
+    assert collapse_near_duplicates(items) == [items[0], items[1]]
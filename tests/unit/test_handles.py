@@ -0,0 +1,52 @@
+import pytest
+
+from common.handles import normalize_handle, parse_handles, parse_import
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("@ai_news", "ai_news"),
+    ("ai_news", "ai_news"),
+    ("https://t.me/ai_news", "ai_news"),
+    ("t.me/s/ai_news", "ai_news"),
+    ("https://t.me/ai_news/123", "ai_news"),
+    ("https://rsshub.app/telegram/channel/ai_news", "ai_news"),
+    ("<@ai_news>", "ai_news"),
+    ("@abc", None),
+    ("@1channel", None),
+    ("", None),
+])
+def test_normalize_handle(raw, expected):
+    assert normalize_handle(raw) == expected
+
+
+def test_normalize_handle_strict():
+    assert normalize_handle("ai_news", strict=True) is None
+    assert normalize_handle("@ai_news", strict=True) == "ai_news"
+
+
+def test_parse_handles_dedups_case_insensitively():
+    handles, invalid = parse_handles("@ai_news, t.me/AI_NEWS; ml_digest  ???")
+    assert handles == ["ai_news", "ml_digest"]
+    assert invalid == ["???"]
+
+
+def test_parse_import_opml():
+    opml = """<?xml version="1.0"?>
+    <opml version="2.0"><body>
+      <outline text="AI" title="AI">
+        <outline text="AI News" xmlUrl="https://rsshub.app/telegram/channel/ai_news"/>
+        <outline text="ml_digest" htmlUrl="https://example.com/blog"/>
+        <outline text="Пост" htmlUrl="https://t.me/ai_news/5"/>
+      </outline>
+    </body></opml>"""
+    assert parse_import(opml) == ["ai_news", "ml_digest"]
+
+
+def test_parse_import_bad_opml():
+    with pytest.raises(ValueError):
+        parse_import("<opml><body>")
+
+
+def test_parse_import_csv():
+    content = "﻿channel,title\n@ai_news,AI News\nhttps://t.me/ml_digest,ML\nplain_name\nJust Title,no handle here\n"
+    assert parse_import(content) == ["ai_news", "ml_digest", "plain_name"]
@@ -0,0 +1,54 @@
+from datetime import datetime, timezone
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("psycopg2")
+
+from common import models  # noqa: E402
+from common.models import INGEST_LOCK_NS, lock_params, message_chunks  # noqa: E402
+
+NOW = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def msg(channel_id, mid, text_value="Новая модель нейросети"):
+    return {'channel_id': channel_id, 'tg_message_id': mid, 'msg_date': NOW, 'link': None, 'text': text_value}
+
+
+def test_message_chunks(monkeypatch):
+    monkeypatch.setattr(models, "ADD_MESSAGES_CHUNK", 2)
+    chunks = list(message_chunks([msg(1, i) for i in range(5)]))
+    assert [size for size, _ in chunks] == [2, 2, 1]
+    params = chunks[0][1]
+    assert params['mid'] == [0, 1]
+    assert len(params['h'][0]) == 64
+    assert params['sh'][0] is not None and 0.0 <= params['rel'][0] <= 1.0
+
+
+def test_lock_params_sorted_unique_channels():
+    # Локи по возрастанию id у всех писателей — иначе две пачки могут взять их крест-накрест
+    params = lock_params([msg(5, 1), msg(2, 1), msg(5, 2), msg(9, 1)])
+    assert params == {'ns': INGEST_LOCK_NS, 'c': [2, 5, 9]}
+
+
+def test_insert_takes_channel_locks_before_inserting():
+    executed = []
+
+    class Session:
+        def execute(self, sql, params):
+            executed.append(sql)
+            return type("Result", (), {"scalar": lambda self: len(params['c'])})()
+
+    result = models._insert_messages(Session(), [msg(1, 1), msg(1, 2)])
+    assert executed[0] is models.LOCK_CHANNELS_SQL
+    assert executed[1:] == [models.INSERT_MESSAGES_SQL]
+    assert result == {'inserted': 2, 'duplicates': 0}
+
+
+def test_claim_params_carry_lease_and_retry_window():
+    params = models.claim_params(NOW, 10)
+    assert params == {
+        'now': NOW, 'n': 10, 'lease': float(models.DIGEST_CLAIM_LEASE), 'retry': float(models.DIGEST_RETRY_WINDOW),
+    }
+    # Аренда короче окна повторов: упавшую отправку успевают забрать снова
+    assert models.DIGEST_CLAIM_LEASE < models.DIGEST_RETRY_WINDOW
@@ -0,0 +1,60 @@
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple, Optional
+
+import numpy as np
+import pytest
+
+from common.ranking import ROW_FEATURES, feature_matrix, rank_users, repost_feature
+
+NOW = datetime(2026, 1, 1, 12, tzinfo=timezone.utc)
+
+
+class Row(NamedTuple):
+    channel_id: int
+    msg_date: datetime
+    text: Optional[str]
+    relevance: Optional[float] = None
+    text_hash: Optional[str] = None
+    simhash: Optional[int] = None
+
+
+def row(channel_id, hours_ago, text_value, relevance=0.8, text_hash=None):
+    return Row(channel_id, NOW - timedelta(hours=hours_ago), text_value, relevance, text_hash or f"{channel_id}:{text_value}")
+
+
+def test_feature_matrix():
+    rows = [row(1, 0, "a" * 2000, 0.9), row(1, 6, "", None)]
+    m = feature_matrix(rows, NOW)
+    assert m.shape == (2, len(ROW_FEATURES))
+    assert m[0].tolist() == pytest.approx([1.0, 0.9, 1.0])
+    assert m[1].tolist() == pytest.approx([0.5, 0.5, 0.0])
+
+
+def test_repost_feature_counts_distinct_channels_per_user():
+    users = np.array([1, 1, 1, 2])
+    groups = np.array([0, 0, 0, 0])
+    channels = np.array([10, 11, 11, 10])
+    assert repost_feature(users, groups, channels).tolist() == [1.0, 1.0, 1.0, 0.0]
+
+
+def test_rank_users_keeps_one_post_per_news_and_orders_by_score():
+    news = "OpenAI выпустила GPT-5: модель быстрее и дешевле."
+    fresh, repost = row(1, 0, news), row(2, 1, news + "\n\nПодписывайтесь на @ai_news")
+    old = row(3, 24, "Apple представила новый iPhone с собственным модемом.")
+    ranked = rank_users({7: [old, repost, fresh]}, NOW)
+    assert ranked[7] == [fresh, old]
+
+
+def test_rank_users_top_k_and_empty_users():
+    rows = [row(1, h, f"новость номер {h} про разное {'x' * h}") for h in range(5)]
+    ranked = rank_users({1: rows, 2: []}, NOW, k=2)
+    assert len(ranked[1]) == 2
+    assert ranked[2] == []
+
+
+def test_rank_users_does_not_depend_on_batch():
+    shared = [row(1, 0, "OpenAI выпустила GPT-5."), row(2, 2, "Nvidia показала новый GPU для обучения моделей.")]
+    other = [row(3, 0, "OpenAI выпустила GPT-5."), row(4, 0, "Вышла новая версия Python 3.13.")]
+    alone = rank_users({1: shared}, NOW)[1]
+    batched = rank_users({1: shared, 2: shared[1:] + other}, NOW)[1]
+    assert alone == batched
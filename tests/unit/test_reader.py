@@ -0,0 +1,98 @@
+import asyncio
+import importlib
+import os
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("pyrogram")
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("pytz")
+
+# Модуль создаёт клиент при импорте; сеть он не трогает до start()
+os.environ.setdefault("TELEGRAM_API_ID", "1")
+os.environ.setdefault("TELEGRAM_API_HASH", "0" * 32)
+reader = importlib.import_module("reader.main")
+
+
+class Channel:
+    """get_messages по ID: сообщения 1..head, кроме deleted"""
+
+    def __init__(self, head, deleted=()):
+        self.head = head
+        self.deleted = set(deleted)
+        self.calls = 0
+
+    async def get_messages_batch(self, chat_id, ids):
+        self.calls += 1
+        return [
+            SimpleNamespace(id=i, empty=False, text=f"post {i}", date=reader.datetime.now(reader.TZ))
+            if i <= self.head and i not in self.deleted else SimpleNamespace(id=i, empty=True, text=None)
+            for i in ids
+        ]
+
+
+@pytest.fixture
+def channel(monkeypatch):
+    def make(head, deleted=(), batch=10, pages=3):
+        ch = Channel(head, deleted)
+
+        async def resolve_chat_id(handle):
+            return 100
+
+        monkeypatch.setattr(reader, "resolve_chat_id", resolve_chat_id)
+        monkeypatch.setattr(reader, "get_messages_batch", ch.get_messages_batch)
+        monkeypatch.setattr(reader, "FETCH_BATCH", batch)
+        monkeypatch.setattr(reader, "MAX_PAGES_PER_CYCLE", pages)
+        return ch
+    return make
+
+
+def fetch(last_msg_id, **extra):
+    return asyncio.run(reader.fetch_channel_messages({'id': 1, 'handle': '@ai_news', 'last_msg_id': last_msg_id, **extra}))
+
+
+def test_head_probe_ids_geometric_grid():
+    ids = reader.head_probe_ids(1, reader.HEAD_PROBE_MAX_ID)
+    assert len(ids) <= reader.FETCH_BATCH
+    assert ids[0] == 1 and ids[-1] == reader.HEAD_PROBE_MAX_ID
+    assert reader.head_probe_ids(5, 9) == [5, 6, 7, 8, 9]
+
+
+def test_fetch_reaches_head(channel):
+    channel(head=25)
+    messages, last_seen_id, complete = fetch(20)
+    assert [m['tg_message_id'] for m in messages] == [21, 22, 23, 24, 25]
+    assert last_seen_id == 25 and complete
+
+
+def test_fetch_stops_at_page_limit_incomplete(channel):
+    channel(head=100, pages=2)
+    messages, last_seen_id, complete = fetch(10)
+    assert last_seen_id == 30 and len(messages) == 20
+    assert not complete
+
+
+def test_fetch_skips_deleted_run(channel):
+    # Пустая страница посреди канала: probe_head находит сообщения дальше
+    channel(head=300, deleted=range(11, 251), batch=200, pages=5)
+    messages, last_seen_id, complete = fetch(10, known_head=0, gap_probed_at=0)
+    assert last_seen_id == 300 and complete
+    assert [m['tg_message_id'] for m in messages] == list(range(251, 301))
+
+
+def test_new_channel_starts_near_head(channel, monkeypatch):
+    monkeypatch.setattr(reader, "NEW_CHANNEL_BACKFILL", 5)
+    channel(head=1000, batch=200)
+    messages, last_seen_id, complete = fetch(0)
+    assert [m['tg_message_id'] for m in messages] == list(range(996, 1001))
+    assert complete
+
+
+def test_inaccessible_channel_raises(monkeypatch):
+    async def resolve_chat_id(handle):
+        return None
+
+    monkeypatch.setattr(reader, "resolve_chat_id", resolve_chat_id)
+    with pytest.raises(RuntimeError):
+        fetch(10)
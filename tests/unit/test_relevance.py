@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from common.relevance import (
+    CHECK_POSTS, NEUTRAL, RELEVANCE_THRESHOLD, RelevanceModel, check, featurize, relevance_scores, train,
+)
+
+
+@pytest.fixture
+def model():
+    return RelevanceModel.from_lexicon()
+
+
+def test_check_posts(model):
+    scores = model.score([t for t, _ in CHECK_POSTS])
+    for (text_value, expected), score in zip(CHECK_POSTS, scores):
+        assert (score >= RELEVANCE_THRESHOLD) == expected, (text_value, score)
+    assert check(model) == []
+
+
+@pytest.mark.parametrize("text_value", [
+    "Apple представила новый iPhone с собственным модемом и более ёмкой батареей.",
+    "Microsoft купила стартап, который делает инструменты для разработчиков.",
+    "Вышла новая версия Python 3.13: интерпретатор стал быстрее, добавлен экспериментальный JIT.",
+])
+def test_generic_tech_news_passes(model, text_value):
+    assert model.score([text_value])[0] >= RELEVANCE_THRESHOLD
+
+
+def test_post_without_signals_is_neutral(model):
+    # Фильтр не трогает то, о чём словари молчат
+    assert model.score(["Компания рассказала о планах на следующий год."])[0] == pytest.approx(NEUTRAL)
+
+
+def test_long_post_is_not_diluted(model):
+    # Повтор тех же слов не меняет бинарные признаки: оценка не зависит от длины
+    mention = "Среди партнёров упомянули OpenAI. "
+    filler = "Компания рассказала о планах на следующий год и поделилась подробностями с журналистами. "
+    short, long = filler + mention, filler * 10 + mention + filler * 10
+    assert len(long.split()) > 180
+    short_score, long_score = model.score([short, long])
+    assert long_score == pytest.approx(short_score)
+    assert long_score >= RELEVANCE_THRESHOLD
+
+
+def test_ads_and_offtopic_are_filtered(model):
+    scores = model.score([
+        "Скидки до 70% и розыгрыш призов! Переходи по ссылке и регистрируйся.",
+        "Завтра в городе ожидается солнечная погода, вечером начнётся футбольный матч.",
+    ])
+    assert (scores < RELEVANCE_THRESHOLD).all()
+
+
+def test_featurize_counts_each_token_once():
+    features = featurize(["нейросеть нейросеть нейросеть", None])
+    assert features.n == 2
+    assert np.bincount(features.rows, weights=features.vals, minlength=2).tolist() == [1.0, 0.0]
+
+
+def test_relevance_scores_handles_empty_text():
+    scores = relevance_scores([None, ""])
+    assert len(scores) == 2
+    assert all(0.0 <= s <= 1.0 for s in scores)
+
+
+def test_train_separates_labels():
+    texts = ["новая модель нейросети"] * 5 + ["розыгрыш призов скидки"] * 5
+    labels = np.array([1] * 5 + [0] * 5)
+    trained = train(texts, labels)
+    pos, neg = trained.score(["новая модель нейросети", "розыгрыш призов скидки"])
+    assert pos > neg
@@ -0,0 +1,84 @@
+import asyncio
+import time
+
+import pytest
+
+from common.ratelimit import RateLimiter
+from common.send_queue import SEND_MAX_FLOOD_RETRIES, SendQueue
+from common.tgclient import FloodWait
+
+FLOOD = 0.05
+
+
+class FloodingClient:
+    """send_message: первые floods вызовов — FloodWait, дальше успех"""
+
+    def __init__(self, floods: int = 0):
+        self.floods = floods
+        self.calls = []
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.calls.append((chat_id, text, time.monotonic()))
+        if len(self.calls) <= self.floods:
+            raise FloodWait(value=FLOOD)
+        self.sent.append((chat_id, text))
+        return text
+
+
+def make_queue(client, **kwargs):
+    return SendQueue(client, limiter=RateLimiter({"send": (1000.0, 1000.0)}), chat_interval=0.0, **kwargs)
+
+
+def test_flood_wait_pauses_and_retries():
+    client = FloodingClient(floods=1)
+    queue = make_queue(client, workers=2)
+
+    async def run():
+        return await queue.send(1, "hello")
+
+    assert asyncio.run(run()) == "hello"
+    assert len(client.calls) == 2
+    assert client.calls[1][2] - client.calls[0][2] >= FLOOD * 0.9
+    assert queue.flood_wait_total == pytest.approx(FLOOD)
+
+
+def test_final_flood_wait_is_recorded_before_raising():
+    client = FloodingClient(floods=SEND_MAX_FLOOD_RETRIES + 1)
+    queue = make_queue(client, workers=1)
+
+    async def run():
+        with pytest.raises(FloodWait):
+            await queue.send(1, "hello")
+        return time.monotonic()
+
+    failed_at = asyncio.run(run())
+    assert len(client.calls) == SEND_MAX_FLOOD_RETRIES + 1
+    assert queue.flood_wait_total == pytest.approx(FLOOD * (SEND_MAX_FLOOD_RETRIES + 1))
+    # Следующее сообщение подождёт паузу после последнего FloodWait
+    assert queue.paused_until > failed_at
+    assert queue.limiter.paused_until["send"] > failed_at
+
+
+def test_messages_of_one_chat_keep_order_and_state_is_swept():
+    client = FloodingClient()
+    queue = make_queue(client, workers=4)
+
+    async def run():
+        await asyncio.gather(*(queue.send(chat, f"{chat}:{i}") for i in range(5) for chat in (1, 2)))
+        assert not queue.chat_pending
+        queue._sweep()
+
+    asyncio.run(run())
+    for chat in (1, 2):
+        assert [t for c, t in client.sent if c == chat] == [f"{chat}:{i}" for i in range(5)]
+    assert not queue.chat_next_at
+    assert not queue.chat_locks
+
+
+def test_sweep_keeps_chats_with_pending_sends():
+    queue = make_queue(FloodingClient())
+    queue.chat_next_at = {1: 0.0, 2: 0.0}
+    queue.chat_pending[1] = 1
+    queue._sweep()
+    assert list(queue.chat_next_at) == [1]
@@ -0,0 +1,65 @@
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("asyncpg")
+
+from common import models_async, summary_worker  # noqa: E402
+
+NOW = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def test_claim_unsummarized_keeps_newest_text_per_hash(monkeypatch):
+    rows = [
+        SimpleNamespace(text_hash="a", text="старый", msg_date=NOW - timedelta(hours=2)),
+        SimpleNamespace(text_hash="b", text="другой", msg_date=NOW - timedelta(hours=1)),
+        SimpleNamespace(text_hash="a", text="новый", msg_date=NOW),
+    ]
+    calls = []
+
+    class Session:
+        async def execute(self, sql, params):
+            calls.append((sql, params))
+            return rows
+
+    @asynccontextmanager
+    async def scope():
+        yield Session()
+
+    monkeypatch.setattr(models_async, "async_session_scope", scope)
+    claimed = asyncio.run(models_async.claim_unsummarized(10))
+    assert claimed == [("a", "новый"), ("b", "другой")]
+    sql, params = calls[0]
+    assert sql is models_async.CLAIM_UNSUMMARIZED_SQL
+    assert params['max_attempts'] == models_async.SUMMARY_MAX_ATTEMPTS
+    assert params['lease'] == float(models_async.SUMMARY_CLAIM_LEASE)
+
+
+def test_summarize_pending_stores_only_successful_summaries(monkeypatch):
+    stored = {}
+
+    async def claim(limit):
+        return [("known", "t0"), ("ok", "t1"), ("off", "t2"), ("fail", "t3")]
+
+    async def copy_known(hashes):
+        return {"known"}
+
+    async def store(summaries):
+        stored.update(summaries)
+
+    async def summarize(text_value):
+        return {"t1": "кратко", "t2": "", "t3": None}[text_value]
+
+    monkeypatch.setattr(summary_worker, "claim_unsummarized", claim)
+    monkeypatch.setattr(summary_worker, "copy_known_summaries", copy_known)
+    monkeypatch.setattr(summary_worker, "store_summaries", store)
+    monkeypatch.setattr(summary_worker, "summarize_message", summarize)
+
+    done = asyncio.run(summary_worker.summarize_pending(asyncio.Semaphore(2)))
+    # None не сохраняется: текст вернётся после аренды, пока не кончатся попытки
+    assert stored == {"ok": "кратко", "off": ""}
+    assert done == 3
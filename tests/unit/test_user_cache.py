@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("asyncpg")
+
+from common import user_cache  # noqa: E402
+from common.user_cache import UserCache  # noqa: E402
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    calls = []
+
+    async def get_user_by_tg(tg_id):
+        calls.append(("user", tg_id))
+        return {"tg_id": tg_id}
+
+    async def list_user_channels(tg_id):
+        calls.append(("channels", tg_id))
+        return ["@ai_news"]
+
+    monkeypatch.setattr(user_cache, "get_user_by_tg", get_user_by_tg)
+    monkeypatch.setattr(user_cache, "list_user_channels", list_user_channels)
+    return calls
+
+
+def test_bypass_until_listening(loads):
+    cache = UserCache()
+
+    async def run():
+        await cache.get_user(1)
+        await cache.get_user(1)
+
+    asyncio.run(run())
+    assert loads == [("user", 1), ("user", 1)]
+
+
+def test_hit_after_load_and_invalidate_by_notify(loads):
+    cache = UserCache()
+    cache.listening = True
+
+    async def run():
+        await cache.get_user(1)
+        await cache.list_channels(1)
+        await cache.get_user(1)
+        await cache.list_channels(1)
+        cache._on_notify(None, 0, user_cache.CACHE_CHANNEL, "subs:1")
+        await cache.get_user(1)
+        await cache.list_channels(1)
+        cache._on_notify(None, 0, user_cache.CACHE_CHANNEL, "user:1")
+        await cache.get_user(1)
+        await cache.list_channels(1)
+
+    asyncio.run(run())
+    assert loads == [("user", 1), ("channels", 1), ("channels", 1), ("user", 1), ("channels", 1)]
+
+
+def test_bad_notify_payload_is_ignored(loads):
+    cache = UserCache()
+    cache.listening = True
+    cache._on_notify(None, 0, user_cache.CACHE_CHANNEL, "user:abc")
+    assert cache._generation == 0
+
+
+def test_load_racing_with_invalidation_is_not_cached(monkeypatch):
+    cache = UserCache()
+    cache.listening = True
+    calls = []
+
+    async def get_user_by_tg(tg_id):
+        calls.append(tg_id)
+        if len(calls) == 1:
+            # Уведомление пришло, пока читалась старая строка
+            cache.invalidate(tg_id)
+        return {"tg_id": tg_id, "version": len(calls)}
+
+    monkeypatch.setattr(user_cache, "get_user_by_tg", get_user_by_tg)
+
+    async def run():
+        first = await cache.get_user(1)
+        second = await cache.get_user(1)
+        third = await cache.get_user(1)
+        return first, second, third
+
+    first, second, third = asyncio.run(run())
+    assert first["version"] == 1
+    assert second["version"] == third["version"] == 2
+    assert calls == [1, 1]